@@ -21,10 +21,13 @@ cd $MY_PATH/..
 rm -f /usr/share/libalpm/hooks/05-yabsnap-pacman-pre.hook
 
 systemctl disable yabsnap.timer || true
+systemctl disable yabsnap-drain.path || true
 systemctl daemon-reload
 
 rm -f /usr/lib/systemd/system/yabsnap.service
 rm -f /usr/lib/systemd/system/yabsnap.timer
+rm -f /usr/lib/systemd/system/yabsnap-drain.service
+rm -f /usr/lib/systemd/system/yabsnap-drain.path
 
 rm -f /usr/share/libalpm/hooks/01-yabsnap-pacman-pre.hook
 
@@ -24,6 +24,14 @@ def _parse_subvol_map(map_str: str) -> dict[str, str]:
     return mapping
 
 
+def _parse_command_timeout(value: str) -> tuple[str, float]:
+    """Helper to parse the --command-timeout argument, e.g. "create=60"."""
+    kind, sep, secs = value.partition("=")
+    if not sep:
+        raise ValueError(f"Invalid command timeout (missing '='): {value}")
+    return kind, float(secs)
+
+
 def make_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="yabsnap")
     parser.add_argument(
@@ -31,6 +39,48 @@ def make_parser() -> argparse.ArgumentParser:
         help="Wait for filesystem to sync after deleting snapshots.",
         action="store_true",
     )
+    parser.add_argument(
+        "--sync-timeout",
+        type=float,
+        help="Maximum seconds to wait with --sync (default: 600).",
+    )
+    parser.add_argument(
+        "--command-timeout",
+        type=_parse_command_timeout,
+        action="append",
+        metavar="KIND=SECS",
+        help="Kill commands of a kind (probe, create, delete or hook) after SECS "
+        "seconds; 0 for no limit. May be repeated. Syncs are limited by "
+        "--sync-timeout.",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Maximum seconds for all commands run; commands still running are "
+        "killed, and the operation fails.",
+    )
+    parser.add_argument(
+        "--max-deletions-per-interval",
+        type=int,
+        help="Override the config: delete at most this many btrfs snapshots per "
+        "deletion interval. Use 0 for no limit.",
+    )
+    parser.add_argument(
+        "--deletion-interval",
+        type=float,
+        help="Override the config: seconds in each deletion interval.",
+    )
+    parser.add_argument(
+        "--wait-for-cleaner",
+        action=argparse.BooleanOptionalAction,
+        help="Override the config: wait for deleted snapshots to be cleaned up "
+        "before deleting more.",
+    )
+    parser.add_argument(
+        "--bwlimit",
+        help="Override the config: bandwidth limit for rsync, e.g. 20M. "
+        "Use 0 for no limit.",
+    )
     parser.add_argument("--config-file", help="Path to the config file to use.")
     parser.add_argument(
         "--source", help="Only use config with matching `source` value."
@@ -41,6 +91,12 @@ def make_parser() -> argparse.ArgumentParser:
         action="store_true",
     )
     parser.add_argument("--verbose", help="Set log level to INFO.", action="store_true")
+    parser.add_argument(
+        "--io-threads",
+        type=int,
+        help="Maximum threads for reading snapshot metadata (default: 8). "
+        "Use 1 to read serially.",
+    )
 
     # title - Shows as [title]: before commands are listed.
     # metavar - The string is printed below the title. If None, all commands including hidden ones are printed.
@@ -58,11 +114,21 @@ def make_parser() -> argparse.ArgumentParser:
     )
 
     # User commands.
-    subparsers.add_parser("list", help="List all managed snapshots." + source_message)
-    subparsers.add_parser(
-        "list-json",
-        help="List all managed snapshots in JSON Lines format." + source_message,
-    )
+    list_parsers = [
+        subparsers.add_parser(
+            "list", help="List all managed snapshots." + source_message
+        ),
+        subparsers.add_parser(
+            "list-json",
+            help="List all managed snapshots in JSON Lines format." + source_message,
+        ),
+    ]
+    for list_parser in list_parsers:
+        list_parser.add_argument(
+            "--package",
+            help="Only list the pre-install snapshots taken before this package was "
+            "installed, upgraded or removed.",
+        )
 
     # Creates an user snapshot.
     create = subparsers.add_parser(
@@ -165,7 +231,23 @@ def make_parser() -> argparse.ArgumentParser:
     # Internal commands used in scheduling and pacman hook.
     # Not having a help= makes them unlisted in --help.
     subparsers.add_parser("internal-cronrun")
-    subparsers.add_parser("internal-preupdate")
+    internal_preupdate = subparsers.add_parser("internal-preupdate")
+    internal_preupdate.add_argument(
+        "--defer-cleanup",
+        action="store_true",
+        help="Only create snapshots; delete old ones and run post hooks in the "
+        "background.",
+    )
+    subparsers.add_parser("internal-drain")
+    internal_cleanup = subparsers.add_parser("internal-cleanup")
+    internal_cleanup.add_argument("config_files", nargs="*")
+    internal_schedule = subparsers.add_parser("internal-schedule")
+    internal_schedule.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep running, and do scheduled runs when due, instead of programming a "
+        "timer.",
+    )
 
     # TUI command.
     tui_parser = subparsers.add_parser(
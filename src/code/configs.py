@@ -15,17 +15,24 @@
 import configparser
 import dataclasses
 import datetime
+import enum
+import json
 import logging
 import os
 import pathlib
 import shlex
-from collections.abc import Iterable, Iterator
+from collections.abc import Iterator
 
+from . import global_flags
+from .mechanisms import abstract_mechanism
 from .mechanisms import snap_mechanisms
 from .mechanisms import snap_type_enum
+from .utils import dataclass_loader
 from .utils import human_interval
 from .utils import os_utils
 
+from typing import Any
+
 # Shortens the scheduled times by this amount. This ensures that sheduled backup
 # happens, even if previous backup didn't expire by this much time.
 #
@@ -40,6 +47,15 @@ USER_CONFIG_FILE: str | None = None
 # Where config files are stored.
 _CONFIG_PATH = pathlib.Path("/etc/yabsnap/configs")
 
+# Cache of the parsed config files in _CONFIG_PATH.
+_REGISTRY_FILE = "configs.json"
+# Increase if the format or Config changes; older registries will be rebuilt.
+_REGISTRY_VERSION = 7
+
+
+def _override[T](value: T, flag: T | None) -> T:
+    return value if flag is None else flag
+
 
 @dataclasses.dataclass
 class Config:
@@ -47,6 +63,9 @@ class Config:
 
     source: str
     dest_prefix: str
+    # Append milliseconds to new snapshot names, so that snapshots can be created
+    # without reserving a wall-clock second; see utils/snap_names.py.
+    subsecond_names: bool = False
     # Only snapshots older than this will be deleted.
     min_keep_secs: int = 30 * 60
     # How many user backups to keep.
@@ -55,9 +74,8 @@ class Config:
     keep_preinstall: int = 1
     # How much time must have passed since last pacman install.
     preinstall_interval: float = 5 * 60.0
-    # After how much time this backup will be triggered. Currently, the system
-    # timer runs with a frequency of 60 minutes. Hence only multiples of 60
-    # minutes should be used.
+    # After how much time this backup will be triggered. The system timer runs every
+    # 60 minutes, and additionally when a config is next due; see wakeup.py.
     trigger_interval: float = 60 * 60.0
     # Enables TTL based scheduled snapshot management.
     enable_scheduled_ttl: bool = True
@@ -73,6 +91,34 @@ class Config:
     # If empty, btrfs is assumed.
     snap_type: snap_type_enum.SnapType = snap_type_enum.SnapType.BTRFS
 
+    # How btrfs snapshots are created and deleted; see abstract_mechanism.
+    btrfs_engine: str = "cli"
+
+    # Queue expired snapshots to be deleted in the background; see deletion_queue.
+    defer_deletion: bool = False
+
+    # Throttles deletion of btrfs snapshots; see abstract_mechanism.MechanismOptions.
+    max_deletions_per_interval: int = 0
+    deletion_interval: float = 60.0
+    wait_for_cleaner: bool = False
+
+    # Priority and cgroup limits for commands that create or delete snapshots; see
+    # os_utils.ProcessLimits.
+    nice: int = 0
+    ionice_class: str = ""
+    io_weight: int = 0
+    io_max: str = ""
+    memory_high: str = ""
+    # Passed to rsync as --bwlimit, if set.
+    rsync_bwlimit: str = ""
+
+    # Postpones rsync snapshots and scheduled deletions while the IO or CPU pressure,
+    # in percent, exceeds these. 0 disables the check. See utils/pressure.py.
+    max_io_pressure: float = 0.0
+    max_cpu_pressure: float = 0.0
+    # Work overdue by more than this is done regardless of the pressure.
+    pressure_grace_period: float = 6 * 60 * 60.0
+
     def is_schedule_enabled(self) -> bool:
         return (
             self.keep_hourly > 0
@@ -92,6 +138,7 @@ class Config:
             source=section["source"],
             dest_prefix=section["dest_prefix"],
         )
+        field_types = {x.name: x.type for x in dataclasses.fields(cls)}
         for key, value in section.items():
             if key == "post_transaction_scripts":
                 result.post_transaction_scripts = shlex.split(value)
@@ -103,17 +150,27 @@ class Config:
                 continue
             if not hasattr(result, key):
                 logging.warning(f"Invalid field {key=} found in {config_file=}")
-            if key == "enable_scheduled_ttl":
-                # Boolean.
+            if field_types.get(key) is bool:
                 if value.lower() not in ("true", "false"):
                     raise ValueError(
                         f"Invalid boolean value for {key} in {config_file=}"
                     )
                 setattr(result, key, value.lower().strip() == "true")
-            elif key.endswith("_interval"):
+            elif (
+                key.endswith(("_interval", "_period"))
+                and field_types.get(key) is not int
+            ):
                 setattr(result, key, human_interval.parse_to_secs(value))
-            elif key not in {"source", "dest_prefix"}:
+            elif field_types.get(key) is str:
+                setattr(result, key, value)
+            elif field_types.get(key) is float:
+                setattr(result, key, float(value))
+            else:
                 setattr(result, key, int(value))
+        try:
+            _ = result.mechanism_options
+        except ValueError as exc:
+            raise ValueError(f"{exc} in {config_file=}") from exc
         return result
 
     @property
@@ -126,6 +183,29 @@ class Config:
             (datetime.timedelta(days=365.24) - DURATION_BUFFER, self.keep_yearly),
         ]
 
+    @property
+    def mechanism_options(self) -> abstract_mechanism.MechanismOptions:
+        """Options for the mechanism, with any overrides from the command line."""
+        flags = global_flags.FLAGS
+        return abstract_mechanism.MechanismOptions(
+            btrfs_engine=self.btrfs_engine,
+            max_deletions_per_interval=_override(
+                self.max_deletions_per_interval, flags.max_deletions_per_interval
+            ),
+            deletion_interval=_override(
+                self.deletion_interval, flags.deletion_interval
+            ),
+            wait_for_cleaner=_override(self.wait_for_cleaner, flags.wait_for_cleaner),
+            process_limits=os_utils.ProcessLimits(
+                nice=self.nice,
+                ionice_class=self.ionice_class,
+                io_weight=self.io_weight,
+                io_max=self.io_max,
+                memory_high=self.memory_high,
+            ),
+            rsync_bwlimit=_override(self.rsync_bwlimit, flags.rsync_bwlimit),
+        )
+
     @property
     def mount_path(self) -> str:
         return os.path.dirname(self.dest_prefix)
@@ -135,19 +215,135 @@ class Config:
             os_utils.run_user_script(script, [self.config_file])
 
     def is_compatible_volume(self) -> bool:
-        return snap_mechanisms.get(self.snap_type).verify_volume(self.source)
+        return snap_mechanisms.get(
+            self.snap_type, self.mechanism_options
+        ).verify_volume(self.source)
+
+
+@dataclasses.dataclass
+class _Registry:
+    """All configs, parsed from the config files."""
+
+    # Identifies the state of the config files, as (name, st_mtime_ns, st_size) of the
+    # config directory (with name "") and of each config file.
+    key: list[tuple[str, int, int]]
+    configs: list[Config]
+    # Files skipped since they do not specify source or dest_prefix.
+    invalid_files: list[str]
+    # Source -> indices in configs.
+    sources: dict[str, list[int]]
+    # If any config has a schedule.
+    schedule_enabled: bool
+
+
+# The registry for this process, if already loaded.
+_registry: _Registry | None = None
+
+
+def _compile_registry(
+    config_files: list[str], key: list[tuple[str, int, int]]
+) -> _Registry:
+    registry = _Registry(
+        key=key, configs=[], invalid_files=[], sources={}, schedule_enabled=False
+    )
+    for fname in config_files:
+        logging.info(f"Reading config {fname}")
+        config = Config.from_configfile(fname)
+        if not (config.source and config.dest_prefix):
+            registry.invalid_files.append(fname)
+            continue
+        registry.sources.setdefault(config.source, []).append(len(registry.configs))
+        registry.configs.append(config)
+        registry.schedule_enabled |= config.is_schedule_enabled()
+    return registry
+
+
+def _registry_key() -> list[tuple[str, int, int]]:
+    st = _CONFIG_PATH.stat()
+    key = [("", st.st_mtime_ns, st.st_size)]
+    with os.scandir(_CONFIG_PATH) as it:
+        for entry in it:
+            if entry.name.endswith(".conf") and entry.is_file():
+                st = entry.stat()
+                key.append((entry.name, st.st_mtime_ns, st.st_size))
+    key.sort()
+    return key
+
+
+def _read_registry(key: list[tuple[str, int, int]]) -> _Registry | None:
+    """Returns the cached registry, if it is valid for key."""
+    fname = os.path.join(os_utils.RUNTIME_DIR, _REGISTRY_FILE)
+    try:
+        with open(fname) as f:
+            data = json.load(f)
+        if data.pop("version") != _REGISTRY_VERSION:
+            return None
+        registry = dataclass_loader.load_dataclass(_Registry, data)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        logging.info(f"Ignoring config cache {fname}: {exc!r}")
+        return None
+    if registry.key != key:
+        return None
+    return registry
+
+
+def _write_registry(registry: _Registry) -> None:
+    def as_json(obj: Any) -> Any:
+        if isinstance(obj, enum.Enum):
+            return obj.name
+        raise TypeError(f"Cannot serialize {obj!r}")
+
+    fname = os.path.join(os_utils.RUNTIME_DIR, _REGISTRY_FILE)
+    try:
+        os.makedirs(os_utils.RUNTIME_DIR, exist_ok=True)
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+        # Readable only by root, like the config directory usually is.
+        with open(
+            os.open(tmp_fname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w"
+        ) as f:
+            json.dump(
+                {"version": _REGISTRY_VERSION} | dataclasses.asdict(registry),
+                f,
+                default=as_json,
+            )
+        os.replace(tmp_fname, fname)
+    except OSError as exc:
+        # E.g. not running as root.
+        logging.info(f"Could not write config cache {fname}: {exc}")
+
+
+def _get_registry() -> _Registry:
+    """Returns the registry of configs in _CONFIG_PATH.
+
+    Config files are parsed only if they changed since the registry was cached.
+    """
+    global _registry
+    key = _registry_key()
+    if _registry is not None and _registry.key == key:
+        return _registry
+    _registry = _read_registry(key)
+    if _registry is None:
+        _registry = _compile_registry(
+            [str(_CONFIG_PATH / name) for name, _, _ in key if name], key
+        )
+        _write_registry(_registry)
+    else:
+        logging.info("Using cached configs")
+    return _registry
 
 
 def iterate_configs(source: str | None) -> Iterator[Config]:
-    config_iterator: Iterable[str]
-    # Try to add the user-specified configuration file to the `config_iterator`
-    # or try to add the configuration file from the `_CONFIG_PATH` to the `config_iterator`.
+    registry: _Registry
+    # Use the user-specified configuration file, or the configuration files in the
+    # `_CONFIG_PATH`.
     if USER_CONFIG_FILE is not None:
         if not os.path.isfile(USER_CONFIG_FILE):
             logging.warning(f"Could not find specified config file: {USER_CONFIG_FILE}")
             return
-        config_iterator = [USER_CONFIG_FILE]
         logging.info(f"Using user-supplied config {USER_CONFIG_FILE}")
+        registry = _compile_registry([USER_CONFIG_FILE], key=[])
     else:
         if not _CONFIG_PATH.is_dir():
             os_utils.eprint(
@@ -158,29 +354,21 @@ def iterate_configs(source: str | None) -> Iterator[Config]:
         if not os.access(_CONFIG_PATH, os.R_OK):
             logging.error(f"Cannot accesss '{_CONFIG_PATH}'; run as root?")
             return
-        config_iterator = (
-            str(path)
-            for path in _CONFIG_PATH.iterdir()
-            if path.is_file() and path.suffix == ".conf"
-        )
+        registry = _get_registry()
 
-    # Check whether the necessary fields in the configuration file are filled in
-    # and append the configurations with filled necessary fields to `config_iterator`
-    configs_found = False
-    for fname in config_iterator:
-        logging.info(f"Reading config {fname}")
-        config = Config.from_configfile(fname)
-        if not (config.source and config.dest_prefix):
-            os_utils.eprint(
-                f"WARNING: Skipping invalid configuration {fname}"
-                " (please specify source and dest_prefix)"
-            )
-            continue
-        if not source or config.source == source:
-            configs_found = True
-            yield config
+    for fname in registry.invalid_files:
+        os_utils.eprint(
+            f"WARNING: Skipping invalid configuration {fname}"
+            " (please specify source and dest_prefix)"
+        )
 
-    if source is not None and not configs_found:
+    if not source:
+        yield from registry.configs
+        return
+    indices = registry.sources.get(source, [])
+    for index in indices:
+        yield registry.configs[index]
+    if not indices:
         logging.warning(f"No config file found with source={source}")
 
 
@@ -189,10 +377,12 @@ def is_schedule_enabled() -> bool:
         # User-specified config indicates advanced usage, with possibly self
         # managed automation. Do not check for schedule if it is present.
         return True
-    for config in iterate_configs(None):
-        if config.is_schedule_enabled():
-            logging.info("Schedule is enabled.")
-            return True
+    if not _CONFIG_PATH.is_dir() or not os.access(_CONFIG_PATH, os.R_OK):
+        logging.info("Schedule is not enabled.")
+        return False
+    if _get_registry().schedule_enabled:
+        logging.info("Schedule is enabled.")
+        return True
     logging.info("Schedule is not enabled.")
     return False
 
@@ -13,11 +13,13 @@
 # limitations under the License.
 
 import os
+import pathlib
 import tempfile
 import unittest
 from unittest import mock
 
 from . import configs
+from .mechanisms import snap_type_enum
 
 # For testing, we can access private methods.
 # pyright: reportPrivateUsage=false
@@ -51,6 +53,39 @@ class ConfigsTest(unittest.TestCase):
                 ["script1.sh", "/my directory/script2.sh"],
             )
 
+    def test_btrfs_engine(self):
+        with tempfile.TemporaryDirectory() as dir:
+            config_file = os.path.join(dir, "test.conf")
+
+            def read_with_engine(engine: str) -> configs.Config:
+                with open(config_file, "w") as f:
+                    f.write(
+                        "[DEFAULT]\nsource = /\ndest_prefix = /.snapshots/@root-\n"
+                        f"btrfs_engine = {engine}\n"
+                    )
+                return configs.Config.from_configfile(config_file)
+
+            config = read_with_engine("ioctl")
+            self.assertEqual(config.mechanism_options.btrfs_engine, "ioctl")
+            with self.assertRaises(ValueError):
+                read_with_engine("fast")
+
+    def test_mechanism_options_override(self):
+        config = configs.Config(
+            config_file="config_file",
+            source="/",
+            dest_prefix="/.snapshots/@root-",
+            max_deletions_per_interval=5,
+            wait_for_cleaner=True,
+        )
+        with mock.patch.object(
+            configs.global_flags.FLAGS, "max_deletions_per_interval", 2
+        ):
+            options = config.mechanism_options
+        self.assertEqual(options.max_deletions_per_interval, 2)
+        self.assertEqual(options.deletion_interval, 60.0)
+        self.assertTrue(options.wait_for_cleaner)
+
     def test_create_config(self):
         with tempfile.NamedTemporaryFile(prefix="yabsnap_config_test_") as file:
             # Don't need the file; in fact if it exists we cannot create it.
@@ -67,5 +102,65 @@ class ConfigsTest(unittest.TestCase):
             self.assertEqual(read_config.config_file, file.name)
 
 
+class ConfigRegistryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        config_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(config_dir.cleanup)
+        runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(runtime_dir.cleanup)
+        self._config_dir = config_dir.name
+        for patcher in [
+            mock.patch.object(configs, "_CONFIG_PATH", pathlib.Path(config_dir.name)),
+            mock.patch.object(configs.os_utils, "RUNTIME_DIR", runtime_dir.name),
+            mock.patch.object(configs, "_registry", None),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write_config(self, name: str, source: str, keep_daily: int = 0) -> None:
+        with open(os.path.join(self._config_dir, name), "w") as f:
+            f.write(
+                "\n".join(
+                    [
+                        "[DEFAULT]",
+                        f"source = {source}",
+                        f"dest_prefix = /.snapshots/@{source.strip('/')}-",
+                        f"keep_daily = {keep_daily}",
+                        "snap_type = RSYNC",
+                    ]
+                )
+            )
+
+    def test_iterate_and_cache(self):
+        self._write_config("home.conf", "/home")
+        self._write_config("root.conf", "/")
+        self._write_config("ignored.txt", "/var")
+
+        self.assertEqual(
+            [x.source for x in configs.iterate_configs(source=None)], ["/home", "/"]
+        )
+        self.assertFalse(configs.is_schedule_enabled())
+
+        # A new process reads the cache, without parsing.
+        configs._registry = None
+        with mock.patch.object(configs.Config, "from_configfile") as mock_parse:
+            home = list(configs.iterate_configs(source="/home"))
+        mock_parse.assert_not_called()
+        self.assertEqual(len(home), 1)
+        self.assertEqual(home[0].snap_type, snap_type_enum.SnapType.RSYNC)
+        self.assertEqual(home[0], configs.Config.from_configfile(home[0].config_file))
+
+        # A changed file is parsed again.
+        self._write_config("root.conf", "/", keep_daily=3)
+        self.assertTrue(configs.is_schedule_enabled())
+
+    def test_invalid_config(self):
+        self._write_config("bad.conf", "")
+        with mock.patch.object(configs.os_utils, "eprint") as mock_eprint:
+            self.assertEqual(list(configs.iterate_configs(source=None)), [])
+        mock_eprint.assert_called_once()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -18,11 +18,41 @@ import dataclasses
 TIME_FORMAT = r"%Y%m%d%H%M%S"
 # Length of the string produced by this format.
 TIME_FORMAT_LEN = 14
+# With subsecond_names, milliseconds are appended after a separator, e.g.
+# "20230315120000_123".
+SUBSECOND_SEPARATOR = "_"
+SUBSECOND_DIGITS = 3
+# Length of a timestamp with milliseconds.
+TIME_FORMAT_SUBSECOND_LEN = (
+    TIME_FORMAT_LEN + len(SUBSECOND_SEPARATOR) + SUBSECOND_DIGITS
+)
 
 
 @dataclasses.dataclass
 class _Flags:
     dryrun: bool = False
+    # Maximum threads for concurrent I/O, e.g. reading snapshot metadata. Use 1 to
+    # disable concurrency.
+    io_threads: int = 8
+    # Maximum seconds to wait for deleted snapshots to be cleaned up, with --sync.
+    sync_timeout: float = 600.0
+    # If set, override the deletion throttle of all configs.
+    max_deletions_per_interval: int | None = None
+    deletion_interval: float | None = None
+    wait_for_cleaner: bool | None = None
+    # If set, overrides rsync_bwlimit of all configs.
+    rsync_bwlimit: str | None = None
+    # Seconds after which commands of each kind are killed; 0 for no limit. Kinds are
+    # "probe", "create", "delete" and "hook"; see os_utils.run_command(). Syncs are
+    # limited by sync_timeout.
+    command_timeouts: dict[str, float] = dataclasses.field(
+        default_factory=lambda: {
+            "probe": 60.0,
+            "create": 0.0,
+            "delete": 0.0,
+            "hook": 0.0,
+        }
+    )
 
 
 FLAGS = _Flags()
@@ -18,6 +18,8 @@ import contextlib
 import datetime
 import itertools
 import logging
+import sys
+import time
 from collections.abc import Iterable
 
 from . import arg_parser
@@ -25,11 +27,11 @@ from . import configs
 from . import global_flags
 from .mechanisms import snap_mechanisms
 from .mechanisms import snap_type_enum
-from .snapshot_logic import batch_deleter
-from .snapshot_logic import rollbacker
+from .snapshot_logic import snap_holder
 from .snapshot_logic import snap_operator
 from .utils import colored_logs
 from .utils import os_utils
+from .utils import thread_pool
 from .utils import time_lock
 
 
@@ -57,13 +59,17 @@ def _set_ttl(configs_iter: Iterable[configs.Config], path_suffix: str, ttl_str:
 
 
 def _delete_snap(configs_iter: Iterable[configs.Config], path_suffix: str, sync: bool):
+    configs_list = list(configs_iter)
     to_sync: list[configs.Config] = []
-    for config in configs_iter:
+    to_delete: list[snap_holder.Snapshot] = []
+    for config in configs_list:
         snap = snap_operator.find_target(config, path_suffix)
         if snap:
-            snap.delete()
+            to_delete.append(snap)
             to_sync.append(config)
+    snap_holder.Snapshot.delete_many(to_delete)
 
+    for config in configs_list:
         config.call_post_hooks()
 
     if sync:
@@ -75,11 +81,15 @@ def _batch_delete_snaps(
     args: argparse.Namespace,
     sync: bool,
 ):
+    # Imported here, like other modules only needed for some commands, to keep startup
+    # fast for frequent commands like the package manager hook.
+    from .snapshot_logic import batch_deleter
+
+    args_as_dict = vars(args)
+    filters = list(batch_deleter.get_filters(args_as_dict))
     config_snaps_mapping_tuple = list(
-        batch_deleter.create_config_snapshots_mapping(configs_iter)
+        batch_deleter.create_config_snapshots_mapping(configs_iter, *filters)
     )
-    args_as_dict = vars(args)
-    filters = batch_deleter.get_filters(args_as_dict)
 
     targets = list(
         batch_deleter.apply_snapshot_filters(config_snaps_mapping_tuple, *filters)
@@ -101,61 +111,150 @@ def _batch_delete_snaps(
         _sync(to_sync)
 
 
+def _list_configs(
+    configs_iter: Iterable[configs.Config],
+    now: datetime.datetime,
+    as_json: bool,
+    package: str | None,
+):
+    # Configs are read concurrently, but printed in order.
+    for lines in thread_pool.map_ordered(
+        lambda config: snap_operator.SnapOperator(config, now).list_lines(
+            as_json, package=package
+        ),
+        configs_iter,
+    ):
+        for line in lines:
+            print(line)
+
+
+def _read_pacman_targets() -> list[str]:
+    # With NeedsTargets, pacman writes the package names of the transaction to the
+    # hook's stdin, one per line.
+    if sys.stdin is None or sys.stdin.isatty():
+        return []
+    return list(dict.fromkeys(line.strip() for line in sys.stdin if line.strip()))
+
+
+def _forwarded_flags(args: argparse.Namespace) -> list[str]:
+    """Returns the global flags in args, to pass to a background yabsnap process.
+
+    --deadline is not passed, since it only limits the blocking invocation.
+    """
+    flags: list[str] = []
+    if args.dry_run:
+        flags.append("--dry-run")
+    if args.verbose:
+        flags.append("--verbose")
+    if args.sync:
+        flags.append("--sync")
+    if args.config_file is not None:
+        flags += ["--config-file", args.config_file]
+    if args.io_threads is not None:
+        flags += ["--io-threads", str(args.io_threads)]
+    if args.sync_timeout is not None:
+        flags += ["--sync-timeout", str(args.sync_timeout)]
+    if args.max_deletions_per_interval is not None:
+        flags += ["--max-deletions-per-interval", str(args.max_deletions_per_interval)]
+    if args.deletion_interval is not None:
+        flags += ["--deletion-interval", str(args.deletion_interval)]
+    if args.wait_for_cleaner is not None:
+        flags.append(
+            "--wait-for-cleaner" if args.wait_for_cleaner else "--no-wait-for-cleaner"
+        )
+    if args.bwlimit is not None:
+        flags += ["--bwlimit", args.bwlimit]
+    for kind, secs in args.command_timeout or []:
+        flags += ["--command-timeout", f"{kind}={secs}"]
+    return flags
+
+
 def _config_operation(
-    command: str, source: str | None, comment: str | None, sync: bool
+    command: str,
+    configs_iter: Iterable[configs.Config],
+    comment: str | None,
+    sync: bool,
+    defer_cleanup: bool = False,
+    cleanup_flags: list[str] | None = None,
+    packages: list[str] | None = None,
+    list_package: str | None = None,
 ):
     # Single timestamp for all operations. For commands that can create snapshots, the
     # per-second lock is held for the whole operation, so another yabsnap process cannot
     # reserve the same second and create a snapshot with the same name (Issue #83).
+    configs_list = list(configs_iter)
     cm: contextlib.AbstractContextManager[datetime.datetime]
     if command in ("list", "list-json"):
         # Read-only: nothing is created, so no second needs reserving.
         cm = contextlib.nullcontext(datetime.datetime.now())
+    elif configs_list and all(config.subsecond_names for config in configs_list):
+        # Names with milliseconds are made unique when the snapshot is created.
+        cm = contextlib.nullcontext(datetime.datetime.now())
     else:
         cm = time_lock.locked_now()
     with cm as now:
-        # Which mount paths to sync.
-        to_sync: list[configs.Config] = []
+        if command in ("list", "list-json"):
+            _list_configs(
+                configs_list,
+                now,
+                as_json=command == "list-json",
+                package=list_package,
+            )
+            return
 
-        # Commands that need to access existing config.
-        for config in configs.iterate_configs(source=source):
+        def operate(config: configs.Config) -> snap_operator.SnapOperator:
             snapper = snap_operator.SnapOperator(config, now)
             if command == "internal-cronrun":
                 snapper.scheduled()
             elif command == "internal-preupdate":
-                snapper.on_pacman()
-            elif command == "list":
-                snapper.list_snaps()
-            elif command == "list-json":
-                snapper.list_snaps_json()
+                snapper.on_pacman(packages=packages, defer_cleanup=defer_cleanup)
             elif command == "create":
                 snapper.create(comment)
             else:
                 raise ValueError(f"Command not implemented: {command}")
+            return snapper
+
+        from .snapshot_logic import config_runner
+
+        # With deferred cleanup, only snapshots are created, which is cheap for the
+        # disk; so all configs run in parallel.
+        results = config_runner.run(
+            operate, configs_list, by_filesystem=not defer_cleanup
+        )
 
+        # Which mount paths to sync.
+        to_sync: list[configs.Config] = []
+        # Configs whose post hooks run after the deferred cleanup.
+        to_cleanup: list[str] = []
+
+        for result in results:
+            snapper = result.value
+            if snapper is None:
+                continue
+            if defer_cleanup and (snapper.snaps_created or snapper.snaps_queued):
+                to_cleanup.append(result.config.config_file)
+                continue
             if snapper.snaps_deleted:
-                if config.snap_type == snap_type_enum.SnapType.BTRFS:
-                    to_sync.append(config)
+                if result.config.snap_type == snap_type_enum.SnapType.BTRFS:
+                    to_sync.append(result.config)
             if snapper.snaps_created or snapper.snaps_deleted:
-                config.call_post_hooks()
+                result.config.call_post_hooks()
 
-        if sync:
-            _sync(to_sync)
+        if to_cleanup:
+            from .snapshot_logic import deferred_cleanup
 
+            deferred_cleanup.spawn(to_cleanup, cleanup_flags or [])
 
-def main():
-    args = _parse_args()
-    command: str = args.command
-    if not command:
-        os_utils.eprint("Start with --help to see common args.")
-        return
+        if sync:
+            _sync(to_sync)
 
-    if args.dry_run:
-        global_flags.FLAGS.dryrun = True
-    configs.USER_CONFIG_FILE = args.config_file
+        failed = [x.config.config_file for x in results if x.error is not None]
+        if failed:
+            os_utils.fatal_error(f"Failed for configs: {', '.join(failed)}")
 
-    colored_logs.setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
 
+def _run_command(args: argparse.Namespace) -> None:
+    command: str = args.command
     if command == "create-config":
         configs.create_config(args.config_name, args.source)
     elif command == "delete":
@@ -176,7 +275,38 @@ def main():
             args=args,
             sync=args.sync,
         )
+    elif command == "internal-drain":
+        from .snapshot_logic import deletion_queue
+
+        deletion_queue.drain()
+    elif command == "internal-cleanup":
+        from .snapshot_logic import deferred_cleanup
+
+        cleaned = deferred_cleanup.run(args.config_files)
+        if args.sync:
+            _sync([x for x in cleaned if x.snap_type == snap_type_enum.SnapType.BTRFS])
+    elif command == "internal-schedule":
+        from .snapshot_logic import wakeup
+
+        if args.follow:
+            wakeup.run_forever(
+                lambda: configs.iterate_configs(source=args.source),
+                lambda due_configs: _config_operation(
+                    command="internal-cronrun",
+                    configs_iter=due_configs,
+                    comment=None,
+                    sync=args.sync,
+                ),
+            )
+        else:
+            wakeup.program_timer(
+                wakeup.next_wakeup(
+                    configs.iterate_configs(source=args.source), time.time()
+                )
+            )
     elif command == "rollback":
+        from .snapshot_logic import rollbacker
+
         rollbacker.rollback(
             configs.iterate_configs(source=args.source),
             args.target_suffix,
@@ -185,6 +315,8 @@ def main():
             no_confirm=args.noconfirm,
         )
     elif command == "rollback-gen":
+        from .snapshot_logic import rollbacker
+
         rollbacker.rollback(
             configs.iterate_configs(source=args.source),
             args.target_suffix,
@@ -202,15 +334,60 @@ def main():
                 "Please install it using your package manager or pip.\n"
                 "Example (for Arch Linux): sudo pacman -S python-textual\n"
             )
+    elif command == "internal-preupdate":
+        start = time.monotonic()
+        _config_operation(
+            command=command,
+            configs_iter=configs.iterate_configs(source=args.source),
+            comment=None,
+            sync=args.sync,
+            defer_cleanup=args.defer_cleanup,
+            cleanup_flags=_forwarded_flags(args),
+            packages=_read_pacman_targets(),
+        )
+        # Shown by the package manager, since the hook blocks the transaction.
+        os_utils.eprint(f"yabsnap: Took {time.monotonic() - start:0.2f}s")
     else:
         comment = getattr(args, "comment", "")
         _config_operation(
             command=args.command,
-            source=args.source,
+            configs_iter=configs.iterate_configs(source=args.source),
             comment=comment,
             sync=args.sync,
+            list_package=getattr(args, "package", None),
         )
 
+
+def main():
+    args = _parse_args()
+    command: str = args.command
+    if not command:
+        os_utils.eprint("Start with --help to see common args.")
+        return
+
+    if args.dry_run:
+        global_flags.FLAGS.dryrun = True
+    if args.io_threads is not None:
+        global_flags.FLAGS.io_threads = args.io_threads
+    if args.sync_timeout is not None:
+        global_flags.FLAGS.sync_timeout = args.sync_timeout
+    global_flags.FLAGS.max_deletions_per_interval = args.max_deletions_per_interval
+    global_flags.FLAGS.deletion_interval = args.deletion_interval
+    global_flags.FLAGS.wait_for_cleaner = args.wait_for_cleaner
+    global_flags.FLAGS.rsync_bwlimit = args.bwlimit
+    for kind, secs in args.command_timeout or []:
+        if kind == "sync":
+            os_utils.fatal_error("Use --sync-timeout to limit syncs")
+        if kind not in global_flags.FLAGS.command_timeouts:
+            os_utils.fatal_error(f"Unknown kind in --command-timeout: {kind}")
+        global_flags.FLAGS.command_timeouts[kind] = secs
+    configs.USER_CONFIG_FILE = args.config_file
+
+    colored_logs.setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
+
+    with os_utils.run_deadline(args.deadline):
+        _run_command(args)
+
     if configs.is_schedule_enabled() and not os_utils.timer_enabled():
         os_utils.eprint(
             "\n".join(
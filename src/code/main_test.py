@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from . import arg_parser
+from . import main
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+# Cumulative time allowed to import main, in microseconds. It is normally 75-100ms; the
+# budget is tight enough to catch a regression, e.g. a new eager import.
+_IMPORT_BUDGET_US = 120_000
+# The fastest of this many imports is compared with the budget, to reduce noise.
+_IMPORT_RUNS = 3
+
+# Modules that must not be imported on startup, or when a mechanism is used.
+_LAZY_MODULES = [
+    "code.mechanisms.bcachefs_mechanism",
+    "code.mechanisms.rollback_btrfs",
+    "code.mechanisms.rsync_mechanism",
+    "code.snapshot_logic.batch_deleter",
+    "code.snapshot_logic.config_runner",
+    "code.snapshot_logic.deferred_cleanup",
+    "code.snapshot_logic.package_index",
+    "code.snapshot_logic.rollbacker",
+    "code.snapshot_logic.wakeup",
+    "code.tui.tui_app",
+    "textual",
+]
+
+# Imports main as the cli would, and uses the btrfs mechanism as the package manager
+# hook would. Prints the modules imported.
+_SCRIPT = """
+import sys
+from code import main
+from code.mechanisms import snap_mechanisms
+from code.mechanisms import snap_type_enum
+snap_mechanisms.get(snap_type_enum.SnapType.BTRFS)
+print("\\n".join(sys.modules))
+"""
+
+
+def _import_main() -> tuple[set[str], int]:
+    """Returns the modules imported, and the cumulative microseconds to import main."""
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _SCRIPT],
+        cwd=src_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines are formatted as "import time: <self_us> | <cumulative_us> | <name>".
+    cumulative_us = {
+        parts[2].strip(): int(parts[1])
+        for line in result.stderr.splitlines()
+        if len(parts := line.removeprefix("import time:").split("|")) == 3
+        and parts[1].strip().isdigit()
+    }
+    return set(result.stdout.splitlines()), cumulative_us["code.main"]
+
+
+class MainImportTest(unittest.TestCase):
+    def test_startup_imports(self):
+        modules, _ = _import_main()
+        self.assertIn("code.mechanisms.btrfs_mechanism", modules)
+        for module in _LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_import_time(self):
+        import_us = min(_import_main()[1] for _ in range(_IMPORT_RUNS))
+        self.assertLess(import_us, _IMPORT_BUDGET_US)
+
+
+class ForwardedFlagsTest(unittest.TestCase):
+    def test_round_trip(self):
+        parser = arg_parser.make_parser()
+        flags = [
+            "--dry-run",
+            "--verbose",
+            "--sync",
+            "--config-file",
+            "/etc/yabsnap/configs/root.conf",
+            "--io-threads",
+            "2",
+            "--sync-timeout",
+            "30.0",
+            "--max-deletions-per-interval",
+            "5",
+            "--deletion-interval",
+            "10.0",
+            "--no-wait-for-cleaner",
+            "--bwlimit",
+            "20M",
+            "--command-timeout",
+            "delete=60.0",
+            "--command-timeout",
+            "hook=5.0",
+        ]
+        args = parser.parse_args(
+            [*flags, "--deadline", "600", "internal-preupdate", "--defer-cleanup"]
+        )
+        # The deadline of the hook does not limit the background process.
+        self.assertEqual(main._forwarded_flags(args), flags)
+        # The subprocess sees the same flags.
+        child_args = parser.parse_args(
+            [*main._forwarded_flags(args), "internal-cleanup", "a.conf"]
+        )
+        for name in ["command_timeout", "wait_for_cleaner", "verbose"]:
+            self.assertEqual(getattr(child_args, name), getattr(args, name))
+        self.assertIsNone(child_args.deadline)
+
+    def test_defaults(self):
+        args = arg_parser.make_parser().parse_args(["internal-preupdate"])
+        self.assertEqual(main._forwarded_flags(args), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
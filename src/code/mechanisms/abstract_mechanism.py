@@ -17,6 +17,7 @@ import dataclasses
 import enum
 
 from ..snapshot_logic import snap_metadata
+from ..utils import os_utils
 
 
 # The type of snapshot is maintained in two places -
@@ -35,12 +36,47 @@ class LightSnapshot:
     metadata: snap_metadata.SnapMetadata
 
 
+# Ways to create and delete btrfs snapshots.
+BTRFS_ENGINES = ("cli", "ioctl")
+
+
+@dataclasses.dataclass(frozen=True)
+class MechanismOptions:
+    """Options from a config, which may change how a mechanism works.
+
+    Mechanisms ignore options that do not apply to them.
+    """
+
+    # One of BTRFS_ENGINES. With "ioctl", the btrfs command is used only if the ioctls
+    # are not supported.
+    btrfs_engine: str = "cli"
+    # If positive, at most this many snapshots are deleted per deletion_interval.
+    max_deletions_per_interval: int = 0
+    deletion_interval: float = 60.0
+    # With max_deletions_per_interval, wait for the filesystem to clean up deleted
+    # snapshots before deleting more.
+    wait_for_cleaner: bool = False
+    # Applied to commands that create or delete snapshots.
+    process_limits: os_utils.ProcessLimits = dataclasses.field(
+        default_factory=os_utils.ProcessLimits
+    )
+    # If set, passed to rsync as --bwlimit, e.g. "20M".
+    rsync_bwlimit: str = ""
+
+    def __post_init__(self) -> None:
+        if self.btrfs_engine not in BTRFS_ENGINES:
+            raise ValueError(f"Invalid btrfs_engine {self.btrfs_engine!r}")
+
+
 class SnapMechanism(abc.ABC):
     """Interface with necessary methods to implement snapshotting system.
 
     Implementations may be based on btrfs, rsync, bcachefs, etc.
     """
 
+    def __init__(self, options: MechanismOptions) -> None:
+        self._options = options
+
     @abc.abstractmethod
     def verify_volume(self, source: str) -> bool:
         """Confirms that the source path can be snapshotted."""
@@ -57,6 +93,23 @@ class SnapMechanism(abc.ABC):
     def delete(self, destination: str):
         """Deletes an existing snapshot."""
 
+    def create_many(self, source_destinations: list[tuple[str, str]]):
+        """Creates snapshots for a list of (source, destination).
+
+        Implementations may override it if they can create many snapshots at once.
+        """
+        for source, destination in source_destinations:
+            self.create(source, destination)
+
+    def delete_many(self, destinations: list[str]):
+        """Deletes existing snapshots.
+
+        Implementations may override it if they can delete many snapshots at once. If
+        an error is raised, some of the snapshots may have been deleted.
+        """
+        for destination in destinations:
+            self.delete(destination)
+
     @abc.abstractmethod
     def rollback_gen(
         self,
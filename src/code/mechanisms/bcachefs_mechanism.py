@@ -2,17 +2,18 @@ import logging
 import shlex
 
 from .. import global_flags
+from ..utils import fs_probe
 from ..utils import os_utils
 from . import abstract_mechanism
 
 from typing import override
 
 
-def _execute_sh(cmd: str):
+def _execute_sh(cmd: str, kind: str):
     if global_flags.FLAGS.dryrun:
         os_utils.eprint("Would run " + cmd)
     else:
-        os_utils.runsh_or_error(cmd)
+        os_utils.runsh_or_error(cmd, kind=kind)
 
 
 # NOTE: This is implementation is untested.
@@ -20,11 +21,11 @@ class BcachefsSnapMechanism(abstract_mechanism.SnapMechanism):
     @override
     def verify_volume(self, source: str) -> bool:
         # Check if the mount point is a bcachefs filesystem.
-        fstype = os_utils.runsh("stat -f --format=%T " + source)
-        if not fstype:
+        fsinfo = fs_probe.probe(source)
+        if fsinfo is None:
             logging.warning(f"Not bcachefs (cannot determine filesystem): {source}")
             return False
-        if fstype.strip() != "bcachefs":
+        if fsinfo.fstype != "bcachefs":
             logging.warning(f"Not bcachefs (filesystem not bcachefs): {source}")
             return False
         return True
@@ -38,15 +39,22 @@ class BcachefsSnapMechanism(abstract_mechanism.SnapMechanism):
             )
         try:
             _execute_sh(
-                f"bcachefs subvolume snapshot {shlex.quote(source)} {shlex.quote(destination)}"
+                f"bcachefs subvolume snapshot {shlex.quote(source)} {shlex.quote(destination)}",
+                kind="create",
             )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to create; are you running as root?") from exc
 
     @override
     def delete(self, destination: str):
         try:
-            _execute_sh(f"bcachefs subvolume delete {shlex.quote(destination)}")
+            _execute_sh(
+                f"bcachefs subvolume delete {shlex.quote(destination)}", kind="delete"
+            )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to delete; are you running as root?") from exc
 
@@ -13,40 +13,133 @@
 # limitations under the License.
 
 import logging
+import os
+import threading
+import time
 
 from .. import global_flags
 from ..snapshot_logic import snap_metadata
+from ..utils import btrfs_ioctl
+from ..utils import fs_probe
 from ..utils import mtab_parser
 from ..utils import os_utils
+from ..utils import thread_pool
 from . import abstract_mechanism
-from . import rollback_btrfs
 
 from typing import override
 
+# IDs of subvolumes deleted by this process, by the directory they were in; so that
+# sync_paths() can wait for only these. None if an ID could not be found.
+_deleted_ids: dict[str, set[int] | None] = {}
+# Configs may be run in parallel; see config_runner.py.
+_deleted_ids_lock = threading.Lock()
 
-def _execute_sh(cmd: str):
+
+def _execute_sh(cmd: str, kind: str, limits: os_utils.ProcessLimits | None = None):
     if global_flags.FLAGS.dryrun:
         os_utils.eprint("Would run " + cmd)
     else:
-        os_utils.runsh_or_error(cmd)
+        os_utils.runsh_or_error(cmd, limits=limits, kind=kind)
+
+
+def _subvol_id(destination: str) -> int | None:
+    try:
+        return btrfs_ioctl.subvol_info(destination).subvol_id
+    except OSError as exc:
+        logging.info(f"Cannot find subvolume id of {destination}: {exc}")
+        return None
+
+
+def _record_deletion(destination: str, subvol_id: int | None) -> None:
+    directory = os.path.dirname(destination)
+    with _deleted_ids_lock:
+        if subvol_id is None:
+            _deleted_ids[directory] = None
+            return
+        ids = _deleted_ids.setdefault(directory, set())
+        if ids is not None:
+            ids.add(subvol_id)
+
+
+def _sync_filesystem(paths: list[str], deadline: float, keep_ids: bool) -> None:
+    """Waits for deletions of subvolumes in paths, which are on one filesystem.
+
+    Args:
+      paths: Directories with deleted subvolumes, on the same filesystem.
+      deadline: Time by time.monotonic() to stop waiting.
+      keep_ids: If True, the deleted IDs are kept for a later sync; syncing IDs that
+        are already cleaned is fast.
+    """
+    ids: set[int] | None = set()
+    for path in paths:
+        with _deleted_ids_lock:
+            if keep_ids:
+                path_ids = _deleted_ids.get(path)
+                path_ids = None if path_ids is None else set(path_ids)
+            else:
+                path_ids = _deleted_ids.pop(path, None)
+        # If not known, wait for all deletions on the filesystem.
+        ids = None if ids is None or path_ids is None else ids | path_ids
+    command = f"btrfs subvolume sync {paths[0]}"
+    if ids is None:
+        os_utils.eprint(f"Syncing {paths[0]} ...", flush=True)
+    else:
+        command += "".join(f" {x}" for x in sorted(ids))
+        os_utils.eprint(
+            f"Syncing {len(ids)} deleted subvolume(s) on {paths[0]} ...", flush=True
+        )
+    try:
+        os_utils.runsh_or_error(
+            command, timeout=max(0.0, deadline - time.monotonic()), kind="sync"
+        )
+    except os_utils.CommandTimeout:
+        logging.warning(
+            f"Timed out syncing {paths[0]}; cleanup will continue in the background."
+        )
+        return
+    os_utils.eprint(f"Synced {paths[0]}", flush=True)
 
 
 class BtrfsSnapMechanism(abstract_mechanism.SnapMechanism):
+    def __init__(self, options: abstract_mechanism.MechanismOptions) -> None:
+        super().__init__(options)
+        # Set if the ioctls turn out to be unsupported, to use the btrfs command.
+        self._ioctl_unsupported = False
+        # Deletions in the current interval, for max_deletions_per_interval. They are
+        # counted across calls, since callers may delete in several batches.
+        self._interval_start = 0.0
+        self._interval_deletions = 0
+        self._interval_paths: set[str] = set()
+        # Instances are shared by configs with the same options, which may be run in
+        # parallel. Deletions are serialized, so that the throttle is shared.
+        self._delete_lock = threading.Lock()
+
+    def _use_ioctl(self) -> bool:
+        return (
+            self._options.btrfs_engine == "ioctl"
+            and not self._ioctl_unsupported
+            and not global_flags.FLAGS.dryrun
+        )
+
+    def _ioctl_failed(self, operation: str, exc: OSError) -> None:
+        """Raises if exc is an error other than the ioctl being unsupported."""
+        if exc.errno in btrfs_ioctl.UNSUPPORTED_ERRNOS:
+            logging.warning(f"Btrfs ioctl unsupported, using btrfs command: {exc}")
+            self._ioctl_unsupported = True
+            return
+        raise RuntimeError(f"Unable to {operation}; are you running as root?") from exc
+
     @override
     def verify_volume(self, source: str) -> bool:
         # Based on https://stackoverflow.com/a/32865333/196462
-        fstype = os_utils.runsh("stat -f --format=%T " + source)
-        if not fstype:
+        fsinfo = fs_probe.probe(source)
+        if fsinfo is None:
             logging.warning(f"Not btrfs (cannot determine filesystem): {source}")
             return False
-        if fstype.strip() != "btrfs":
+        if fsinfo.fstype != "btrfs":
             logging.warning(f"Not btrfs (filesystem not btrfs): {source}")
             return False
-        inodenum = os_utils.runsh("stat --format=%i " + source)
-        if not inodenum:
-            logging.warning(f"Not btrfs (cannot determine inode): {source}")
-            return False
-        if inodenum.strip() != "256":
+        if fsinfo.inode != 256:
             logging.warning(
                 f"Not btrfs (inode not 256, possibly a subdirectory of a btrfs mount): {source}"
             )
@@ -61,15 +154,110 @@ class BtrfsSnapMechanism(abstract_mechanism.SnapMechanism):
 
     @override
     def create(self, source: str, destination: str):
+        if self._use_ioctl():
+            try:
+                btrfs_ioctl.create_snapshot(source, destination)
+            except OSError as exc:
+                self._ioctl_failed("create", exc)
+            else:
+                try:
+                    info = btrfs_ioctl.subvol_info(destination)
+                except OSError as exc:
+                    logging.info(f"Created {destination}; cannot get info: {exc}")
+                else:
+                    logging.info(
+                        f"Created {destination} with subvolume id {info.subvol_id},"
+                        f" generation {info.generation}"
+                    )
+                return
         try:
-            _execute_sh(f"btrfs subvolume snapshot -r {source} {destination}")
+            _execute_sh(
+                f"btrfs subvolume snapshot -r {source} {destination}", kind="create"
+            )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to create; are you running as root?") from exc
 
     @override
     def delete(self, destination: str):
+        self.delete_many([destination])
+
+    @override
+    def delete_many(self, destinations: list[str]):
+        with self._delete_lock:
+            self._delete_many(destinations)
+
+    def _delete_many(self, destinations: list[str]):
+        limit = self._options.max_deletions_per_interval
+        if limit <= 0 or global_flags.FLAGS.dryrun:
+            self._delete_batch(destinations)
+            return
+        done = 0
+        while done < len(destinations):
+            if self._interval_deletions >= limit:
+                self._wait_for_next_interval()
+            if self._interval_deletions == 0:
+                self._interval_start = time.monotonic()
+            batch = destinations[done : done + limit - self._interval_deletions]
+            self._delete_batch(batch)
+            self._interval_deletions += len(batch)
+            self._interval_paths.update(os.path.dirname(x) for x in batch)
+            done += len(batch)
+            os_utils.eprint(
+                f"Deleted {done} of {len(destinations)} snapshots,"
+                f" {len(destinations) - done} remaining",
+                flush=True,
+            )
+
+    def _wait_for_next_interval(self) -> None:
+        if self._options.wait_for_cleaner:
+            # Keeps the IDs, so that a final sync_paths() waits for only these.
+            self._sync(self._interval_paths, keep_ids=True)
+        wait_secs = self._interval_start + self._options.deletion_interval
+        wait_secs -= time.monotonic()
+        if wait_secs > 0:
+            logging.info(f"Waiting {wait_secs:0.1f}s before deleting more snapshots")
+            time.sleep(wait_secs)
+        self._interval_deletions = 0
+        self._interval_paths = set()
+
+    def _delete_batch(self, destinations: list[str]):
+        if not destinations:
+            return
+        if global_flags.FLAGS.dryrun:
+            self._delete_subvolumes(destinations)
+            return
+        # The IDs are read before deleting, but recorded only for subvolumes which are
+        # gone; a sync would otherwise wait for ones which failed to delete.
+        subvol_ids = {x: _subvol_id(x) for x in destinations}
+        try:
+            self._delete_subvolumes(destinations)
+        finally:
+            for destination, subvol_id in subvol_ids.items():
+                if not os.path.lexists(destination):
+                    _record_deletion(destination, subvol_id)
+
+    def _delete_subvolumes(self, destinations: list[str]):
+        if self._use_ioctl():
+            for index, destination in enumerate(destinations):
+                try:
+                    btrfs_ioctl.delete_subvolume(destination)
+                except OSError as exc:
+                    self._ioctl_failed("delete", exc)
+                    destinations = destinations[index:]
+                    break
+                logging.info(f"Deleted {destination}")
+            else:
+                return
         try:
-            _execute_sh(f"btrfs subvolume delete {destination}")
+            _execute_sh(
+                "btrfs subvolume delete " + " ".join(destinations),
+                kind="delete",
+                limits=self._options.process_limits,
+            )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to delete; are you running as root?") from exc
 
@@ -92,13 +280,28 @@ class BtrfsSnapMechanism(abstract_mechanism.SnapMechanism):
                     " For certain recovery environments like grub-btrfs, volumes may not be correctly detected."
                     " You can use the `--subvol-map` arg to override auto detection."
                 )
+        # Imported here, since it is only needed for rollback commands.
+        from . import rollback_btrfs
+
         return rollback_btrfs.rollback_gen(snapshots, subvol_map)
 
     @override
     def sync_paths(self, paths: set[str]):
-        for mount_path in sorted(paths):
-            if global_flags.FLAGS.dryrun:
+        self._sync(paths, keep_ids=False)
+
+    def _sync(self, paths: set[str], keep_ids: bool):
+        if global_flags.FLAGS.dryrun:
+            for mount_path in sorted(paths):
                 os_utils.eprint(f"Would sync {mount_path}")
-                continue
-            os_utils.eprint("Syncing ...", flush=True)
-            os_utils.runsh_or_error(f"btrfs subvolume sync {mount_path}")
+            return
+        # Paths on the same filesystem are synced together, and filesystems in parallel.
+        by_filesystem: dict[str, list[str]] = {}
+        for mount_path in sorted(paths):
+            uuid = os_utils.get_filesystem_uuid(mount_path) or mount_path
+            by_filesystem.setdefault(uuid, []).append(mount_path)
+        deadline = time.monotonic() + global_flags.FLAGS.sync_timeout
+        thread_pool.map_ordered(
+            lambda group: _sync_filesystem(group, deadline, keep_ids),
+            by_filesystem.values(),
+            threads=len(by_filesystem),
+        )
@@ -0,0 +1,215 @@
+import errno
+import unittest
+from unittest import mock
+
+from .. import global_flags
+from ..utils import btrfs_ioctl
+from ..utils import os_utils
+from . import abstract_mechanism
+from . import btrfs_mechanism
+
+from typing import Any
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+def _mechanism(engine: str, **kwargs: Any) -> btrfs_mechanism.BtrfsSnapMechanism:
+    return btrfs_mechanism.BtrfsSnapMechanism(
+        abstract_mechanism.MechanismOptions(btrfs_engine=engine, **kwargs)
+    )
+
+
+class BtrfsMechanismTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._runsh = mock.MagicMock()
+        self._create = mock.MagicMock()
+        self._info = mock.MagicMock(
+            return_value=btrfs_ioctl.SubvolInfo(subvol_id=260, generation=7)
+        )
+        btrfs_mechanism._deleted_ids.clear()
+        self.addCleanup(btrfs_mechanism._deleted_ids.clear)
+        for patcher in (
+            mock.patch.object(os_utils, "runsh_or_error", self._runsh),
+            mock.patch.object(btrfs_ioctl, "create_snapshot", self._create),
+            mock.patch.object(btrfs_ioctl, "subvol_info", self._info),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cli(self):
+        _mechanism("cli").create("/home", "/snaps/@home-1")
+        self._create.assert_not_called()
+        self._runsh.assert_called_once_with(
+            "btrfs subvolume snapshot -r /home /snaps/@home-1",
+            limits=None,
+            kind="create",
+        )
+
+    def test_ioctl(self):
+        with self.assertLogs(level="INFO") as logs:
+            _mechanism("ioctl").create("/home", "/snaps/@home-1")
+        self._create.assert_called_once_with("/home", "/snaps/@home-1")
+        self._runsh.assert_not_called()
+        self.assertIn("subvolume id 260, generation 7", "\n".join(logs.output))
+
+    def test_ioctl_unsupported(self):
+        self._create.side_effect = OSError(errno.ENOTTY, "Inappropriate ioctl")
+        mechanism = _mechanism("ioctl")
+        with self.assertLogs(level="WARNING"):
+            mechanism.create("/home", "/snaps/@home-1")
+        self._runsh.assert_called_once()
+        # The ioctl is not tried again.
+        mechanism.create("/home", "/snaps/@home-2")
+        self._create.assert_called_once()
+        self.assertEqual(self._runsh.call_count, 2)
+
+    def test_ioctl_error(self):
+        self._create.side_effect = OSError(errno.EPERM, "Operation not permitted")
+        with self.assertRaises(RuntimeError):
+            _mechanism("ioctl").create("/home", "/snaps/@home-1")
+        self._runsh.assert_not_called()
+
+    def test_delete_many(self):
+        _mechanism("cli").delete_many(["/snaps/@home-1", "/snaps/@home-2"])
+        self._runsh.assert_called_once_with(
+            "btrfs subvolume delete /snaps/@home-1 /snaps/@home-2",
+            limits=os_utils.ProcessLimits(),
+            kind="delete",
+        )
+
+    def test_delete_many_ioctl_unsupported(self):
+        with (
+            mock.patch.object(
+                btrfs_ioctl,
+                "delete_subvolume",
+                side_effect=[None, OSError(errno.ENOTTY, "Inappropriate ioctl")],
+            ),
+            self.assertLogs(level="WARNING"),
+        ):
+            _mechanism("ioctl").delete_many(
+                ["/snaps/@home-1", "/snaps/@home-2", "/snaps/@home-3"]
+            )
+        # The rest are deleted with the btrfs command.
+        self._runsh.assert_called_once_with(
+            "btrfs subvolume delete /snaps/@home-2 /snaps/@home-3",
+            limits=os_utils.ProcessLimits(),
+            kind="delete",
+        )
+
+    def test_sync_deleted_ids(self):
+        self._info.side_effect = [
+            btrfs_ioctl.SubvolInfo(subvol_id=x, generation=7) for x in (261, 260, 300)
+        ]
+        mechanism = _mechanism("cli")
+        mechanism.delete_many(["/snaps/@home-1", "/snaps/@home-2"])
+        mechanism.delete_many(["/mnt/data/snaps/@data-1"])
+        self._runsh.reset_mock()
+
+        with (
+            mock.patch.object(
+                os_utils,
+                "get_filesystem_uuid",
+                side_effect=lambda path: "data" if path.startswith("/mnt") else "root",
+            ),
+            mock.patch.object(os_utils, "eprint"),
+        ):
+            mechanism.sync_paths({"/snaps", "/mnt/data/snaps"})
+        self.assertCountEqual(
+            [x.args[0] for x in self._runsh.call_args_list],
+            [
+                "btrfs subvolume sync /mnt/data/snaps 300",
+                "btrfs subvolume sync /snaps 260 261",
+            ],
+        )
+        self.assertEqual(btrfs_mechanism._deleted_ids, {})
+
+    def test_sync_after_failed_delete(self):
+        self._info.side_effect = [
+            btrfs_ioctl.SubvolInfo(subvol_id=x, generation=7) for x in (260, 261)
+        ]
+        mechanism = _mechanism("ioctl")
+        with (
+            mock.patch.object(
+                btrfs_ioctl,
+                "delete_subvolume",
+                side_effect=[None, OSError(errno.EPERM, "Operation not permitted")],
+            ),
+            # The second subvolume still exists.
+            mock.patch.object(
+                btrfs_mechanism.os.path,
+                "lexists",
+                side_effect=lambda path: path == "/snaps/@home-2",
+            ),
+            self.assertRaises(RuntimeError),
+        ):
+            mechanism.delete_many(["/snaps/@home-1", "/snaps/@home-2"])
+        # Only the deleted subvolume is waited for.
+        self.assertEqual(btrfs_mechanism._deleted_ids, {"/snaps": {260}})
+
+    def test_sync_unknown_ids(self):
+        self._info.side_effect = OSError(errno.ENOTTY, "Inappropriate ioctl")
+        mechanism = _mechanism("cli")
+        mechanism.delete_many(["/snaps/@home-1"])
+        self._runsh.reset_mock()
+        self._runsh.side_effect = os_utils.CommandTimeout("Killed")
+        with (
+            mock.patch.object(os_utils, "get_filesystem_uuid", return_value=None),
+            mock.patch.object(os_utils, "eprint"),
+            mock.patch.object(global_flags.FLAGS, "sync_timeout", 1.0),
+            self.assertLogs(level="WARNING"),
+        ):
+            mechanism.sync_paths({"/snaps"})
+        # Waits for all deletions, with the timeout.
+        self._runsh.assert_called_once_with(
+            "btrfs subvolume sync /snaps", timeout=mock.ANY, kind="sync"
+        )
+        self.assertLessEqual(self._runsh.call_args.kwargs["timeout"], 1.0)
+
+    def test_throttle(self):
+        mechanism = _mechanism(
+            "cli",
+            max_deletions_per_interval=2,
+            deletion_interval=10.0,
+            wait_for_cleaner=True,
+        )
+        with (
+            mock.patch.object(btrfs_mechanism.time, "monotonic", return_value=100.0),
+            mock.patch.object(btrfs_mechanism.time, "sleep") as mock_sleep,
+            mock.patch.object(os_utils, "get_filesystem_uuid", return_value="root"),
+            mock.patch.object(os_utils, "eprint"),
+        ):
+            mechanism.delete_many(
+                ["/snaps/@home-1", "/snaps/@home-2", "/snaps/@home-3"]
+            )
+            # The throttle continues across calls.
+            mechanism.delete_many(["/snaps/@home-4", "/snaps/@home-5"])
+        self.assertEqual(
+            [x.args[0] for x in self._runsh.call_args_list],
+            [
+                "btrfs subvolume delete /snaps/@home-1 /snaps/@home-2",
+                "btrfs subvolume sync /snaps 260",
+                "btrfs subvolume delete /snaps/@home-3",
+                "btrfs subvolume delete /snaps/@home-4",
+                "btrfs subvolume sync /snaps 260",
+                "btrfs subvolume delete /snaps/@home-5",
+            ],
+        )
+        self.assertEqual(mock_sleep.call_args_list, [mock.call(10.0)] * 2)
+
+        # The IDs are kept, so that the final sync is still for only these.
+        self._runsh.reset_mock()
+        with (
+            mock.patch.object(os_utils, "get_filesystem_uuid", return_value="root"),
+            mock.patch.object(os_utils, "eprint"),
+        ):
+            mechanism.sync_paths({"/snaps"})
+        self._runsh.assert_called_once_with(
+            "btrfs subvolume sync /snaps 260", timeout=mock.ANY, kind="sync"
+        )
+        self.assertEqual(btrfs_mechanism._deleted_ids, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
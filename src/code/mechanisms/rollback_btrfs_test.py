@@ -17,6 +17,7 @@ from unittest import mock
 
 from ..snapshot_logic import snap_holder
 from ..utils import btrfs_utils
+from ..utils import mountinfo
 from ..utils import mtab_parser
 from ..utils import os_utils
 from . import rollback_btrfs
@@ -28,7 +29,7 @@ from . import rollback_btrfs
 class TestRollbacker(unittest.TestCase):
     def setUp(self):
         mtab_parser.mount_attributes.cache_clear()
-        mtab_parser._mount_entries.cache_clear()
+        mtab_parser._mount_table.cache_clear()
         self._patches = [
             mock.patch.object(btrfs_utils, "get_nested_subvs", return_value=[]),
             mock.patch.object(os_utils, "get_filesystem_uuid", return_value="12345"),
@@ -49,31 +50,16 @@ class TestRollbacker(unittest.TestCase):
         snaps_list[0].metadata.source = "/home"
         snaps_list[1].metadata.source = "/root"
 
-        findmnt_json = {
-            "filesystems": [
-                {
-                    "target": "/root",
-                    "source": "/dev/BLOCKDEV1",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=123,subvol=/subv_root",
-                },
-                {
-                    "target": "/home",
-                    "source": "/dev/BLOCKDEV1",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=456,subvol=/subv_home",
-                },
-                {
-                    "target": "/snaps",
-                    "source": "/dev/BLOCKDEV1",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=789,subvol=/subv_snaps",
-                },
-            ]
-        }
+        mounts = mountinfo.parse(
+            """
+30 1 0:31 /subv_root /root rw,noatime - btrfs /dev/BLOCKDEV1 rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=123,subvol=/subv_root
+31 1 0:31 /subv_home /home rw,noatime - btrfs /dev/BLOCKDEV1 rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=456,subvol=/subv_home
+32 1 0:31 /subv_snaps /snaps rw,noatime - btrfs /dev/BLOCKDEV1 rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=789,subvol=/subv_snaps
+"""
+        )
 
         with (
-            mock.patch.object(mtab_parser, "_findmnt", return_value=findmnt_json),
+            mock.patch.object(mountinfo, "entries", return_value=mounts),
             mock.patch.object(
                 rollback_btrfs, "_get_now_str", return_value="20220202220000"
             ),
@@ -110,19 +96,14 @@ echo "# sudo btrfs subvolume delete /snaps/rollback_20220202220000_subv_root"
         snaps_list[0].metadata.source = "/vol/nested1"
         snaps_list[1].metadata.source = "/vol/nested2"
 
-        findmnt_json = {
-            "filesystems": [
-                {
-                    "target": "/vol",
-                    "source": "/dev/BLOCKDEV1",
-                    "fstype": "btrfs",
-                    "options": "subvolid=123,subvol=/volume",
-                }
-            ]
-        }
+        mounts = mountinfo.parse(
+            """
+30 1 0:31 /volume /vol rw - btrfs /dev/BLOCKDEV1 subvolid=123,subvol=/volume
+"""
+        )
 
         with (
-            mock.patch.object(mtab_parser, "_findmnt", return_value=findmnt_json),
+            mock.patch.object(mountinfo, "entries", return_value=mounts),
             mock.patch.object(
                 rollback_btrfs, "_get_now_str", return_value="20220202220000"
             ),
@@ -160,32 +141,15 @@ echo "# sudo btrfs subvolume delete /vol/snaps/rollback_20220202220000_nested2"
         snaps_list[0].metadata.source = "/home"
         snaps_list[1].metadata.source = "/root"
 
-        findmnt_json = {
-            "filesystems": [
-                # Simulate that the mtab DOES NOT have following lines.
-                # {
-                #     "target": "/root",
-                #     "source": "/dev/BLOCKDEV1",
-                #     "fstype": "btrfs",
-                #     "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=123,subvol=/subv_root",
-                # },
-                # {
-                #     "target": "/home",
-                #     "source": "/dev/BLOCKDEV1",
-                #     "fstype": "btrfs",
-                #     "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=456,subvol=/subv_home",
-                # },
-                {
-                    "target": "/snaps",
-                    "source": "/dev/BLOCKDEV1",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=789,subvol=/subv_snaps",
-                },
-            ]
-        }
+        mounts = mountinfo.parse(
+            """
+32 1 0:31 /subv_snaps /snaps rw,noatime - btrfs /dev/BLOCKDEV1 rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=789,subvol=/subv_snaps
+"""
+        )
+        # Simulate that the mountinfo DOES NOT have /root and /home.
 
         with (
-            mock.patch.object(mtab_parser, "_findmnt", return_value=findmnt_json),
+            mock.patch.object(mountinfo, "entries", return_value=mounts),
             mock.patch.object(
                 rollback_btrfs, "_get_now_str", return_value="20220202220000"
             ),
@@ -14,34 +14,37 @@
 
 import logging
 import os
-import re
 import shlex
 
 from .. import global_flags
 from ..utils import os_utils
+from ..utils import snap_names
 from . import abstract_mechanism
 
 from typing import override
 
 
-def _execute_sh(cmd: str):
+def _execute_sh(cmd: str, kind: str, limits: os_utils.ProcessLimits | None = None):
     if global_flags.FLAGS.dryrun:
         os_utils.eprint("Would run " + cmd)
     else:
-        os_utils.runsh_or_error(cmd)
+        os_utils.runsh_or_error(cmd, limits=limits, kind=kind)
 
 
-def _initialize_destination(destination: str) -> None:
+def _initialize_destination(
+    destination: str, limits: os_utils.ProcessLimits | None = None
+) -> None:
     """If a previous snap is found, creates hardlinks from it and returns True."""
-    # Confirm the destination matches the required format: PREFIX + YYYYMMDDhhmmss.
+    # Confirm the destination matches the required format: PREFIX + YYYYMMDDhhmmss,
+    # optionally followed by milliseconds.
     dest_dir = os.path.basename(destination)
-    match = re.match(r"^(.*)(\d{10})$", dest_dir)
-    if not match:
+    timestr = snap_names.timestr_of(dest_dir)
+    if timestr is None:
         raise ValueError(
             "Destination directory name must match the pattern 'PREFIX + YYYYMMDDhhmmss'."
         )
 
-    prefix = match.group(1)
+    prefix = dest_dir[: -len(timestr)]
 
     # Get the parent directory path of the destination.
     parent_dir = os.path.dirname(destination)
@@ -51,20 +54,23 @@ def _initialize_destination(destination: str) -> None:
         d
         for d in os.listdir(parent_dir)
         if os.path.isdir(os.path.join(parent_dir, d))
-        and re.match(rf"^{prefix}\d{{10}}$", d)
+        and d.startswith(prefix)
+        and snap_names.timestr_of(d) == d[len(prefix) :]
     ]
 
     if not existing_dirs:
         return
 
-    # Find the lexicographically max directory (latest snapshot).
+    # Find the latest snapshot. Names in either format sort chronologically.
     latest_snapshot = max(existing_dirs)
     latest_snapshot_path = os.path.join(parent_dir, latest_snapshot)
 
     # Copy the latest snapshot recursively as hardlinks.
     logging.info(f"Found latest snapshot: {latest_snapshot}.")
     _execute_sh(
-        f"cp -al {shlex.quote(latest_snapshot_path)}/ {shlex.quote(destination)}/"
+        f"cp -al {shlex.quote(latest_snapshot_path)}/ {shlex.quote(destination)}/",
+        kind="create",
+        limits=limits,
     )
 
 
@@ -88,18 +94,39 @@ class RsyncSnapMechanism(abstract_mechanism.SnapMechanism):
                 "rsync not found, please install to create rsync snapshots"
             )
 
-        _initialize_destination(destination)
+        limits = self._options.process_limits
+        _initialize_destination(destination, limits=limits)
+        bwlimit = ""
+        if self._options.rsync_bwlimit:
+            bwlimit = f"--bwlimit={shlex.quote(self._options.rsync_bwlimit)} "
         try:
             _execute_sh(
-                f"rsync -aAXHSv --delete {shlex.quote(source)}/ {shlex.quote(destination)}"
+                f"rsync -aAXHSv --delete {bwlimit}"
+                f"{shlex.quote(source)}/ {shlex.quote(destination)}",
+                kind="create",
+                limits=limits,
             )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to create snapshot using rsync.") from exc
 
     @override
     def delete(self, destination: str):
+        self.delete_many([destination])
+
+    @override
+    def delete_many(self, destinations: list[str]):
+        if not destinations:
+            return
         try:
-            _execute_sh(f"rm -rf {shlex.quote(destination)}")
+            _execute_sh(
+                "rm -rf " + " ".join(shlex.quote(x) for x in destinations),
+                kind="delete",
+                limits=self._options.process_limits,
+            )
+        except os_utils.CommandTimeout:
+            raise
         except os_utils.CommandError as exc:
             raise RuntimeError("Unable to delete snapshot.") from exc
 
@@ -1,6 +1,8 @@
 import unittest
 from unittest import mock
 
+from ..utils import os_utils
+from . import abstract_mechanism
 from . import rsync_mechanism
 
 from typing import Any
@@ -21,7 +23,8 @@ class TestRsyncMechanism(unittest.TestCase):
         }
 
     def tearDown(self):
-        all(x.stop() for x in self._patches.values())
+        for patch in self._patches.values():
+            patch.stop()
 
     def test_invalid_destination_format(self):
         """Test if a ValueError is raised for an invalid destination format."""
@@ -51,7 +54,41 @@ class TestRsyncMechanism(unittest.TestCase):
         rsync_mechanism._initialize_destination("some/dir/prefix20250223010301")
 
         self._mocks["execute"].assert_called_with(
-            "cp -al some/dir/prefix20250223010201/ some/dir/prefix20250223010301/"
+            "cp -al some/dir/prefix20250223010201/ some/dir/prefix20250223010301/",
+            kind="create",
+            limits=None,
+        )
+
+    def test_hardlink_subsecond(self):
+        self._mocks["listdir"].return_value = [
+            "prefix20240223010101",
+            "prefix20250223010201",
+            "prefix20250223010201_500",
+            "prefix-other20250223010202",
+        ]
+
+        rsync_mechanism._initialize_destination("some/dir/prefix20250223010301_000")
+
+        self._mocks["execute"].assert_called_with(
+            "cp -al some/dir/prefix20250223010201_500/ "
+            "some/dir/prefix20250223010301_000/",
+            kind="create",
+            limits=None,
+        )
+
+    def test_create_with_limits(self):
+        limits = os_utils.ProcessLimits(nice=10)
+        mechanism = rsync_mechanism.RsyncSnapMechanism(
+            abstract_mechanism.MechanismOptions(
+                process_limits=limits, rsync_bwlimit="20M"
+            )
+        )
+        with mock.patch.object(os_utils, "command_exists", return_value=True):
+            mechanism.create("/home", "some/dir/prefix20250223010301")
+        self._mocks["execute"].assert_called_with(
+            "rsync -aAXHSv --delete --bwlimit=20M /home/ some/dir/prefix20250223010301",
+            kind="create",
+            limits=limits,
         )
 
 
@@ -12,22 +12,40 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Registry of snapshot mechanisms.
+
+A mechanism module is imported only when its snap_type is first used. This keeps the
+startup fast, e.g. for the package manager hook, which typically uses only one type.
+"""
+
 import functools
+import importlib
 
 from . import abstract_mechanism
-from . import bcachefs_mechanism
-from . import btrfs_mechanism
-from . import rsync_mechanism
 from . import snap_type_enum
 
+# Module (relative to this package) and class name of each mechanism.
+_MECHANISMS: dict[snap_type_enum.SnapType, tuple[str, str]] = {
+    snap_type_enum.SnapType.BTRFS: ("btrfs_mechanism", "BtrfsSnapMechanism"),
+    snap_type_enum.SnapType.RSYNC: ("rsync_mechanism", "RsyncSnapMechanism"),
+    snap_type_enum.SnapType.BCACHEFS: ("bcachefs_mechanism", "BcachefsSnapMechanism"),
+}
+
+
+def get(
+    snap_type: snap_type_enum.SnapType,
+    options: abstract_mechanism.MechanismOptions | None = None,
+) -> abstract_mechanism.SnapMechanism:
+    """Singleton factory implementation, with one instance per distinct options."""
+    return _get(snap_type, options or abstract_mechanism.MechanismOptions())
+
 
 @functools.cache
-def get(snap_type: snap_type_enum.SnapType) -> abstract_mechanism.SnapMechanism:
-    """Singleton factory implementation."""
-    if snap_type == snap_type_enum.SnapType.BTRFS:
-        return btrfs_mechanism.BtrfsSnapMechanism()
-    if snap_type == snap_type_enum.SnapType.RSYNC:
-        return rsync_mechanism.RsyncSnapMechanism()
-    if snap_type == snap_type_enum.SnapType.BCACHEFS:
-        return bcachefs_mechanism.BcachefsSnapMechanism()
-    raise RuntimeError(f"Unknown snap_type {snap_type}")
+def _get(
+    snap_type: snap_type_enum.SnapType, options: abstract_mechanism.MechanismOptions
+) -> abstract_mechanism.SnapMechanism:
+    if snap_type not in _MECHANISMS:
+        raise RuntimeError(f"Unknown snap_type {snap_type}")
+    module_name, class_name = _MECHANISMS[snap_type]
+    module = importlib.import_module(f".{module_name}", __package__)
+    return getattr(module, class_name)(options)
@@ -22,7 +22,14 @@ from .snapshot_logic import snap_operator
 # If set to True, yabsnap completions will print debug output.
 _DEBUG_ENV_FLAG = "YABSNAP_COMPLETION_DEBUG"
 
-_IGNORE_ARGS = {"internal-cronrun", "internal-preupdate", "-h"}
+_IGNORE_ARGS = {
+    "internal-cronrun",
+    "internal-preupdate",
+    "internal-drain",
+    "internal-cleanup",
+    "internal-schedule",
+    "-h",
+}
 
 
 def _dynamic_args(option: str, arg_index: int) -> list[str | comp_types.FileCompletion]:
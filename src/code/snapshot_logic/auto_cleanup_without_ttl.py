@@ -30,39 +30,46 @@ class DeleteLogic:
     def __init__(self, rules: list[tuple[datetime.timedelta, int]]) -> None:
         self._rules = rules
 
-    def _required_intervals(
-        self, now: datetime.datetime
-    ) -> list[tuple[datetime.datetime, datetime.datetime]]:
-        result: list[tuple[datetime.datetime, datetime.datetime]] = []
+    def _required_intervals(self, now_ts: float) -> list[tuple[float, float]]:
+        result: list[tuple[float, float]] = []
         for width, count in self._rules:
+            width_secs = width.total_seconds()
             for index in range(count):
-                result.append((now - (index + 1) * width, now - index * width))
+                result.append(
+                    (now_ts - (index + 1) * width_secs, now_ts - index * width_secs)
+                )
         return result
 
     def get_deletes(
         self, now: datetime.datetime, records: list[tuple[datetime.datetime, str]]
     ) -> Iterator[tuple[datetime.datetime, str]]:
+        # Times are compared as seconds since the epoch, which is much faster than
+        # comparing datetimes.
+        now_ts = now.timestamp()
         # We want at least one per each interval.
-        intervals = self._required_intervals(now)
+        intervals = self._required_intervals(now_ts)
 
         prev_time = None
+        prev_time_ts = 0.0
 
         for time, fname in records:
+            time_ts = time.timestamp()
             # Check that snaps passed to check are in ascending order, because this is
             # assumed in the deletion logic.
-            if prev_time is not None and prev_time > time:
+            if prev_time is not None and prev_time_ts > time_ts:
                 raise ValueError(f"Records not in order, {prev_time}, {time}")
             else:
                 prev_time = time
+                prev_time_ts = time_ts
 
             # Ensure times are in past.
-            if now < time:
+            if now_ts < time_ts:
                 raise ValueError(f"Record time is in the future, {time} > {now}")
 
             keep = False
-            remaining_intervals: list[tuple[datetime.datetime, datetime.datetime]] = []
+            remaining_intervals: list[tuple[float, float]] = []
             for interval in intervals:
-                if interval[0] < time <= interval[1]:
+                if interval[0] < time_ts <= interval[1]:
                     keep = True
                 else:
                     remaining_intervals.append(interval)
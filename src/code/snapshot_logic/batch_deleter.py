@@ -1,7 +1,7 @@
 import dataclasses
 import datetime
 import logging
-import os
+import math
 import pathlib
 from collections.abc import Iterable, Iterator
 
@@ -9,7 +9,10 @@ from .. import configs
 from .. import global_flags
 from ..mechanisms import snap_type_enum
 from ..utils import human_interval
+from ..utils import snap_names
+from . import deletion_queue
 from . import snap_holder
+from . import snap_index
 
 from typing import Any
 
@@ -24,26 +27,40 @@ class _ConfigSnapshotsRelation:
 
 def create_config_snapshots_mapping(
     configs_iter: Iterable[configs.Config],
+    *filters: "_SnapshotBaseFilter",
 ) -> Iterator[_ConfigSnapshotsRelation]:
-    """Create a configuration file and its associated snapshot relationship mapping."""
+    """Create a configuration file and its associated snapshot relationship mapping.
+
+    If filters are passed, only the snapshots within their time bounds are loaded.
+    Filters are not otherwise applied; use apply_snapshot_filters() for that.
+    """
+    # Intersection of the time bounds of all filters.
+    start: datetime.datetime | None = None
+    end: datetime.datetime | None = None
+    for snap_filter in filters:
+        this_start, this_end = snap_filter.bounds
+        if this_start is not None:
+            start = this_start if start is None else max(start, this_start)
+        if this_end is not None:
+            end = this_end if end is None else min(end, this_end)
     for config in configs_iter:
-        yield _ConfigSnapshotsRelation(config, list(_get_old_backups(config)))
+        yield _ConfigSnapshotsRelation(
+            config, list(_get_old_backups(config, start, end))
+        )
 
 
-# src/code/snap_operator.py has same function
-def _get_old_backups(config: configs.Config) -> Iterator[snap_holder.Snapshot]:
-    """Returns existing backups in chronological order."""
-    destdir = os.path.dirname(config.dest_prefix)
-    for fname in os.listdir(destdir):
-        pathname = os.path.join(destdir, fname)
-        if not os.path.isdir(pathname):
-            continue
-        if not pathname.startswith(config.dest_prefix):
-            continue
+# src/code/snap_operator.py has similar function
+def _get_old_backups(
+    config: configs.Config,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> Iterator[snap_holder.Snapshot]:
+    """Returns existing backups with start <= time < end, in chronological order."""
+    for entry in snap_index.get(config.dest_prefix).between(start, end):
         try:
-            yield snap_holder.Snapshot(pathname)
+            yield entry.snapshot(config.mechanism_options)
         except ValueError:
-            logging.warning(f"Could not parse timestamp, ignoring: {pathname}")
+            logging.warning(f"Could not parse timestamp, ignoring: {entry.pathname}")
 
 
 def get_filters(args: dict[str, Any]) -> Iterator["_SnapshotBaseFilter"]:
@@ -62,6 +79,11 @@ class _SnapshotBaseFilter:
 
     def __init__(self, **kwargs): ...
 
+    @property
+    def bounds(self) -> tuple[datetime.datetime | None, datetime.datetime | None]:
+        """The (start, end) time range this filter restricts to; None if unbounded."""
+        return None, None
+
     def __call__(self, snap: snap_holder.Snapshot) -> bool:
         raise NotImplementedError
 
@@ -87,16 +109,21 @@ class _TimeScopeFilter(_SnapshotBaseFilter):  # pyright: ignore[reportUnusedClas
     arg_name_set = ("start", "end")
 
     def __init__(self, *, start: str = "", end: str = ""):
-        self._start_datetime = (
-            _parse_iso8601_datetime(start) if start else datetime.datetime.min
-        )
-        self._end_datetime = (
-            _parse_iso8601_datetime(end) if end else datetime.datetime.max
-        )
+        self._start = _parse_iso8601_datetime(start) if start else None
+        self._end = _parse_iso8601_datetime(end) if end else None
+        self._start_datetime = self._start or datetime.datetime.min
+        self._end_datetime = self._end or datetime.datetime.max
+        # For fast comparison with Snapshot.epoch.
+        self._start_ts = self._start.timestamp() if self._start else -math.inf
+        self._end_ts = self._end.timestamp() if self._end else math.inf
         logging.info(
             f"Added _TimeScopeFilter: ({self._start_datetime}, {self._end_datetime})"
         )
 
+    @property
+    def bounds(self) -> tuple[datetime.datetime | None, datetime.datetime | None]:
+        return self._start, self._end
+
     @property
     def start_datetime(self) -> datetime.datetime:
         return self._start_datetime
@@ -106,7 +133,7 @@ class _TimeScopeFilter(_SnapshotBaseFilter):  # pyright: ignore[reportUnusedClas
         return self._end_datetime
 
     def __call__(self, snap: snap_holder.Snapshot) -> bool:
-        return self._start_datetime <= snap.snaptime < self._end_datetime
+        return self._start_ts <= snap.epoch < self._end_ts
 
 
 def apply_snapshot_filters(
@@ -135,7 +162,7 @@ def show_snapshots_to_be_deleted(
 def _list_snapshots(
     config_snaps_mapping: Iterable[_ConfigSnapshotsRelation],
 ):
-    now = datetime.datetime.now()
+    now = datetime.datetime.now().timestamp()
 
     for mapping in config_snaps_mapping:
         if not mapping.snaps:
@@ -147,7 +174,7 @@ def _list_snapshots(
 
         for snap in mapping.snaps:
             columns = []
-            snap_timestamp = snap.snaptime.strftime(global_flags.TIME_FORMAT)
+            snap_timestamp = snap.target.removeprefix(mapping.config.dest_prefix)
             columns.append(f"  {snap_timestamp}")
 
             trigger_str = "".join(
@@ -155,7 +182,7 @@ def _list_snapshots(
             )
             columns.append(trigger_str)
 
-            elapsed = (now - snap.snaptime).total_seconds()
+            elapsed = now - snap.epoch
             elapsed_str = f"({human_interval.humanize(elapsed)} ago)"
             columns.append(f"{elapsed_str:<20}")
             columns.append(snap.metadata.comment)
@@ -165,8 +192,9 @@ def _list_snapshots(
 
 
 def delete_snapshots(snaps: Iterable[snap_holder.Snapshot]):
-    for snap in snaps:
-        snap.delete()
+    # Through the deletion queue, so that an interrupted batch is resumed by the
+    # background worker.
+    deletion_queue.delete_now(snaps)
 
 
 def get_to_sync_list(configs: Iterable[configs.Config]) -> list[configs.Config]:
@@ -186,10 +214,7 @@ def _parse_iso8601_datetime(datetime_str: str) -> datetime.datetime:
     # Quickly verify whether the format specifications are met and return a result promptly.
     # Otherwise, continue with the verification process.
     try:
-        valid_datetime_format = datetime.datetime.strptime(
-            datetime_str, global_flags.TIME_FORMAT
-        )
-        return valid_datetime_format
+        return snap_names.parse(datetime_str)
     except ValueError:
         pass
 
@@ -198,7 +223,8 @@ def _parse_iso8601_datetime(datetime_str: str) -> datetime.datetime:
     except ValueError:
         raise ValueError(
             "Suffix only accepts the following formats:\n"
-            "  1. %Y%m%d%H%M%S (e.g. 20241101201015)\n"
+            "  1. %Y%m%d%H%M%S, optionally with milliseconds (e.g. 20241101201015 or "
+            "20241101201015_123)\n"
             "  2. ISO 8601 compliant timestamp string (e.g. 2024-11-01_20:10:15)"
         ) from None
 
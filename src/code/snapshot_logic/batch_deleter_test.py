@@ -36,6 +36,11 @@ class TestParseISO8601Datetime(unittest.TestCase):
 
         self.assertEqual(datetime_strings, excepted_results)
 
+        self.assertEqual(
+            batch_deleter._parse_iso8601_datetime("20241101201015_500"),
+            datetime.datetime(2024, 11, 1, 20, 10, 15, microsecond=500_000),
+        )
+
     def test_invalid_datetime_format(self):
         datetime_strings = [
             "2024-11-01 20-10-15",
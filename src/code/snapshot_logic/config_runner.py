@@ -0,0 +1,73 @@
+"""Runs an operation on several configs concurrently.
+
+Configs whose snapshots are on the same filesystem are run one after another, in the
+order given, since they compete for the same disk. Configs on different filesystems
+run in parallel, e.g. so that a slow rsync to a backup disk does not delay the btrfs
+snapshots of the root filesystem. At most global_flags.FLAGS.io_threads filesystems are
+worked on at a time.
+
+An exception in one config is logged and recorded in its result, and does not stop the
+other configs. This includes SystemExit from os_utils.fatal_error(), e.g. if the
+destination of a config does not exist.
+"""
+
+import dataclasses
+import logging
+from collections.abc import Callable, Iterable
+
+from .. import configs
+from ..utils import os_utils
+from ..utils import thread_pool
+
+
+@dataclasses.dataclass
+class Result[R]:
+    config: configs.Config
+    # Return value of the operation; None if it failed.
+    value: R | None = None
+    error: Exception | SystemExit | None = None
+
+
+def _filesystem_key(config: configs.Config) -> str:
+    # Fall back to the path, so that configs which cannot be resolved run in parallel
+    # only with other filesystems, and fail on their own.
+    return os_utils.get_filesystem_uuid(config.mount_path) or config.mount_path
+
+
+def run[R](
+    fn: Callable[[configs.Config], R],
+    configs_iter: Iterable[configs.Config],
+    *,
+    by_filesystem: bool = True,
+) -> list[Result[R]]:
+    """Returns the results of fn on each config, in the order of configs.
+
+    Args:
+      fn: Operation to run. Must be thread safe.
+      configs_iter: Configs to run fn on.
+      by_filesystem: If False, all configs may run in parallel, e.g. for operations
+        which are cheap for the disk, like creating btrfs snapshots.
+    """
+    configs_list = list(configs_iter)
+    groups: dict[str, list[int]] = {}
+    for index, config in enumerate(configs_list):
+        key = _filesystem_key(config) if by_filesystem else str(index)
+        groups.setdefault(key, []).append(index)
+
+    results: list[Result[R]] = [Result(config) for config in configs_list]
+
+    def run_group(indices: list[int]) -> None:
+        for index in indices:
+            result = results[index]
+            try:
+                result.value = fn(result.config)
+            except SystemExit as exc:
+                # The message was already shown by fatal_error().
+                logging.error(f"Failed for {result.config.config_file}")
+                result.error = exc
+            except Exception as exc:
+                logging.exception(f"Failed for {result.config.config_file}")
+                result.error = exc
+
+    thread_pool.map_ordered(run_group, groups.values())
+    return results
@@ -0,0 +1,75 @@
+import collections
+import threading
+import unittest
+from unittest import mock
+
+from .. import configs
+from . import config_runner
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+def _config(name: str, destdir: str) -> configs.Config:
+    return configs.Config(
+        config_file=name, source="/", dest_prefix=f"/{destdir}/@{name}-"
+    )
+
+
+class ConfigRunnerTest(unittest.TestCase):
+    def test_run(self):
+        all_configs = [
+            _config("a", "fs1"),
+            _config("b", "fs2"),
+            _config("c", "fs1"),
+            _config("d", "fs3"),
+        ]
+        lock = threading.Lock()
+        # Configs running on each filesystem.
+        in_flight: collections.Counter[str] = collections.Counter()
+        d_started = threading.Event()
+
+        def operate(config: configs.Config) -> str:
+            with lock:
+                in_flight[config.mount_path] += 1
+                self.assertEqual(in_flight[config.mount_path], 1)
+            try:
+                if config.config_file == "d":
+                    d_started.set()
+                    raise RuntimeError("Failed")
+                if config.config_file == "b":
+                    # Only returns if filesystems are run in parallel.
+                    self.assertTrue(d_started.wait(timeout=5))
+                return config.config_file.upper()
+            finally:
+                with lock:
+                    in_flight[config.mount_path] -= 1
+
+        with (
+            mock.patch.object(
+                config_runner, "_filesystem_key", lambda config: config.mount_path
+            ),
+            self.assertLogs(level="ERROR"),
+        ):
+            results = config_runner.run(operate, all_configs)
+
+        self.assertEqual([x.config for x in results], all_configs)
+        self.assertEqual([x.value for x in results], ["A", "B", "C", None])
+        self.assertIsInstance(results[-1].error, RuntimeError)
+
+    def test_fatal_error(self):
+        def operate(config: configs.Config) -> str:
+            if config.config_file == "a":
+                raise SystemExit(1)
+            return config.config_file.upper()
+
+        with self.assertLogs(level="ERROR"):
+            results = config_runner.run(
+                operate, [_config("a", "fs1"), _config("b", "fs1")]
+            )
+        self.assertIsInstance(results[0].error, SystemExit)
+        self.assertEqual(results[1].value, "B")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Cleanup after the package manager hook, done in a detached process.
+
+The pre-transaction hook blocks the package transaction. With --defer-cleanup, it only
+creates the new snapshots, queues the old ones for deletion, and calls spawn(). The
+spawned `yabsnap internal-cleanup` process then deletes the queued snapshots, and runs
+the post hooks of the configs, while the transaction proceeds. Like the drain service,
+it runs at idle IO priority, and its output goes to the journal.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from collections.abc import Iterable
+
+from .. import configs
+from .. import global_flags
+from ..utils import os_utils
+from . import deletion_queue
+
+# As IOSchedulingClass= of yabsnap-drain.service.
+_LIMITS = os_utils.ProcessLimits(ionice_class="idle")
+# Identifier of the output in the journal, e.g. `journalctl -t yabsnap-cleanup`.
+_JOURNAL_ID = "yabsnap-cleanup"
+
+
+def run(config_files: Iterable[str]) -> list[configs.Config]:
+    """Deletes queued snapshots, then runs the post hooks of config_files.
+
+    The post hooks are run even if the deletion fails.
+
+    Returns:
+      The configs of config_files.
+    """
+    configs_list = [configs.Config.from_configfile(x) for x in config_files]
+    try:
+        deletion_queue.drain(blocking=True)
+    finally:
+        for config in configs_list:
+            config.call_post_hooks()
+    return configs_list
+
+
+def spawn(config_files: list[str], flags: list[str]) -> None:
+    """Runs run() in a detached process, and returns immediately.
+
+    Args:
+      config_files: Configs to run the post hooks of.
+      flags: Global command line flags of the caller, e.g. ["--verbose"], to apply to
+        the process.
+    """
+    if global_flags.FLAGS.dryrun:
+        run(config_files)
+        return
+    # The directory containing the code package, as in yabsnap.sh.
+    package_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    args = _LIMITS.wrap(
+        [
+            sys.executable,
+            "-u",
+            "-m",
+            "code.main",
+            *flags,
+            "internal-cleanup",
+            *config_files,
+        ]
+    )
+    if shutil.which("systemd-cat") is None:
+        logging.warning("systemd-cat not found, output of the cleanup will be lost")
+    else:
+        args = ["systemd-cat", "-t", _JOURNAL_ID, *args]
+    logging.info(f"Starting {' '.join(args)}")
+    subprocess.Popen(
+        args,
+        cwd=package_dir,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Not killed with the hook, and does not hold its output open. The output is
+        # sent to the journal by systemd-cat.
+        start_new_session=True,
+    )
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+from .. import configs
+from . import deferred_cleanup
+from . import deletion_queue
+
+
+class DeferredCleanupTest(unittest.TestCase):
+    def test_run(self):
+        calls: list[str] = []
+        with (
+            mock.patch.object(
+                deletion_queue,
+                "drain",
+                side_effect=lambda blocking: calls.append(f"drain {blocking}"),
+            ),
+            mock.patch.object(
+                configs.Config,
+                "from_configfile",
+                side_effect=lambda fname: configs.Config(fname, "", ""),
+            ),
+            mock.patch.object(
+                configs.Config,
+                "call_post_hooks",
+                autospec=True,
+                side_effect=lambda config: calls.append(config.config_file),
+            ),
+        ):
+            cleaned = deferred_cleanup.run(["a.conf", "b.conf"])
+        # Post hooks run after the deletions.
+        self.assertEqual(calls, ["drain True", "a.conf", "b.conf"])
+        self.assertEqual([x.config_file for x in cleaned], ["a.conf", "b.conf"])
+
+    def test_run_drain_fails(self):
+        with (
+            mock.patch.object(
+                deletion_queue, "drain", side_effect=RuntimeError("Failed")
+            ),
+            mock.patch.object(
+                configs.Config,
+                "from_configfile",
+                side_effect=lambda fname: configs.Config(fname, "", ""),
+            ),
+            mock.patch.object(configs.Config, "call_post_hooks") as mock_post_hooks,
+            self.assertRaises(RuntimeError),
+        ):
+            deferred_cleanup.run(["a.conf", "b.conf"])
+        # The post hooks still run.
+        self.assertEqual(mock_post_hooks.call_count, 2)
+
+    def test_spawn(self):
+        with (
+            mock.patch.object(deferred_cleanup.subprocess, "Popen") as mock_popen,
+            mock.patch.object(
+                deferred_cleanup.shutil, "which", return_value="/usr/bin/systemd-cat"
+            ),
+        ):
+            deferred_cleanup.spawn(["a.conf"], ["--verbose", "--sync"])
+        mock_popen.assert_called_once()
+        args = mock_popen.call_args.args[0]
+        # Runs with the flags of the caller, at idle IO priority, logging to the
+        # journal.
+        self.assertEqual(
+            args,
+            [
+                "systemd-cat",
+                "-t",
+                "yabsnap-cleanup",
+                "ionice",
+                "-c",
+                "3",
+                sys.executable,
+                "-u",
+                "-m",
+                "code.main",
+                "--verbose",
+                "--sync",
+                "internal-cleanup",
+                "a.conf",
+            ],
+        )
+        kwargs = mock_popen.call_args.kwargs
+        self.assertTrue(kwargs["start_new_session"])
+        self.assertTrue(os.path.isdir(os.path.join(kwargs["cwd"], "code")))
+
+
+if __name__ == "__main__":
+    unittest.main()
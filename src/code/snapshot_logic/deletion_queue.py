@@ -0,0 +1,248 @@
+"""Durable queue of snapshots to delete in the background.
+
+With defer_deletion in a config, snapshots that expire are queued here instead of being
+deleted inline, so that the package manager hook or scheduled run does not wait for
+the deletion. The queue is drained by `yabsnap internal-drain`, which is started by
+yabsnap-drain.path whenever the queue is not empty, at idle IO priority.
+
+Each queued snapshot is a file in _QUEUE_DIR, written atomically. It is removed only
+after the snapshot is deleted, so an interrupted drain resumes where it left off.
+
+If a snapshot cannot be deleted, its entry is renamed to *.failed, so that it no longer
+triggers yabsnap-drain.path, and is retried by a later drain with exponential backoff.
+Entries which cannot be read are renamed to *.corrupt, and left for the user.
+"""
+
+import contextlib
+import dataclasses
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Generator, Iterable
+
+from .. import global_flags
+from ..mechanisms import abstract_mechanism
+from ..utils import dataclass_loader
+from ..utils import os_utils
+from . import snap_holder
+
+_QUEUE_DIR = "/var/lib/yabsnap/deletion-queue"
+_LOCK_FILE = ".lock"
+_QUEUED_SUFFIX = ".json"
+_FAILED_SUFFIX = ".failed"
+_CORRUPT_SUFFIX = ".corrupt"
+# A failed entry is retried after this long, doubled after each failure up to the max.
+_RETRY_SECS = 10 * 60.0
+_MAX_RETRY_SECS = 24 * 60 * 60.0
+# Snapshots deleted with one call to the mechanism. Entries are removed after each
+# batch.
+_BATCH_SIZE = 32
+
+
+@dataclasses.dataclass
+class _Entry:
+    target: str
+    mechanism_options: abstract_mechanism.MechanismOptions
+    # Seconds since the epoch, when the snapshot was queued.
+    queued: float
+    # Number of drains which failed to delete the snapshot.
+    attempts: int = 0
+    # Seconds since the epoch, before which a failed entry is not retried.
+    retry_after: float = 0.0
+
+
+def _entry_fname(target: str) -> str:
+    digest = hashlib.sha256(os.fsencode(target)).hexdigest()
+    return os.path.join(_QUEUE_DIR, digest[:32] + _QUEUED_SUFFIX)
+
+
+def _with_suffix(fname: str, suffix: str) -> str:
+    return os.path.splitext(fname)[0] + suffix
+
+
+def _write_entry(entry: _Entry, fname: str) -> None:
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(dataclasses.asdict(entry), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_fname, fname)
+
+
+def _read_entries(
+    suffix: str = _QUEUED_SUFFIX, quarantine: bool = False
+) -> list[tuple[str, _Entry]]:
+    """Returns (filename, entry) for all entries with suffix, oldest first.
+
+    Args:
+      suffix: Suffix of the entries to read, e.g. _FAILED_SUFFIX.
+      quarantine: If True, rename entries which cannot be read to *.corrupt.
+    """
+    result: list[tuple[str, _Entry]] = []
+    try:
+        it = os.scandir(_QUEUE_DIR)
+    except FileNotFoundError:
+        return result
+    with it:
+        for dir_entry in it:
+            if not dir_entry.name.endswith(suffix):
+                continue
+            try:
+                with open(dir_entry.path) as f:
+                    entry = dataclass_loader.load_dataclass(_Entry, json.load(f))
+            except (OSError, ValueError, TypeError) as exc:
+                if not quarantine:
+                    logging.warning(
+                        f"Ignoring corrupt queue entry {dir_entry.path}: {exc}"
+                    )
+                    continue
+                corrupt_fname = _with_suffix(dir_entry.path, _CORRUPT_SUFFIX)
+                logging.error(
+                    f"Moving corrupt queue entry {dir_entry.path} to {corrupt_fname}:"
+                    f" {exc}"
+                )
+                os.replace(dir_entry.path, corrupt_fname)
+                continue
+            result.append((dir_entry.path, entry))
+    result.sort(key=lambda x: (x[1].queued, x[1].target))
+    return result
+
+
+def pending_targets() -> set[str]:
+    """Returns the snapshots queued for deletion, excluding failed ones."""
+    return {entry.target for _, entry in _read_entries()}
+
+
+def enqueue(snaps: Iterable[snap_holder.Snapshot]) -> None:
+    """Queues snapshots, to be deleted by drain()."""
+    snaps = list(snaps)
+    if global_flags.FLAGS.dryrun:
+        for snap in snaps:
+            os_utils.eprint(f"Would queue deletion of {snap.target}")
+        return
+    if not snaps:
+        return
+    os.makedirs(_QUEUE_DIR, mode=0o700, exist_ok=True)
+    now = time.time()
+    for snap in snaps:
+        logging.info(f"Queued for deletion: {snap.target}")
+        _write_entry(
+            _Entry(
+                target=snap.target,
+                mechanism_options=snap.mechanism_options,
+                queued=now,
+            ),
+            _entry_fname(snap.target),
+        )
+
+
+@contextlib.contextmanager
+def _locked(*, blocking: bool) -> Generator[bool]:
+    """Holds the queue lock. Yields False if it could not be acquired."""
+    try:
+        fd = os.open(
+            os.path.join(_QUEUE_DIR, _LOCK_FILE), os.O_CREAT | os.O_RDWR, 0o600
+        )
+    except FileNotFoundError:
+        # Nothing was ever queued.
+        yield False
+        return
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def _revive_failed(now: float) -> None:
+    """Queues the failed entries which are due to be retried."""
+    for fname, entry in _read_entries(_FAILED_SUFFIX, quarantine=True):
+        if entry.retry_after <= now:
+            logging.info(f"Retrying deletion of {entry.target}")
+            os.replace(fname, _with_suffix(fname, _QUEUED_SUFFIX))
+
+
+def _mark_failed(fname: str, entry: _Entry, now: float) -> None:
+    """Moves an entry out of the queue, to be retried later."""
+    entry.attempts += 1
+    retry_secs = min(_RETRY_SECS * 2 ** (entry.attempts - 1), _MAX_RETRY_SECS)
+    entry.retry_after = now + retry_secs
+    logging.error(
+        f"Failed to delete {entry.target} ({entry.attempts} attempts);"
+        f" will retry after {retry_secs:0.0f}s"
+    )
+    _write_entry(entry, _with_suffix(fname, _FAILED_SUFFIX))
+    os.remove(fname)
+
+
+def drain(*, blocking: bool = False, targets: set[str] | None = None) -> None:
+    """Deletes queued snapshots.
+
+    A batch which fails does not stop the others. Its remaining snapshots are moved out
+    of the queue, to be retried later.
+
+    Args:
+      blocking: If another drain is running, wait for it instead of returning.
+      targets: If set, only delete these queued snapshots, and leave the others.
+
+    Raises:
+      RuntimeError: If any snapshot could not be deleted.
+    """
+    with _locked(blocking=blocking) as locked:
+        if not locked:
+            logging.info("Deletion queue is empty, or being drained by another process")
+            return
+        dryrun = global_flags.FLAGS.dryrun
+        if not dryrun:
+            _revive_failed(time.time())
+        entries = _read_entries(quarantine=not dryrun)
+        if targets is not None:
+            entries = [x for x in entries if x[1].target in targets]
+        num_failed = 0
+        for start in range(0, len(entries), _BATCH_SIZE):
+            batch = entries[start : start + _BATCH_SIZE]
+            all_snaps = [
+                snap_holder.Snapshot(
+                    entry.target, mechanism_options=entry.mechanism_options
+                )
+                for _, entry in batch
+            ]
+            failed = False
+            try:
+                # E.g. deleted by an earlier drain, which was interrupted before the
+                # metadata was deleted.
+                snap_holder.Snapshot.delete_orphan_metadata(all_snaps)
+                snaps = [x for x in all_snaps if os.path.lexists(x.target)]
+                snap_holder.Snapshot.delete_many(snaps)
+            except Exception as exc:
+                logging.error(f"Failed to delete queued snapshots: {exc!r}")
+                failed = True
+            if dryrun:
+                continue
+            now = time.time()
+            for fname, entry in batch:
+                if not os.path.lexists(entry.target):
+                    os.remove(fname)
+                elif failed:
+                    _mark_failed(fname, entry, now)
+                    num_failed += 1
+        if num_failed:
+            raise RuntimeError(f"Failed to delete {num_failed} queued snapshots")
+
+
+def delete_now(snaps: Iterable[snap_holder.Snapshot]) -> None:
+    """Deletes snapshots through the queue, so that an interruption can be resumed."""
+    if global_flags.FLAGS.dryrun:
+        snap_holder.Snapshot.delete_many(snaps)
+        return
+    snaps = list(snaps)
+    enqueue(snaps)
+    # Snapshots queued by others, e.g. with defer_deletion, are left to their drain.
+    drain(blocking=True, targets={x.target for x in snaps})
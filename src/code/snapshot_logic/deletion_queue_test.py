@@ -0,0 +1,169 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ..mechanisms import abstract_mechanism
+from . import deletion_queue
+from . import snap_holder
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class DeletionQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+        patcher = mock.patch.object(
+            deletion_queue, "_QUEUE_DIR", os.path.join(self._dir, "queue")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._snaps: list[snap_holder.Snapshot] = []
+        for k in range(5):
+            target = os.path.join(self._dir, f"@root-2025010100000{k}")
+            os.mkdir(target)
+            self._snaps.append(
+                snap_holder.Snapshot(
+                    target,
+                    mechanism_options=abstract_mechanism.MechanismOptions(
+                        btrfs_engine="ioctl"
+                    ),
+                )
+            )
+
+    def _fake_delete_many(self, fail_after: int | None = None):
+        """Returns a fake Snapshot.delete_many(), which removes the directories."""
+
+        def delete_many(snaps: list[snap_holder.Snapshot]):
+            for index, snap in enumerate(snaps):
+                if index == fail_after:
+                    raise RuntimeError("Interrupted")
+                self.assertEqual(snap.mechanism_options.btrfs_engine, "ioctl")
+                os.rmdir(snap.target)
+
+        return delete_many
+
+    def test_enqueue_and_drain(self):
+        self.assertEqual(deletion_queue.pending_targets(), set())
+        # Draining an empty queue is a no-op.
+        deletion_queue.drain()
+
+        deletion_queue.enqueue(self._snaps[:3])
+        self.assertEqual(
+            deletion_queue.pending_targets(), {x.target for x in self._snaps[:3]}
+        )
+
+        with mock.patch.object(
+            snap_holder.Snapshot,
+            "delete_many",
+            side_effect=self._fake_delete_many(),
+        ) as mock_delete_many:
+            deletion_queue.drain()
+        mock_delete_many.assert_called_once()
+        self.assertEqual(deletion_queue.pending_targets(), set())
+        self.assertEqual(
+            [os.path.exists(x.target) for x in self._snaps],
+            [False, False, False, True, True],
+        )
+
+    def test_failed_batch(self):
+        with (
+            mock.patch.object(deletion_queue, "_BATCH_SIZE", 2),
+            mock.patch.object(
+                snap_holder.Snapshot,
+                "delete_many",
+                side_effect=self._fake_delete_many(fail_after=1),
+            ),
+            mock.patch.object(deletion_queue.time, "time", return_value=1000.0),
+            self.assertLogs(level="ERROR"),
+            self.assertRaises(RuntimeError),
+        ):
+            deletion_queue.delete_now(self._snaps)
+        # Later batches are still deleted.
+        self.assertEqual(
+            [os.path.exists(x.target) for x in self._snaps],
+            [False, True, False, True, False],
+        )
+        # Failed entries leave the queue, so that they do not trigger the drain.
+        self.assertEqual(deletion_queue.pending_targets(), set())
+        failed = deletion_queue._read_entries(deletion_queue._FAILED_SUFFIX)
+        self.assertEqual(
+            [x.target for _, x in failed], [x.target for x in self._snaps[1:4:2]]
+        )
+        self.assertEqual([x.attempts for _, x in failed], [1, 1])
+        self.assertEqual(
+            [x.retry_after for _, x in failed],
+            [1000.0 + deletion_queue._RETRY_SECS] * 2,
+        )
+
+        with mock.patch.object(
+            snap_holder.Snapshot, "delete_many", side_effect=self._fake_delete_many()
+        ) as mock_delete_many:
+            # Not retried before the backoff.
+            with mock.patch.object(deletion_queue.time, "time", return_value=1001.0):
+                deletion_queue.drain()
+            mock_delete_many.assert_not_called()
+            with mock.patch.object(
+                deletion_queue.time,
+                "time",
+                return_value=1000.0 + deletion_queue._RETRY_SECS,
+            ):
+                deletion_queue.drain()
+        self.assertFalse(any(os.path.exists(x.target) for x in self._snaps))
+        self.assertEqual(os.listdir(deletion_queue._QUEUE_DIR), [".lock"])
+
+    def test_corrupt_entry(self):
+        deletion_queue.enqueue(self._snaps[:1])
+        corrupt_fname = os.path.join(deletion_queue._QUEUE_DIR, "corrupt.json")
+        with open(corrupt_fname, "w") as f:
+            f.write("{")
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(deletion_queue.pending_targets(), {self._snaps[0].target})
+        with (
+            mock.patch.object(
+                snap_holder.Snapshot,
+                "delete_many",
+                side_effect=self._fake_delete_many(),
+            ),
+            self.assertLogs(level="ERROR"),
+        ):
+            deletion_queue.drain()
+        self.assertEqual(
+            sorted(os.listdir(deletion_queue._QUEUE_DIR)), [".lock", "corrupt.corrupt"]
+        )
+
+    def test_already_deleted(self):
+        deletion_queue.enqueue(self._snaps[:1])
+        # Interrupted after deleting the snapshot, but before its metadata.
+        metadata_fname = self._snaps[0].target + "-meta.json"
+        with open(metadata_fname, "w") as f:
+            f.write("{}")
+        os.rmdir(self._snaps[0].target)
+        with mock.patch.object(snap_holder.Snapshot, "delete_many") as mock_delete:
+            deletion_queue.drain()
+        mock_delete.assert_called_once_with([])
+        self.assertEqual(deletion_queue.pending_targets(), set())
+        self.assertFalse(os.path.exists(metadata_fname))
+
+    def test_delete_now_leaves_other_entries(self):
+        deletion_queue.enqueue(self._snaps[:2])
+        with mock.patch.object(
+            snap_holder.Snapshot, "delete_many", side_effect=self._fake_delete_many()
+        ):
+            deletion_queue.delete_now(self._snaps[2:3])
+        self.assertEqual(
+            deletion_queue.pending_targets(), {x.target for x in self._snaps[:2]}
+        )
+        self.assertEqual(
+            [os.path.exists(x.target) for x in self._snaps],
+            [True, True, False, True, True],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
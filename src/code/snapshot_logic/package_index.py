@@ -0,0 +1,115 @@
+"""Index of the pre-install snapshots taken before each package changed.
+
+The pacman hook records the packages of the transaction in the metadata of the snapshot
+it takes. Finding the snapshots before a package changed would then need the metadata
+of every snapshot. Instead, this index maps each package name to the names of those
+snapshots, in chronological order.
+
+The index is derived from the snapshot catalog, and stored next to it, e.g.
+/.snapshots/.yabsnap/packages.json. Like the catalog, it records the stamp of the
+destination directory, and is rebuilt from the catalog if any snapshot was created or
+deleted since it was written.
+"""
+
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+
+from .. import global_flags
+from ..utils import dataclass_loader
+from ..utils import snap_names
+from . import snap_catalog
+
+_INDEX_FILE = "packages.json"
+# Increase if the file format changes; older indices will be rebuilt.
+_INDEX_VERSION = 1
+
+
+@dataclasses.dataclass
+class _Index:
+    version: int
+    # The (st_mtime_ns, st_size, st_nlink) of the destination directory.
+    stamp: tuple[int, int, int]
+    # Package name -> names of the snapshots taken before it changed, sorted by time.
+    packages: dict[str, list[str]]
+
+
+# In-process cache of indices, by destination directory.
+_loaded: dict[str, _Index] = {}
+
+
+def _dir_stamp(destdir: str) -> tuple[int, int, int]:
+    st = os.stat(destdir)
+    return st.st_mtime_ns, st.st_size, st.st_nlink
+
+
+def _index_path(destdir: str) -> str:
+    return os.path.join(destdir, snap_catalog.CATALOG_DIR, _INDEX_FILE)
+
+
+def _timestr(name: str) -> str:
+    return snap_names.timestr_of(name) or ""
+
+
+def _read(destdir: str) -> _Index | None:
+    try:
+        with open(_index_path(destdir)) as f:
+            index = dataclass_loader.load_dataclass(_Index, json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError) as exc:
+        logging.info(f"Ignoring package index in {destdir}: {exc}")
+        return None
+    if index.version != _INDEX_VERSION:
+        return None
+    return index
+
+
+def _build(entries: dict[str, snap_catalog.MetadataJson]) -> dict[str, list[str]]:
+    packages: dict[str, list[str]] = {}
+    for name, metadata_json in entries.items():
+        if metadata_json is None:
+            continue
+        for package in metadata_json.get("packages", []):
+            packages.setdefault(package, []).append(name)
+    # Names in a directory may have different prefixes; order by their timestamps.
+    for names in packages.values():
+        names.sort(key=lambda name: (_timestr(name), name))
+    return packages
+
+
+def _rebuild(destdir: str) -> _Index:
+    logging.info(f"Rebuilding package index for {destdir}")
+    entries = snap_catalog.load(destdir)
+    # Taken after loading the catalog, which may create the catalog directory.
+    index = _Index(
+        version=_INDEX_VERSION, stamp=_dir_stamp(destdir), packages=_build(entries)
+    )
+    if global_flags.FLAGS.dryrun:
+        return index
+    fname = _index_path(destdir)
+    try:
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(os.path.dirname(fname))
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(dataclasses.asdict(index), f, separators=(",", ":"))
+        os.replace(tmp_fname, fname)
+    except OSError as exc:
+        # E.g. a non-root user listing snapshots.
+        logging.info(f"Cannot save package index in {destdir}: {exc}")
+    return index
+
+
+def snapshots_before(destdir: str, package: str) -> list[str]:
+    """Returns names of snapshots taken before package changed, sorted by time."""
+    stamp = _dir_stamp(destdir)
+    index = _loaded.get(destdir)
+    if index is None or index.stamp != stamp:
+        index = _read(destdir)
+        if index is None or index.stamp != stamp:
+            index = _rebuild(destdir)
+        _loaded[destdir] = index
+    return index.packages.get(package, [])
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+
+from . import package_index
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class PackageIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+
+    def _add_snap(self, name: str, packages: list[str] | None = None):
+        os.mkdir(os.path.join(self._dir, name))
+        metadata = {"source": "/", "trigger": "I"}
+        if packages is not None:
+            metadata["packages"] = packages  # type: ignore
+        with open(os.path.join(self._dir, name + "-meta.json"), "w") as f:
+            json.dump(metadata, f)
+
+    def test_snapshots_before(self):
+        self._add_snap("@root-20250102000000", ["linux", "glibc"])
+        self._add_snap("@root-x-20250101000000", ["linux"])
+        self._add_snap("@root-20250103000000")
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "linux"),
+            ["@root-x-20250101000000", "@root-20250102000000"],
+        )
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "glibc"),
+            ["@root-20250102000000"],
+        )
+        self.assertEqual(package_index.snapshots_before(self._dir, "vim"), [])
+        self.assertTrue(os.path.isfile(package_index._index_path(self._dir)))
+
+        # Reloaded from the file.
+        package_index._loaded.clear()
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "glibc"),
+            ["@root-20250102000000"],
+        )
+
+    def test_invalidation(self):
+        self._add_snap("@root-20250102000000", ["linux"])
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "linux"),
+            ["@root-20250102000000"],
+        )
+
+        self._add_snap("@root-20250104000000", ["linux"])
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "linux"),
+            ["@root-20250102000000", "@root-20250104000000"],
+        )
+
+        # A corrupt index is rebuilt.
+        package_index._loaded.clear()
+        with open(package_index._index_path(self._dir), "w") as f:
+            f.write("{")
+        self.assertEqual(
+            package_index.snapshots_before(self._dir, "linux"),
+            ["@root-20250102000000", "@root-20250104000000"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""State of the scheduled run of each config, to skip runs with nothing due.
+
+A scheduled run normally checks the volume, lists all snapshots and reads their
+metadata, only to find in most runs that nothing is due. After each run, the state file
+records when the run next has work: the next trigger time, or the earliest TTL expiry
+among the snapshots, whichever is first. A run before that time exits after reading
+the state, and a stat of the config file and of the destination directory.
+
+The state is stored next to the snapshot catalog, e.g.
+/.snapshots/.yabsnap/schedule-<hash>.json. It records the stamps of the config file and
+of the destination directory, and is ignored if either changed, e.g. if a snapshot was
+created or deleted by any means, or if the config was edited. Changes to the metadata
+of existing snapshots, e.g. by set-ttl, do not change these; so they call invalidate().
+"""
+
+import contextlib
+import dataclasses
+import glob
+import hashlib
+import json
+import logging
+import os
+
+from .. import configs
+from .. import global_flags
+from ..utils import dataclass_loader
+from . import snap_catalog
+
+# Increase if the file format or the scheduling logic changes; older states are
+# ignored.
+_STATE_VERSION = 1
+_STATE_PREFIX = "schedule-"
+
+
+@dataclasses.dataclass
+class _State:
+    version: int
+    # The (st_mtime_ns, st_size, st_ino) of the config file.
+    config_stamp: tuple[int, int, int]
+    # The (st_mtime_ns, st_size, st_nlink) of the destination directory.
+    dir_stamp: tuple[int, int, int]
+    # Timestamp of the latest scheduled snapshot, for information.
+    last_scheduled: float | None
+    # Timestamp after which the next scheduled snapshot is due.
+    next_trigger: float
+    # Earliest expiry among the snapshots, if any has a TTL.
+    earliest_expiry: float | None
+
+    @property
+    def next_due(self) -> float:
+        if self.earliest_expiry is None:
+            return self.next_trigger
+        return min(self.next_trigger, self.earliest_expiry)
+
+
+def _state_path(config: configs.Config) -> str:
+    digest = hashlib.sha256(os.fsencode(config.config_file)).hexdigest()
+    return os.path.join(
+        os.path.dirname(config.dest_prefix),
+        snap_catalog.CATALOG_DIR,
+        f"{_STATE_PREFIX}{digest[:16]}.json",
+    )
+
+
+def _config_stamp(config: configs.Config) -> tuple[int, int, int]:
+    st = os.stat(config.config_file)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _dir_stamp(config: configs.Config) -> tuple[int, int, int]:
+    st = os.stat(os.path.dirname(config.dest_prefix))
+    return st.st_mtime_ns, st.st_size, st.st_nlink
+
+
+def _read(config: configs.Config) -> _State | None:
+    try:
+        with open(_state_path(config)) as f:
+            state = dataclass_loader.load_dataclass(_State, json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError) as exc:
+        logging.info(f"Ignoring schedule state of {config.config_file}: {exc}")
+        return None
+    if state.version != _STATE_VERSION:
+        return None
+    return state
+
+
+def next_due(config: configs.Config) -> float | None:
+    """Returns the timestamp after which config has work; None if not known."""
+    state = _read(config)
+    if state is None:
+        return None
+    try:
+        if state.config_stamp != _config_stamp(config) or state.dir_stamp != _dir_stamp(
+            config
+        ):
+            return None
+    except OSError:
+        return None
+    return state.next_due
+
+
+def nothing_due(config: configs.Config, now: float) -> bool:
+    """Returns True if a scheduled run of config at now would have nothing to do."""
+    due = next_due(config)
+    return due is not None and now <= due
+
+
+def invalidate(destdir: str) -> None:
+    """Discards the states of all configs with snapshots in destdir."""
+    if global_flags.FLAGS.dryrun:
+        return
+    pattern = os.path.join(
+        glob.escape(destdir), snap_catalog.CATALOG_DIR, _STATE_PREFIX + "*.json"
+    )
+    for fname in glob.glob(pattern):
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logging.warning(f"Cannot remove schedule state {fname}: {exc}")
+
+
+def save(
+    config: configs.Config,
+    *,
+    last_scheduled: float | None,
+    next_trigger: float,
+    earliest_expiry: float | None,
+) -> None:
+    """Records the state after a scheduled run of config."""
+    if global_flags.FLAGS.dryrun:
+        return
+    fname = _state_path(config)
+    try:
+        config_stamp = _config_stamp(config)
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(os.path.dirname(fname))
+        # Taken after the directory above is created, since that changes the stamp.
+        state = _State(
+            version=_STATE_VERSION,
+            config_stamp=config_stamp,
+            dir_stamp=_dir_stamp(config),
+            last_scheduled=last_scheduled,
+            next_trigger=next_trigger,
+            earliest_expiry=earliest_expiry,
+        )
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(dataclasses.asdict(state), f)
+        os.replace(tmp_fname, fname)
+    except OSError as exc:
+        logging.info(f"Cannot save schedule state of {config.config_file}: {exc}")
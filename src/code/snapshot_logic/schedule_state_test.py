@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from .. import configs
+from . import schedule_state
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class ScheduleStateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+        config_file = os.path.join(self._dir, "home.conf")
+        with open(config_file, "w") as f:
+            f.write("source = /home\n")
+        os.mkdir(os.path.join(self._dir, "snaps"))
+        self._config = configs.Config(
+            config_file=config_file,
+            source="/home",
+            dest_prefix=os.path.join(self._dir, "snaps", "@home-"),
+        )
+
+    def _save(self, next_trigger: float, earliest_expiry: float | None = None):
+        schedule_state.save(
+            self._config,
+            last_scheduled=50.0,
+            next_trigger=next_trigger,
+            earliest_expiry=earliest_expiry,
+        )
+
+    def test_nothing_due(self):
+        self.assertFalse(schedule_state.nothing_due(self._config, 100.0))
+
+        self._save(next_trigger=200.0)
+        self.assertTrue(schedule_state.nothing_due(self._config, 100.0))
+        self.assertTrue(schedule_state.nothing_due(self._config, 200.0))
+        self.assertFalse(schedule_state.nothing_due(self._config, 201.0))
+
+        # A TTL expiring before the next trigger.
+        self._save(next_trigger=200.0, earliest_expiry=150.0)
+        self.assertTrue(schedule_state.nothing_due(self._config, 100.0))
+        self.assertFalse(schedule_state.nothing_due(self._config, 160.0))
+
+    def test_invalidation(self):
+        self._save(next_trigger=200.0)
+        self.assertTrue(schedule_state.nothing_due(self._config, 100.0))
+
+        # A snapshot is added.
+        os.mkdir(self._config.dest_prefix + "20250101000000")
+        self.assertFalse(schedule_state.nothing_due(self._config, 100.0))
+
+        self._save(next_trigger=200.0)
+        self.assertTrue(schedule_state.nothing_due(self._config, 100.0))
+
+        # The config is edited.
+        with open(self._config.config_file, "a") as f:
+            f.write("keep_hourly = 24\n")
+        self.assertFalse(schedule_state.nothing_due(self._config, 100.0))
+
+        # The metadata of a snapshot changed in place, e.g. its TTL.
+        self._save(next_trigger=200.0)
+        self.assertTrue(schedule_state.nothing_due(self._config, 100.0))
+        schedule_state.invalidate(os.path.dirname(self._config.dest_prefix))
+        self.assertFalse(schedule_state.nothing_due(self._config, 100.0))
+
+        # A corrupt state is ignored.
+        self._save(next_trigger=200.0)
+        with open(schedule_state._state_path(self._config), "w") as f:
+            f.write("{")
+        self.assertFalse(schedule_state.nothing_due(self._config, 100.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,27 +46,34 @@ class CreationTimeTtl:
             now: The current time, or when processing began.
             existing_creation_expiries: (created, expiry) pairs of all existing snaps.
         """
+        # All comparisons are done in seconds since the epoch, which is much faster
+        # than comparing datetimes.
+        now_ts = now.timestamp()
+        epsilon = _EPSILON.total_seconds()
+        creation_expiries = [
+            (created.timestamp(), expiry_ts)
+            for created, expiry_ts in existing_creation_expiries
+            # Snaps without TTL are ignored.
+            if expiry_ts is not None
+        ]
         snapshot_ttl = datetime.timedelta.min
         for period, n in self._rules:
+            period_secs = period.total_seconds()
             skip_creation = False
             count_at_next_time = 0
-            for created, expiry_ts in existing_creation_expiries:
-                if expiry_ts is None:
-                    # Snap does not have TTL.
-                    continue
-                expiry = datetime.datetime.fromtimestamp(expiry_ts)
+            for created, expiry in creation_expiries:
                 duration = expiry - created
-                if duration < period - _EPSILON:
+                if duration < period_secs - epsilon:
                     # Snap is too short for the current rule.
                     continue
-                if now - created < period - _EPSILON:
+                if now_ts - created < period_secs - epsilon:
                     # The last one was created recently. Do not create a new snap.
                     skip_creation = True
                     break
-                if expiry - now <= period + _EPSILON:
+                if expiry - now_ts <= period_secs + epsilon:
                     # The snap will be deleted on next period.
                     continue
-                if created <= now - period * n + _EPSILON:
+                if created <= now_ts - period_secs * n + epsilon:
                     # Too old.
                     continue
                 count_at_next_time += 1
@@ -0,0 +1,272 @@
+"""Persistent catalog of the snapshots in a destination directory.
+
+Without a catalog, listing snapshots needs a stat and a metadata parse for every entry
+of the destination directory. The catalog keeps the directory entries and their
+metadata in one file, so that listing becomes a single file read.
+
+The catalog is stored in a hidden directory inside the destination directory, e.g.
+/.snapshots/.yabsnap/catalog.json. Since files are written in that subdirectory, writing
+the catalog does not change the destination directory itself.
+
+Validation is cheap: the catalog records the mtime, size and link count of the
+destination directory. These change whenever an entry is added, removed or renamed, so
+any change not made through yabsnap (e.g. a snapshot deleted manually) causes the
+catalog to be rebuilt on the next read. A generation counter is incremented on every
+write.
+
+Changes made by yabsnap go through updating(), which patches the catalog in place
+instead of invalidating it. The catalog lock is only held while patching, not while the
+snapshots are created or deleted, which can take long.
+"""
+
+import contextlib
+import dataclasses
+import fcntl
+import json
+import logging
+import os
+from collections.abc import Generator
+
+from .. import global_flags
+from ..utils import thread_pool
+from . import snap_metadata
+
+from typing import Any
+
+# Name of the hidden directory holding the catalog, relative to the destination.
+CATALOG_DIR = ".yabsnap"
+_CATALOG_FILE = "catalog.json"
+_LOCK_FILE = "catalog.lock"
+# Increase if the file format changes; older catalogs will be rebuilt.
+_CATALOG_VERSION = 1
+
+# Raw metadata json of a snapshot, or None if it has no readable metadata file.
+MetadataJson = dict[str, Any] | None
+
+
+@dataclasses.dataclass
+class _Catalog:
+    # The (st_mtime_ns, st_size, st_nlink) of the destination directory.
+    stamp: tuple[int, int, int]
+    # Incremented on every write.
+    generation: int
+    # Directory name -> raw metadata json.
+    entries: dict[str, MetadataJson]
+
+
+# In-process cache of catalogs, by destination directory.
+_loaded: dict[str, _Catalog] = {}
+
+
+def _stamp(destdir: str) -> tuple[int, int, int]:
+    st = os.stat(destdir)
+    # Besides mtime, size and link count also change with entries on common
+    # filesystems. This makes the check robust against coarse timestamps.
+    return st.st_mtime_ns, st.st_size, st.st_nlink
+
+
+def _catalog_path(destdir: str, fname: str = _CATALOG_FILE) -> str:
+    return os.path.join(destdir, CATALOG_DIR, fname)
+
+
+def _read(destdir: str) -> _Catalog | None:
+    """Reads the catalog file. Returns None if it is absent or unusable."""
+    try:
+        with open(_catalog_path(destdir)) as f:
+            data = json.load(f)
+        if data["version"] != _CATALOG_VERSION:
+            return None
+        return _Catalog(
+            stamp=(data["stamp"][0], data["stamp"][1], data["stamp"][2]),
+            generation=data["generation"],
+            entries=data["entries"],
+        )
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as exc:
+        logging.warning(f"Ignoring corrupt snapshot catalog in {destdir}: {exc!r}")
+        return None
+
+
+def _write(destdir: str, catalog: _Catalog) -> None:
+    """Atomically replaces the catalog file."""
+    fname = _catalog_path(destdir)
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(
+            {
+                "version": _CATALOG_VERSION,
+                "stamp": list(catalog.stamp),
+                "generation": catalog.generation,
+                "entries": catalog.entries,
+            },
+            f,
+            separators=(",", ":"),
+        )
+    os.replace(tmp_fname, fname)
+
+
+@contextlib.contextmanager
+def _locked(destdir: str, *, blocking: bool) -> Generator[bool]:
+    """Holds the catalog lock. Yields False if it could not be acquired."""
+    if global_flags.FLAGS.dryrun:
+        # Nothing is written, and the lock file is not created.
+        yield False
+        return
+    try:
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(os.path.join(destdir, CATALOG_DIR))
+        fd = os.open(_catalog_path(destdir, _LOCK_FILE), os.O_CREAT | os.O_RDWR, 0o644)
+    except OSError as exc:
+        # E.g. a non-root user listing snapshots.
+        logging.info(f"Cannot maintain snapshot catalog in {destdir}: {exc}")
+        yield False
+        return
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def _list(destdir: str) -> tuple[list[str], set[str]]:
+    """Returns the sorted directories, and the files, in destdir."""
+    # A single scandir() pass. On most filesystems, the directory entries carry the
+    # type, so finding the directories needs no additional stat().
+    dirs: list[str] = []
+    files: set[str] = set()
+    with os.scandir(destdir) as it:
+        for entry in it:
+            if entry.name == CATALOG_DIR:
+                continue
+            if entry.is_dir():
+                dirs.append(entry.name)
+            else:
+                files.add(entry.name)
+    dirs.sort()
+    return dirs, files
+
+
+def _scan(destdir: str) -> dict[str, MetadataJson]:
+    dirs, files = _list(destdir)
+    with_metadata = [fname for fname in dirs if fname + "-meta.json" in files]
+    # Metadata files are read concurrently, which helps on slow or network-backed
+    # disks where each read has a high latency.
+    metadata = thread_pool.map_ordered(
+        lambda fname: snap_metadata.read_json_file(
+            os.path.join(destdir, fname + "-meta.json")
+        ),
+        with_metadata,
+    )
+    entries: dict[str, MetadataJson] = dict.fromkeys(dirs)
+    entries.update(zip(with_metadata, metadata, strict=True))
+    return entries
+
+
+def _rebuild(destdir: str) -> _Catalog:
+    logging.info(f"Rebuilding snapshot catalog for {destdir}")
+    # Create the catalog directory first, since that changes the stamp.
+    with _locked(destdir, blocking=False) as locked:
+        stamp = _stamp(destdir)
+        previous = _read(destdir)
+        catalog = _Catalog(
+            stamp=stamp,
+            generation=previous.generation + 1 if previous else 0,
+            entries=_scan(destdir),
+        )
+        # If the lock is held by someone else, they are updating the directory. Do
+        # not write what we read, since it may be stale.
+        if locked and not global_flags.FLAGS.dryrun:
+            try:
+                _write(destdir, catalog)
+            except OSError as exc:
+                logging.info(f"Could not write snapshot catalog in {destdir}: {exc}")
+    return catalog
+
+
+def load(destdir: str) -> dict[str, MetadataJson]:
+    """Returns all subdirectories of destdir, with their metadata.
+
+    The result is sorted by directory name, and must not be modified.
+    """
+    stamp = _stamp(destdir)
+    catalog = _loaded.get(destdir)
+    if catalog is None or catalog.stamp != stamp:
+        catalog = _read(destdir)
+        if catalog is None or catalog.stamp != stamp:
+            catalog = _rebuild(destdir)
+        _loaded[destdir] = catalog
+    return catalog.entries
+
+
+class Transaction:
+    """Changes to be applied to the catalog of a directory."""
+
+    def __init__(self) -> None:
+        self._changes: dict[str, MetadataJson] = {}
+        self._removed: set[str] = set()
+
+    def put(self, name: str, metadata: MetadataJson) -> None:
+        self._removed.discard(name)
+        self._changes[name] = metadata
+
+    def remove(self, name: str) -> None:
+        self._changes.pop(name, None)
+        self._removed.add(name)
+
+    def apply_to(self, entries: dict[str, MetadataJson]) -> dict[str, MetadataJson]:
+        result = {k: v for k, v in entries.items() if k not in self._removed}
+        result.update(self._changes)
+        return dict(sorted(result.items()))
+
+
+@contextlib.contextmanager
+def updating(destdir: str) -> Generator[Transaction]:
+    """Keeps the catalog up to date with changes yabsnap makes to destdir.
+
+    All changes to destdir must be made inside the with block, and recorded on the
+    yielded Transaction. The block runs without the catalog lock, so that other
+    processes, e.g. the pacman hook, are not blocked while snapshots are created or
+    deleted. The lock is taken afterwards to patch the latest catalog, including
+    changes other processes patched in the meantime.
+
+    The catalog is patched only if it was valid before the changes, the block
+    completes without an exception, and the snapshot directories then match those of
+    the patched catalog, i.e. no other change was made concurrently. Otherwise it is
+    left stale, to be rebuilt on the next load().
+    """
+    transaction = Transaction()
+    if global_flags.FLAGS.dryrun:
+        yield transaction
+        return
+    previous = _read(destdir)
+    valid = previous is not None and previous.stamp == _stamp(destdir)
+    yield transaction
+    if not valid:
+        _loaded.pop(destdir, None)
+        return
+    with _locked(destdir, blocking=True) as locked:
+        current = _read(destdir) if locked else None
+        if current is None:
+            _loaded.pop(destdir, None)
+            return
+        stamp = _stamp(destdir)
+        entries = transaction.apply_to(current.entries)
+        if list(entries) != _list(destdir)[0]:
+            logging.info(f"Concurrent change, not patching catalog in {destdir}")
+            _loaded.pop(destdir, None)
+            return
+        catalog = _Catalog(
+            stamp=stamp, generation=current.generation + 1, entries=entries
+        )
+        try:
+            _write(destdir, catalog)
+        except OSError as exc:
+            logging.warning(f"Could not update snapshot catalog in {destdir}: {exc}")
+            _loaded.pop(destdir, None)
+            return
+        _loaded[destdir] = catalog
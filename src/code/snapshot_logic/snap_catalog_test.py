@@ -0,0 +1,182 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import global_flags
+from . import snap_catalog
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+def _make_snap(destdir: str, name: str, metadata: dict[str, str] | None) -> None:
+    os.mkdir(os.path.join(destdir, name))
+    if metadata is not None:
+        with open(os.path.join(destdir, name + "-meta.json"), "w") as f:
+            json.dump(metadata, f)
+
+
+class SnapCatalogTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+        snap_catalog._loaded.clear()
+        self.addCleanup(snap_catalog._loaded.clear)
+
+    def test_load_builds_catalog(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        _make_snap(self._dir, "@home-20240101000000", None)
+        # Files are not listed.
+        with open(os.path.join(self._dir, "somefile"), "w"):
+            pass
+
+        self.assertEqual(
+            snap_catalog.load(self._dir),
+            {"@home-20240101000000": None, "@home-20250101000000": {"trigger": "S"}},
+        )
+        self.assertTrue(
+            os.path.isfile(os.path.join(self._dir, ".yabsnap", "catalog.json"))
+        )
+
+        # Loading again from a new process reads the catalog, not the metadata.
+        snap_catalog._loaded.clear()
+        with mock.patch.object(snap_catalog, "_scan") as mock_scan:
+            snap_catalog.load(self._dir)
+        mock_scan.assert_not_called()
+
+    def test_load_dry_run(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        with mock.patch.object(global_flags.FLAGS, "dryrun", True):
+            self.assertEqual(
+                snap_catalog.load(self._dir), {"@home-20250101000000": {"trigger": "S"}}
+            )
+        # Nothing is written, not even the lock.
+        self.assertFalse(os.path.exists(os.path.join(self._dir, ".yabsnap")))
+
+    def test_external_change_rebuilds(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+
+        _make_snap(self._dir, "@home-20250102000000", {"trigger": "U"})
+        self.assertEqual(
+            list(snap_catalog.load(self._dir)),
+            ["@home-20250101000000", "@home-20250102000000"],
+        )
+
+    def test_corrupt_catalog_rebuilds(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+        with open(os.path.join(self._dir, ".yabsnap", "catalog.json"), "w") as f:
+            f.write("{not json")
+        snap_catalog._loaded.clear()
+
+        with self.assertLogs(level="WARNING"):
+            entries = snap_catalog.load(self._dir)
+        self.assertEqual(entries, {"@home-20250101000000": {"trigger": "S"}})
+
+    def test_updating_patches_catalog(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+        generation = snap_catalog._read(self._dir).generation  # type: ignore
+
+        with snap_catalog.updating(self._dir) as catalog:
+            _make_snap(self._dir, "@home-20250102000000", {"trigger": "U"})
+            catalog.put("@home-20250102000000", {"trigger": "U"})
+            os.rmdir(os.path.join(self._dir, "@home-20250101000000"))
+            catalog.remove("@home-20250101000000")
+
+        snap_catalog._loaded.clear()
+        with mock.patch.object(snap_catalog, "_scan") as mock_scan:
+            entries = snap_catalog.load(self._dir)
+        mock_scan.assert_not_called()
+        self.assertEqual(entries, {"@home-20250102000000": {"trigger": "U"}})
+        self.assertEqual(
+            snap_catalog._read(self._dir).generation,  # type: ignore
+            generation + 1,
+        )
+
+    def test_updating_stale_catalog_is_not_patched(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+        # External change.
+        _make_snap(self._dir, "@home-20250102000000", {"trigger": "U"})
+
+        with snap_catalog.updating(self._dir) as catalog:
+            catalog.put("@home-20250101000000", {"trigger": "I"})
+
+        # The external change is picked up by a rebuild.
+        self.assertEqual(
+            snap_catalog.load(self._dir),
+            {
+                "@home-20250101000000": {"trigger": "S"},
+                "@home-20250102000000": {"trigger": "U"},
+            },
+        )
+
+    def test_updating_does_not_hold_lock(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+
+        with snap_catalog.updating(self._dir) as catalog:
+            # Another process can patch the catalog meanwhile.
+            with snap_catalog._locked(self._dir, blocking=False) as locked:
+                self.assertTrue(locked)
+            with snap_catalog.updating(self._dir) as other:
+                _make_snap(self._dir, "@home-20250102000000", {"trigger": "U"})
+                other.put("@home-20250102000000", {"trigger": "U"})
+            _make_snap(self._dir, "@home-20250103000000", {"trigger": "I"})
+            catalog.put("@home-20250103000000", {"trigger": "I"})
+
+        # Both changes are patched.
+        snap_catalog._loaded.clear()
+        with mock.patch.object(snap_catalog, "_scan") as mock_scan:
+            entries = snap_catalog.load(self._dir)
+        mock_scan.assert_not_called()
+        self.assertEqual(
+            list(entries),
+            [
+                "@home-20250101000000",
+                "@home-20250102000000",
+                "@home-20250103000000",
+            ],
+        )
+
+    def test_updating_concurrent_change_is_not_patched(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+
+        with snap_catalog.updating(self._dir) as catalog:
+            _make_snap(self._dir, "@home-20250102000000", {"trigger": "U"})
+            catalog.put("@home-20250102000000", {"trigger": "U"})
+            # Not recorded, e.g. made by another process still running.
+            _make_snap(self._dir, "@home-20250103000000", {"trigger": "I"})
+
+        self.assertEqual(
+            list(snap_catalog.load(self._dir)),
+            [
+                "@home-20250101000000",
+                "@home-20250102000000",
+                "@home-20250103000000",
+            ],
+        )
+
+    def test_updating_aborted_on_exception(self):
+        _make_snap(self._dir, "@home-20250101000000", {"trigger": "S"})
+        snap_catalog.load(self._dir)
+
+        with self.assertRaises(RuntimeError), snap_catalog.updating(self._dir):
+            _make_snap(self._dir, "@home-20250102000000", None)
+            raise RuntimeError("Failed")
+
+        self.assertEqual(
+            list(snap_catalog.load(self._dir)),
+            ["@home-20250101000000", "@home-20250102000000"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
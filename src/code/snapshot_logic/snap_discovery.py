@@ -0,0 +1,70 @@
+"""Finds the snapshots of configs, sharing work between configs.
+
+Several configs commonly share one destination directory, e.g. /.snapshots/@root- and
+/.snapshots/@home-. Each destination directory is read only once per process (through
+its catalog), and its entries are kept sorted by name. Since all snapshots of a config
+start with its dest_prefix, they form one contiguous slice of the sorted entries, which
+is found by bisection.
+"""
+
+import bisect
+import collections
+import dataclasses
+import os
+import threading
+from collections.abc import Iterator
+
+from . import snap_catalog
+
+
+@dataclasses.dataclass(frozen=True)
+class Listing:
+    # As returned by snap_catalog.load(). Used to check if the listing is current.
+    entries: dict[str, snap_catalog.MetadataJson]
+    # Sorted names of the entries.
+    names: list[str]
+
+
+# In-process cache of listings, by destination directory.
+_listings: dict[str, Listing] = {}
+
+# Configs may be listed from multiple threads. Serialize loading of each directory, so
+# that configs sharing a directory wait for one load instead of each doing it.
+_locks: collections.defaultdict[str, threading.Lock] = collections.defaultdict(
+    threading.Lock
+)
+_locks_lock = threading.Lock()
+
+
+def _listing(destdir: str) -> Listing:
+    with _locks_lock:
+        lock = _locks[destdir]
+    with lock:
+        entries = snap_catalog.load(destdir)
+        listing = _listings.get(destdir)
+        if listing is None or listing.entries is not entries:
+            listing = Listing(entries=entries, names=sorted(entries))
+            _listings[destdir] = listing
+        return listing
+
+
+def listing_of(dest_prefix: str) -> Listing:
+    """Returns the current listing of the directory containing dest_prefix."""
+    return _listing(os.path.dirname(dest_prefix))
+
+
+def entries_with_prefix(
+    dest_prefix: str,
+) -> Iterator[tuple[str, snap_catalog.MetadataJson]]:
+    """Yields (pathname, metadata_json) of entries that start with dest_prefix.
+
+    The result is sorted by pathname, which is chronological for entries of one
+    dest_prefix.
+    """
+    destdir, name_prefix = os.path.split(dest_prefix)
+    listing = _listing(destdir)
+    begin = bisect.bisect_left(listing.names, name_prefix)
+    for name in listing.names[begin:]:
+        if not name.startswith(name_prefix):
+            break
+        yield os.path.join(destdir, name), listing.entries[name]
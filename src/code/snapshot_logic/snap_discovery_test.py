@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import snap_catalog
+from . import snap_discovery
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class SnapDiscoveryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+        for name in [
+            "@root-20250102000000",
+            "@home-20250101000000",
+            "@root-20250101000000",
+            "@home-20250102000000",
+            "other",
+        ]:
+            os.mkdir(os.path.join(self._dir, name))
+        for cache in (snap_catalog._loaded, snap_discovery._listings):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def test_partitions_by_prefix(self):
+        with mock.patch.object(
+            snap_catalog, "_scan", wraps=snap_catalog._scan
+        ) as mock_scan:
+            root = list(
+                snap_discovery.entries_with_prefix(os.path.join(self._dir, "@root-"))
+            )
+            home = list(
+                snap_discovery.entries_with_prefix(os.path.join(self._dir, "@home-"))
+            )
+            none = list(
+                snap_discovery.entries_with_prefix(os.path.join(self._dir, "@var-"))
+            )
+        # The directory is scanned once for all prefixes.
+        mock_scan.assert_called_once_with(self._dir)
+
+        self.assertEqual(
+            root,
+            [
+                (os.path.join(self._dir, "@root-20250101000000"), None),
+                (os.path.join(self._dir, "@root-20250102000000"), None),
+            ],
+        )
+        self.assertEqual(
+            [pathname for pathname, _ in home],
+            [
+                os.path.join(self._dir, "@home-20250101000000"),
+                os.path.join(self._dir, "@home-20250102000000"),
+            ],
+        )
+        self.assertEqual(none, [])
+
+    def test_scan_reads_metadata(self):
+        with open(os.path.join(self._dir, "@home-20250101000000-meta.json"), "w") as f:
+            f.write('{"trigger": "U"}')
+        self.assertEqual(
+            list(snap_discovery.entries_with_prefix(os.path.join(self._dir, "@home-"))),
+            [
+                (os.path.join(self._dir, "@home-20250101000000"), {"trigger": "U"}),
+                (os.path.join(self._dir, "@home-20250102000000"), None),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,9 +17,12 @@ The existence of this object doesn't mean the snapshot exists;
 it can also be an empty place holder.
 """
 
+import calendar
 import datetime
 import logging
 import os
+import time
+from collections.abc import Iterable
 
 from .. import global_flags
 from ..mechanisms import abstract_mechanism
@@ -27,21 +30,101 @@ from ..mechanisms import snap_mechanisms
 from ..mechanisms import snap_type_enum
 from ..utils import human_interval
 from ..utils import os_utils
+from ..utils import snap_names
+from . import schedule_state
+from . import snap_catalog
 from . import snap_metadata
 
 from typing import Any
 
+# Attempts at finding an unused name with milliseconds, before giving up.
+_MAX_NAME_ATTEMPTS = 1000
+
+
+def _parse_epoch(timestr: str) -> int:
+    """Parses a timestamp in either format of snap_names, as local time.
+
+    Equivalent to strptime(timestr, TIME_FORMAT).timestamp() of the seconds, but much
+    faster since the format has fixed width. Milliseconds, if any, are ignored.
+    """
+    if snap_names.timestr_of(timestr) != timestr:
+        raise ValueError(f"Invalid timestamp: {timestr!r}")
+    year = int(timestr[0:4])
+    month = int(timestr[4:6])
+    day = int(timestr[6:8])
+    hour = int(timestr[8:10])
+    minute = int(timestr[10:12])
+    second = int(timestr[12:14])
+    if (
+        not 1 <= month <= 12
+        or not 1 <= day <= calendar.monthrange(year, month)[1]
+        or hour > 23
+        or minute > 59
+        or second > 61
+    ):
+        raise ValueError(f"Invalid timestamp: {timestr!r}")
+    return int(time.mktime((year, month, day, hour, minute, second, 0, 0, -1)))
+
 
 class Snapshot:
-    def __init__(self, target: str) -> None:
+    # Many snapshots may be held at once, e.g. when listing; keep them small.
+    __slots__ = (
+        "_epoch",
+        "_json_known",
+        "_mechanism_options",
+        "_metadata",
+        "_metadata_json",
+        "_target",
+    )
+
+    def __init__(
+        self,
+        target: str,
+        metadata: snap_metadata.SnapMetadata | None = None,
+        mechanism_options: abstract_mechanism.MechanismOptions | None = None,
+    ) -> None:
         # The full pathname of the snapshot directory.
         # Also exposed as a public property .target.
         self._target = target
-        timestr = self._target[-global_flags.TIME_FORMAT_LEN :]
-        self._snaptime = datetime.datetime.strptime(timestr, global_flags.TIME_FORMAT)
-        self._metadata_fname = target + "-meta.json"
-        self.metadata = snap_metadata.SnapMetadata.load_file(self._metadata_fname)
-        self._dryrun = False
+        self._epoch = _parse_epoch(self._timestr)
+        # Metadata is loaded when first accessed. It is parsed from _metadata_json if
+        # _json_known, otherwise read from the metadata file.
+        self._metadata = metadata
+        self._metadata_json: snap_catalog.MetadataJson = None
+        self._json_known = False
+        # Options of the config this snapshot belongs to, used to create or delete it.
+        self._mechanism_options = mechanism_options
+
+    @classmethod
+    def from_metadata_json(
+        cls,
+        target: str,
+        metadata_json: snap_catalog.MetadataJson,
+        mechanism_options: abstract_mechanism.MechanismOptions | None = None,
+    ) -> "Snapshot":
+        """Creates a snapshot whose metadata will be parsed from metadata_json."""
+        snap = cls(target, mechanism_options=mechanism_options)
+        snap._metadata_json = metadata_json
+        snap._json_known = True
+        return snap
+
+    @property
+    def metadata(self) -> snap_metadata.SnapMetadata:
+        if self._metadata is None:
+            if self._json_known:
+                self._metadata = snap_metadata.SnapMetadata.from_json(
+                    self._metadata_json
+                )
+                self._metadata_json = None
+            else:
+                self._metadata = snap_metadata.SnapMetadata.load_file(
+                    self._metadata_fname
+                )
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: snap_metadata.SnapMetadata) -> None:
+        self._metadata = metadata
 
     # The LightSnapshot avoids circular references in certain operations.
     def to_light_snapshot(self) -> abstract_mechanism.LightSnapshot:
@@ -49,13 +132,41 @@ class Snapshot:
             target=self.target, metadata=self.metadata
         )
 
+    @property
+    def _destdir(self) -> str:
+        return os.path.dirname(self._target)
+
+    @property
+    def _name(self) -> str:
+        return os.path.basename(self._target)
+
     @property
     def target(self) -> str:
         return self._target
 
+    @property
+    def mechanism_options(self) -> abstract_mechanism.MechanismOptions:
+        return self._mechanism_options or abstract_mechanism.MechanismOptions()
+
+    @property
+    def _metadata_fname(self) -> str:
+        return self._target + "-meta.json"
+
+    @property
+    def _timestr(self) -> str:
+        timestr = snap_names.timestr_of(self._target)
+        if timestr is None:
+            raise ValueError(f"Invalid timestamp: {self._target!r}")
+        return timestr
+
+    @property
+    def epoch(self) -> int:
+        """The creation time in seconds since the epoch, as parsed from the name."""
+        return self._epoch
+
     @property
     def snaptime(self) -> datetime.datetime:
-        return self._snaptime
+        return datetime.datetime.fromtimestamp(self._epoch)
 
     @property
     def _snap_type(self) -> snap_type_enum.SnapType:
@@ -73,6 +184,8 @@ class Snapshot:
         result["comment"] = self.metadata.comment
         if self.metadata.expiry is not None:
             result["expiry"] = self.metadata.expiry
+        if self.metadata.packages:
+            result["packages"] = self.metadata.packages
         return result
 
     def set_ttl(self, ttl_str: str, now: datetime.datetime) -> None:
@@ -82,10 +195,46 @@ class Snapshot:
             ttl_secs = human_interval.parse_to_secs(ttl_str)
             expiry = now + datetime.timedelta(seconds=ttl_secs)
             self.metadata.expiry = expiry.timestamp()
-        self.metadata.save_file(self._metadata_fname)
+        with snap_catalog.updating(self._destdir) as catalog:
+            self.metadata.save_file(self._metadata_fname)
+            catalog.put(self._name, self.metadata.as_json())
+        # The expiry may now be earlier than the next due time of scheduled runs.
+        schedule_state.invalidate(self._destdir)
+
+    def _reserve_name(self) -> None:
+        """Moves a name with milliseconds forward until it is unused, and takes it.
+
+        The name is taken by exclusively creating the metadata file, which is atomic
+        across processes. So concurrent yabsnap processes do not need to reserve the
+        wall-clock second with time_lock to create snapshots with distinct names.
+        """
+        if global_flags.FLAGS.dryrun:
+            return
+        for _ in range(_MAX_NAME_ATTEMPTS):
+            try:
+                fd = os.open(
+                    self._metadata_fname, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644
+                )
+            except FileExistsError:
+                pass
+            else:
+                os.close(fd)
+                if not os.path.lexists(self._target):
+                    return
+                # Taken by a snapshot without metadata.
+                os.remove(self._metadata_fname)
+            self._target = snap_names.next_name(self._target)
+            self._epoch = _parse_epoch(self._timestr)
+        raise FileExistsError(f"Could not find an unused name for {self._target}")
 
     def create_from(self, snap_type: snap_type_enum.SnapType, parent: str) -> None:
-        if not snap_mechanisms.get(snap_type).verify_volume(parent):
+        """Creates the snapshot of parent.
+
+        If the name has milliseconds and is already taken, the next unused millisecond
+        is used instead, and the target changes accordingly.
+        """
+        mechanism = snap_mechanisms.get(snap_type, self._mechanism_options)
+        if not mechanism.verify_volume(parent):
             logging.error("Unable to validate source volume - aborting snapshot!")
             return
         # Create the metadata before the snapshot.
@@ -93,18 +242,64 @@ class Snapshot:
         self.metadata.snap_type = snap_type
         self.metadata.source = parent
         self.metadata.source_uuid = os_utils.get_filesystem_uuid(parent)
-        mechanism = snap_mechanisms.get(snap_type)
         mechanism.fill_metadata(self.metadata)
-        self.metadata.save_file(self._metadata_fname)
-        # Create the snap.
-        mechanism.create(parent, self._target)
+        with snap_catalog.updating(self._destdir) as catalog:
+            if len(self._timestr) == global_flags.TIME_FORMAT_SUBSECOND_LEN:
+                self._reserve_name()
+            self.metadata.save_file(self._metadata_fname)
+            # Create the snap.
+            mechanism.create(parent, self._target)
+            catalog.put(self._name, self.metadata.as_json())
 
     def delete(self) -> None:
-        # First delete the snapshot.
-        snap_mechanisms.get(self._snap_type).delete(self._target)
-        # Then delete the metadata.
+        Snapshot.delete_many([self])
+
+    @staticmethod
+    def delete_many(snaps: Iterable["Snapshot"]) -> None:
+        """Deletes snapshots, calling the mechanism once for each kind and directory."""
+        groups: dict[
+            tuple[
+                snap_type_enum.SnapType, abstract_mechanism.MechanismOptions | None, str
+            ],
+            list[Snapshot],
+        ] = {}
+        for snap in snaps:
+            key = (snap._snap_type, snap._mechanism_options, snap._destdir)
+            groups.setdefault(key, []).append(snap)
+        for (snap_type, options, destdir), group in groups.items():
+            with snap_catalog.updating(destdir) as catalog:
+                # First delete the snapshots.
+                try:
+                    snap_mechanisms.get(snap_type, options).delete_many(
+                        [x.target for x in group]
+                    )
+                except Exception:
+                    # Some may have been deleted; do not leave their metadata behind.
+                    if not global_flags.FLAGS.dryrun:
+                        for snap in group:
+                            if not os.path.lexists(snap.target):
+                                snap._delete_metadata(catalog)
+                    raise
+                # Then delete the metadata.
+                for snap in group:
+                    snap._delete_metadata(catalog)
+
+    @staticmethod
+    def delete_orphan_metadata(snaps: Iterable["Snapshot"]) -> None:
+        """Deletes the metadata left behind by snapshots which no longer exist."""
+        groups: dict[str, list[Snapshot]] = {}
+        for snap in snaps:
+            if not os.path.lexists(snap.target):
+                groups.setdefault(snap._destdir, []).append(snap)
+        for destdir, group in groups.items():
+            with snap_catalog.updating(destdir) as catalog:
+                for snap in group:
+                    snap._delete_metadata(catalog)
+
+    def _delete_metadata(self, catalog: snap_catalog.Transaction) -> None:
         if not global_flags.FLAGS.dryrun:
             if os.path.exists(self._metadata_fname):
                 os.remove(self._metadata_fname)
         else:
             os_utils.eprint(f"Would delete {self._metadata_fname}")
+        catalog.remove(self._name)
@@ -37,10 +37,11 @@ class SnapHolderTest(unittest.TestCase):
     def setUp(self) -> None:
         super().setUp()
         # Mock os_utils.get_filesystem_uuid(path).
-        mock_get_filesystem_uuid = mock.patch.object(
+        patcher = mock.patch.object(
             os_utils, "get_filesystem_uuid", return_value="Mock_UUID"
-        ).start()
-        self.addCleanup(mock_get_filesystem_uuid.stop)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_create_and_delete(self):
         with tempfile.TemporaryDirectory() as dir:
@@ -83,12 +84,75 @@ class SnapHolderTest(unittest.TestCase):
                 )
 
             with mock.patch.object(
-                btrfs_mechanism.BtrfsSnapMechanism, "delete", return_value=None
+                btrfs_mechanism.BtrfsSnapMechanism, "delete_many", return_value=None
             ) as mock_delete:
                 snap2.delete()
-            mock_delete.assert_called_once_with(snap_destination)
+            mock_delete.assert_called_once_with([snap_destination])
             self.assertFalse(os.path.exists(f"{snap_destination}-meta.json"))
 
+    def test_create_subsecond(self):
+        with tempfile.TemporaryDirectory() as dir:
+            # Both names are taken, by another process and by a snapshot without
+            # metadata.
+            with open(os.path.join(dir, "root-20231122193630_998-meta.json"), "w"):
+                pass
+            os.mkdir(os.path.join(dir, "root-20231122193630_999"))
+
+            snap = snap_holder.Snapshot(
+                os.path.join(dir, "root-20231122193630_998"),
+                metadata=snap_metadata.SnapMetadata(),
+            )
+            with (
+                mock.patch.object(
+                    btrfs_mechanism.BtrfsSnapMechanism,
+                    "verify_volume",
+                    return_value=True,
+                ),
+                mock.patch.object(btrfs_mechanism.BtrfsSnapMechanism, "fill_metadata"),
+                mock.patch.object(
+                    btrfs_mechanism.BtrfsSnapMechanism, "create", return_value=None
+                ) as mock_create,
+            ):
+                snap.create_from(snap_type_enum.SnapType.BTRFS, "parent")
+            expected = os.path.join(dir, "root-20231122193631_000")
+            mock_create.assert_called_once_with("parent", expected)
+            self.assertEqual(snap.target, expected)
+            self.assertEqual(snap.snaptime, datetime.datetime(2023, 11, 22, 19, 36, 31))
+            self.assertTrue(os.path.isfile(expected + "-meta.json"))
+            self.assertFalse(
+                os.path.exists(os.path.join(dir, "root-20231122193630_999-meta.json"))
+            )
+
+    def test_delete_many(self):
+        with tempfile.TemporaryDirectory() as dir:
+            snaps: list[snap_holder.Snapshot] = []
+            for name in ["root-20231122193630", "root-20231122193631"]:
+                snap = snap_holder.Snapshot(os.path.join(dir, name))
+                snap.metadata.snap_type = snap_type_enum.SnapType.BTRFS
+                snap.metadata.save_file(snap._metadata_fname)
+                os.mkdir(snap.target)
+                snaps.append(snap)
+
+            def delete_first(destinations: list[str]):
+                # Deletes one snapshot, then fails.
+                os.rmdir(destinations[0])
+                raise RuntimeError("Unable to delete")
+
+            with (
+                mock.patch.object(
+                    btrfs_mechanism.BtrfsSnapMechanism,
+                    "delete_many",
+                    side_effect=delete_first,
+                ) as mock_delete,
+                self.assertRaises(RuntimeError),
+            ):
+                snap_holder.Snapshot.delete_many(snaps)
+            # Both are deleted in one call.
+            mock_delete.assert_called_once_with([x.target for x in snaps])
+            # Metadata is removed only for the deleted snapshot.
+            self.assertFalse(os.path.exists(snaps[0]._metadata_fname))
+            self.assertTrue(os.path.exists(snaps[1]._metadata_fname))
+
     def test_filecontent(self):
         with tempfile.TemporaryDirectory() as dir:
             snap_destination = os.path.join(dir, "root-20231122193630")
@@ -133,6 +197,15 @@ class SnapHolderTest(unittest.TestCase):
             snap.metadata.expiry = _NOW.timestamp() + 100
             self.assertFalse(snap.metadata.is_expired(_NOW))
 
+    def test_set_ttl_invalidates_schedule_state(self):
+        with tempfile.TemporaryDirectory() as dir:
+            snap = snap_holder.Snapshot(os.path.join(dir, "root-20231122193630"))
+            with mock.patch.object(
+                snap_holder.schedule_state, "invalidate"
+            ) as mock_invalidate:
+                snap.set_ttl("1 h", now=_NOW)
+            mock_invalidate.assert_called_once_with(dir)
+
     def test_as_json(self):
         with tempfile.TemporaryDirectory() as dir:
             snap_destination = os.path.join(dir, "root-20231122193630")
@@ -181,6 +254,41 @@ class SnapHolderTest(unittest.TestCase):
             with self.assertNoLogs():
                 self.assertEqual(snap2._snap_type, snap_type_enum.SnapType.BTRFS)
 
+    def test_epoch(self):
+        snap = snap_holder.Snapshot("/snaps/root-20231122193630")
+        expected = datetime.datetime(2023, 11, 22, 19, 36, 30)
+        self.assertEqual(snap.epoch, expected.timestamp())
+        self.assertEqual(snap.snaptime, expected)
+
+        # Leap day.
+        self.assertEqual(
+            snap_holder._parse_epoch("20240229000000"),
+            datetime.datetime(2024, 2, 29).timestamp(),
+        )
+        # Milliseconds are ignored.
+        snap = snap_holder.Snapshot("/snaps/root-20231122193630_123")
+        self.assertEqual(snap.snaptime, expected)
+        for invalid in ["20230229000000", "20231322193630", "20231122246030", "2023"]:
+            with self.assertRaises(ValueError):
+                snap_holder._parse_epoch(invalid)
+
+    def test_metadata_is_lazy(self):
+        with mock.patch.object(
+            snap_metadata.SnapMetadata, "load_file", autospec=True
+        ) as mock_load_file:
+            snap = snap_holder.Snapshot("/snaps/root-20231122193630")
+            mock_load_file.assert_not_called()
+            _ = snap.metadata
+            mock_load_file.assert_called_once_with(
+                "/snaps/root-20231122193630-meta.json"
+            )
+
+        snap = snap_holder.Snapshot.from_metadata_json(
+            "/snaps/root-20231122193630", {"trigger": "S", "comment": "Hi"}
+        )
+        self.assertEqual(snap.metadata.trigger, "S")
+        self.assertEqual(snap.metadata.comment, "Hi")
+
 
 if __name__ == "__main__":
     unittest.main()
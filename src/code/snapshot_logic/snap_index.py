@@ -0,0 +1,109 @@
+"""Index of the snapshots of a dest_prefix, ordered by time.
+
+Snapshot names end with a timestamp, which sorts lexicographically in chronological
+order; see utils/snap_names.py. The index is a sorted list of these timestamps, so that a
+snapshot can be looked up, or a time range selected, by bisection. Only the snapshots
+found are then materialized.
+"""
+
+import bisect
+import dataclasses
+import datetime
+import logging
+from collections.abc import Iterator
+
+from ..mechanisms import abstract_mechanism
+from ..utils import snap_names
+from . import snap_catalog
+from . import snap_discovery
+from . import snap_holder
+
+
+@dataclasses.dataclass(frozen=True)
+class Entry:
+    # The timestamp part of the name, formatted as in snap_names.
+    timestr: str
+    pathname: str
+    metadata_json: snap_catalog.MetadataJson
+
+    @property
+    def source(self) -> str:
+        """The source recorded in metadata, read without materializing it."""
+        if self.metadata_json is None:
+            return ""
+        return self.metadata_json.get("source", "")
+
+    def snapshot(
+        self, mechanism_options: abstract_mechanism.MechanismOptions | None = None
+    ) -> snap_holder.Snapshot:
+        return snap_holder.Snapshot.from_metadata_json(
+            self.pathname, self.metadata_json, mechanism_options
+        )
+
+
+def _bisect_key(when: datetime.datetime) -> str:
+    # With milliseconds only if needed, since a name without them sorts first within
+    # its second.
+    return snap_names.format_time(when, subsecond=when.microsecond >= 1000)
+
+
+class SnapIndex:
+    def __init__(self, dest_prefix: str) -> None:
+        self._entries: list[Entry] = []
+        for pathname, metadata_json in snap_discovery.entries_with_prefix(dest_prefix):
+            timestr = snap_names.timestr_of(pathname[len(dest_prefix) :])
+            if timestr is None:
+                logging.warning(f"Could not parse timestamp, ignoring: {pathname}")
+                continue
+            self._entries.append(Entry(timestr, pathname, metadata_json))
+        # Entries are sorted by name. For a dest_prefix they are also sorted by time,
+        # unless another prefix starts with this one, e.g. "@root-" and "@root-x-".
+        self._entries.sort(key=lambda x: (x.timestr, x.pathname))
+        self._timestrs = [x.timestr for x in self._entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def all(self) -> list[Entry]:
+        """Returns all entries in chronological order."""
+        return self._entries
+
+    def find(self, suffix: str) -> Iterator[Entry]:
+        """Yields entries with pathnames ending in suffix.
+
+        The suffix must include the full timestamp.
+        """
+        timestr = snap_names.timestr_of(suffix)
+        if timestr is None:
+            return
+        begin = bisect.bisect_left(self._timestrs, timestr)
+        end = bisect.bisect_right(self._timestrs, timestr, lo=begin)
+        for entry in self._entries[begin:end]:
+            if entry.pathname.endswith(suffix):
+                yield entry
+
+    def between(
+        self, start: datetime.datetime | None, end: datetime.datetime | None
+    ) -> list[Entry]:
+        """Returns entries with start <= time < end, in chronological order."""
+        begin = 0
+        if start is not None:
+            begin = bisect.bisect_left(self._timestrs, _bisect_key(start))
+        finish = len(self._entries)
+        if end is not None:
+            finish = bisect.bisect_left(self._timestrs, _bisect_key(end), lo=begin)
+        return self._entries[begin:finish]
+
+
+# In-process cache of indices, by dest_prefix.
+_indices: dict[str, tuple[snap_discovery.Listing, SnapIndex]] = {}
+
+
+def get(dest_prefix: str) -> SnapIndex:
+    """Returns the index for dest_prefix, rebuilding it only if the listing changed."""
+    listing = snap_discovery.listing_of(dest_prefix)
+    cached = _indices.get(dest_prefix)
+    if cached is None or cached[0] is not listing:
+        cached = listing, SnapIndex(dest_prefix)
+        _indices[dest_prefix] = cached
+    return cached[1]
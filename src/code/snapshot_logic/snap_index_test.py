@@ -0,0 +1,114 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from . import snap_catalog
+from . import snap_discovery
+from . import snap_index
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class SnapIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = tmp.name
+        for name in [
+            "@root-20250103000000",
+            "@root-20250101000000",
+            "@root-20250102000000",
+            # Starts with "@root-", but belongs to another config.
+            "@root-x-20250101120000",
+        ]:
+            os.mkdir(os.path.join(self._dir, name))
+        for cache in (
+            snap_catalog._loaded,
+            snap_discovery._listings,
+            snap_index._indices,
+        ):
+            cache.clear()
+            self.addCleanup(cache.clear)
+        self._prefix = os.path.join(self._dir, "@root-")
+
+    def _timestrs(self, entries: list[snap_index.Entry]) -> list[str]:
+        return [x.timestr for x in entries]
+
+    def test_chronological(self):
+        index = snap_index.get(self._prefix)
+        self.assertEqual(
+            self._timestrs(index.all()),
+            ["20250101000000", "20250101120000", "20250102000000", "20250103000000"],
+        )
+        # Cached while the directory does not change.
+        self.assertIs(snap_index.get(self._prefix), index)
+
+    def test_find(self):
+        index = snap_index.get(self._prefix)
+        self.assertEqual(
+            [x.pathname for x in index.find("20250102000000")],
+            [os.path.join(self._dir, "@root-20250102000000")],
+        )
+        self.assertEqual(
+            [x.pathname for x in index.find("x-20250101120000")],
+            [os.path.join(self._dir, "@root-x-20250101120000")],
+        )
+        self.assertEqual(
+            len(list(index.find(os.path.join(self._dir, "@root-20250101000000")))), 1
+        )
+        self.assertEqual(list(index.find("20250104000000")), [])
+
+    def test_between(self):
+        index = snap_index.get(self._prefix)
+        day2 = datetime.datetime(2025, 1, 2)
+        day3 = datetime.datetime(2025, 1, 3)
+        self.assertEqual(
+            self._timestrs(index.between(day2, None)),
+            ["20250102000000", "20250103000000"],
+        )
+        self.assertEqual(
+            self._timestrs(index.between(None, day2)),
+            ["20250101000000", "20250101120000"],
+        )
+        self.assertEqual(self._timestrs(index.between(day2, day3)), ["20250102000000"])
+        self.assertEqual(index.between(day3, day2), [])
+
+    def test_subsecond(self):
+        for name in ["@root-20250102000000_500", "@root-20250102000000_020"]:
+            os.mkdir(os.path.join(self._dir, name))
+        index = snap_index.get(self._prefix)
+        self.assertEqual(
+            self._timestrs(index.between(datetime.datetime(2025, 1, 2), None)),
+            [
+                "20250102000000",
+                "20250102000000_020",
+                "20250102000000_500",
+                "20250103000000",
+            ],
+        )
+        self.assertEqual(
+            self._timestrs(
+                index.between(
+                    datetime.datetime(2025, 1, 2, microsecond=100_000),
+                    datetime.datetime(2025, 1, 3),
+                )
+            ),
+            ["20250102000000_500"],
+        )
+        self.assertEqual(
+            [x.pathname for x in index.find("20250102000000_020")],
+            [os.path.join(self._dir, "@root-20250102000000_020")],
+        )
+
+    def test_ignores_unparsable(self):
+        os.mkdir(os.path.join(self._dir, "@root-notatime"))
+        with self.assertLogs(level="WARNING"):
+            index = snap_index.get(self._prefix)
+        self.assertEqual(len(index), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -55,6 +55,8 @@ class SnapMetadata:
     # Unix datetime in seconds.
     # Note: Expiry is absolute, ttl is relative to now. Expiry = Now + Ttl.
     expiry: float | None = None
+    # For trigger "I", the packages in the transaction, as given by pacman.
+    packages: list[str] = dataclasses.field(default_factory=list[str])
 
     # Populated by mechanism.
     # aux: dict[str, str] = dataclasses.field(default_factory=dict)
@@ -82,20 +84,32 @@ class SnapMetadata:
 
     @classmethod
     def load_file(cls, fname: str) -> "SnapMetadata":
-        if os.path.isfile(fname):
-            with open(fname) as f:
-                try:
-                    all_args = json.load(f)
-                except json.JSONDecodeError:
-                    logging.warning(f"Unable to parse metadata file: {fname}")
-                    return cls()
-            if "version" not in all_args:
-                all_args["version"] = _UNKNOWN_VERSION
-            if "snap_type" not in all_args:
-                # This is because there was a time when the snap_type was not written.
-                # TODO: Drop support for back-compatibility after enough time.
-                all_args["snap_type"] = snap_type_enum.SnapType.BTRFS.value
-            return dataclass_loader.load_dataclass(
-                cls, all_args, ignore_unknown_fields=True
-            )
-        return cls()
+        return cls.from_json(read_json_file(fname))
+
+    @classmethod
+    def from_json(cls, all_args: dict[str, Any] | None) -> "SnapMetadata":
+        """Loads from the contents of a metadata file, as read by read_json_file()."""
+        if all_args is None:
+            return cls()
+        all_args = dict(all_args)
+        if "version" not in all_args:
+            all_args["version"] = _UNKNOWN_VERSION
+        if "snap_type" not in all_args:
+            # This is because there was a time when the snap_type was not written.
+            # TODO: Drop support for back-compatibility after enough time.
+            all_args["snap_type"] = snap_type_enum.SnapType.BTRFS.value
+        return dataclass_loader.load_dataclass(
+            cls, all_args, ignore_unknown_fields=True
+        )
+
+
+def read_json_file(fname: str) -> dict[str, Any] | None:
+    """Returns the raw json of a metadata file, or None if absent or unparseable."""
+    if not os.path.isfile(fname):
+        return None
+    with open(fname) as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            logging.warning(f"Unable to parse metadata file: {fname}")
+            return None
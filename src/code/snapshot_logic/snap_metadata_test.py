@@ -24,6 +24,7 @@ class SnapMetadataTest(unittest.TestCase):
             snap_type=snap_type_enum.SnapType.BTRFS,
             source="parent",
             expiry=1234,
+            packages=["linux", "glibc"],
             btrfs=snap_metadata.Btrfs(source_subvol="subvol"),
         )
         self.assertEqual(
@@ -33,19 +34,21 @@ class SnapMetadataTest(unittest.TestCase):
                 "snap_type": "BTRFS",
                 "source": "parent",
                 "expiry": 1234,
+                "packages": ["linux", "glibc"],
                 "btrfs": {"source_subvol": "subvol"},
             },
         )
 
     def test_loading(self):
         loaded = _load_json(
-            '{"version": "test", "snap_type": "BTRFS", "source": "parent", "trigger": "S", "btrfs": {"source_subvol": "subvol"}}'
+            '{"version": "test", "snap_type": "BTRFS", "source": "parent", "trigger": "I", "packages": ["linux"], "btrfs": {"source_subvol": "subvol"}}'
         )
         expected = snap_metadata.SnapMetadata(
             version="test",
             snap_type=snap_type_enum.SnapType.BTRFS,
             source="parent",
-            trigger="S",
+            trigger="I",
+            packages=["linux"],
             btrfs=snap_metadata.Btrfs(source_subvol="subvol"),
         )
         self.assertEqual(loaded, expected)
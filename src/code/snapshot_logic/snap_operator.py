@@ -16,21 +16,27 @@ import datetime
 import json
 import logging
 import os
-from collections.abc import Iterator
+from collections.abc import Callable, Iterable, Iterator
 
 from .. import configs
 from .. import global_flags
+from ..mechanisms import snap_type_enum
 from ..utils import human_interval
 from ..utils import os_utils
+from ..utils import pressure
+from ..utils import snap_names
 from . import auto_cleanup_without_ttl
+from . import deletion_queue
+from . import schedule_state
 from . import scheduled_snapshot_ttl
 from . import snap_holder
+from . import snap_index
+from . import snap_metadata
 
 from typing import Any
 
 
-def get_existing_snaps(config: configs.Config) -> Iterator[snap_holder.Snapshot]:
-    """Returns existing backups in chronological order."""
+def _check_destdir(config: configs.Config) -> None:
     destdir = os.path.dirname(config.dest_prefix)
 
     if not os.path.isdir(destdir):
@@ -42,21 +48,37 @@ def get_existing_snaps(config: configs.Config) -> Iterator[snap_holder.Snapshot]
             f"Error accessing {destdir=}, referred in {config.config_file}."
         )
 
-    for fname in os.listdir(destdir):
-        pathname = os.path.join(destdir, fname)
-        if not os.path.isdir(pathname):
-            continue
-        if not pathname.startswith(config.dest_prefix):
+
+def _to_snapshots(
+    config: configs.Config, entries: Iterable[snap_index.Entry]
+) -> Iterator[snap_holder.Snapshot]:
+    for entry in entries:
+        if entry.source != config.source:
+            # Check that the source matches; otherwise do not treat it as a
+            # snap for this config. See Issue #56.
             continue
         try:
-            snap = snap_holder.Snapshot(pathname)
-            if snap.metadata.source != config.source:
-                # Check that the source matches; otherwise do not treat it as a
-                # snap for this config. See Issue #56.
-                continue
-            yield snap
+            yield entry.snapshot(config.mechanism_options)
         except ValueError:
-            logging.warning(f"Could not parse timestamp, ignoring: {pathname}")
+            logging.warning(f"Could not parse timestamp, ignoring: {entry.pathname}")
+
+
+def get_existing_snaps(
+    config: configs.Config, include_pending: bool = False
+) -> Iterator[snap_holder.Snapshot]:
+    """Returns existing backups in chronological order.
+
+    Args:
+      config: Config of the backups.
+      include_pending: Whether to include backups queued for deletion.
+    """
+    _check_destdir(config)
+    snaps = _to_snapshots(config, snap_index.get(config.dest_prefix).all())
+    if include_pending:
+        yield from snaps
+        return
+    pending = deletion_queue.pending_targets()
+    yield from (x for x in snaps if x.target not in pending)
 
 
 def find_target(config: configs.Config, suffix: str) -> snap_holder.Snapshot | None:
@@ -65,10 +87,9 @@ def find_target(config: configs.Config, suffix: str) -> snap_holder.Snapshot | N
             "Length of snapshot identifier suffix "
             f"must be at least {global_flags.TIME_FORMAT_LEN}."
         )
-    for snap in get_existing_snaps(config):
-        if snap.target.endswith(suffix):
-            return snap_holder.Snapshot(snap.target)
-    return None
+    _check_destdir(config)
+    entries = snap_index.get(config.dest_prefix).find(suffix)
+    return next(_to_snapshots(config, entries), None)
 
 
 def _all_but_last_k[T](array: list[T], k: int) -> Iterator[T]:
@@ -82,17 +103,84 @@ def _all_but_last_k[T](array: list[T], k: int) -> Iterator[T]:
 
 
 class SnapOperator:
-    def __init__(self, config: configs.Config, now: datetime.datetime) -> None:
+    def __init__(
+        self,
+        config: configs.Config,
+        now: datetime.datetime,
+        pressure_source: Callable[[], pressure.Pressure | None] = pressure.read,
+    ) -> None:
         self._config = config
         self._now = now
-        self._now_str = self._now.strftime(global_flags.TIME_FORMAT)
+        self._pressure_source = pressure_source
+        # Read on first use by _defer_for_pressure(), and reused for the run.
+        self._pressure: pressure.Pressure | None = None
+        self._pressure_read = False
+        self._now_str = snap_names.format_time(
+            self._now, subsecond=config.subsecond_names
+        )
         # Set to true on any create operation.
         self.snaps_created = False
         # Set to true on any delete operation. If True, may run a btrfs subv sync.
         self.snaps_deleted = False
+        # Set to true if snaps were queued for deletion instead.
+        self.snaps_queued = False
         # Temporarily holds all snaps to delete on scheduled().
         # This enables the actual operation of deleting them to happen at the end.
         self._scheduled_to_delete: list[snap_holder.Snapshot] = []
+        # Timestamp since when the scheduled snapshot is due, if it is.
+        self._scheduled_due: float | None = None
+        # The snapshot created by scheduled(), if any.
+        self._scheduled_created: snap_holder.Snapshot | None = None
+
+    def _delete_snaps(
+        self, snaps: list[snap_holder.Snapshot], defer: bool = False
+    ) -> None:
+        if not snaps:
+            return
+        if defer or self._config.defer_deletion:
+            deletion_queue.enqueue(snaps)
+            self.snaps_queued = True
+        else:
+            snap_holder.Snapshot.delete_many(snaps)
+            self.snaps_deleted = True
+
+    # Part of scheduled().
+    def _defer_for_pressure(self, work: str, due: float) -> bool:
+        """Returns True if work should be postponed, since the system is busy.
+
+        Args:
+          work: Description of the work, for logging.
+          due: Timestamp since when the work is due. Work overdue by more than
+            pressure_grace_period is never postponed.
+        """
+        thresholds = {
+            "io": self._config.max_io_pressure,
+            "cpu": self._config.max_cpu_pressure,
+        }
+        if not any(x > 0 for x in thresholds.values()):
+            return False
+        if not self._pressure_read:
+            self._pressure = self._pressure_source()
+            self._pressure_read = True
+        if self._pressure is None:
+            return False
+        current = {"io": self._pressure.io, "cpu": self._pressure.cpu}
+        exceeded = [k for k, v in thresholds.items() if v > 0 and current[k] > v]
+        if not exceeded:
+            logging.info(f"Pressure {self._pressure} is low, proceeding with {work}")
+            return False
+        overdue = self._now.timestamp() - due
+        if overdue > self._config.pressure_grace_period:
+            logging.warning(
+                f"Pressure {self._pressure} exceeds the limit for {exceeded}, but "
+                f"{work} is overdue by {human_interval.humanize(overdue)}; proceeding"
+            )
+            return False
+        logging.warning(
+            f"Pressure {self._pressure} exceeds the limit for {exceeded}, "
+            f"postponing {work}"
+        )
+        return True
 
     # Part of scheduled().
     def _delete_expired_ttl(
@@ -139,9 +227,10 @@ class SnapOperator:
         Returns:
             True iff a new snapshot should be created.
         """
-        candidates = [
-            (x.snaptime, x.target) for x in snaps if x.metadata.trigger in {"", "S"}
-        ]
+        candidates_by_target = {
+            x.target: x for x in snaps if x.metadata.trigger in {"", "S"}
+        }
+        candidates = [(x.snaptime, x.target) for x in candidates_by_target.values()]
         # Append a placeholder to denote the backup that will be taken next.
         # If this is deleted, it would indicate not to create new backup.
         candidates.append((self._now, ""))
@@ -153,9 +242,9 @@ class SnapOperator:
                 return False
             elapsed_secs = (self._now - when).total_seconds()
             if elapsed_secs > self._config.min_keep_secs:
-                snap = snap_holder.Snapshot(target)
+                snap = candidates_by_target[target]
                 if snap.metadata.expiry is None:
-                    self._scheduled_to_delete.append(snap_holder.Snapshot(target))
+                    self._scheduled_to_delete.append(snap)
                 else:
                     # Note: It will eventually get deleted, we just need to wait until TTL.
                     logging.info(f"Refusing to clean up target with TTL: {target}")
@@ -199,18 +288,65 @@ class SnapOperator:
                 )
                 return
 
+        # Since when the scheduled work is due.
+        due = self._now.timestamp() if wait_until is None else wait_until.timestamp()
+        self._scheduled_due = due
+
         # Manage deletions and check if new backup is needed.
         need_new, ttl_secs = self._scheduled_deletion_and_creation(snaps)
+        if (
+            need_new
+            and self._config.snap_type == snap_type_enum.SnapType.RSYNC
+            and self._defer_for_pressure(
+                f"rsync snapshot of {self._config.source}", due
+            )
+        ):
+            return
         if need_new:
-            snapshot = snap_holder.Snapshot(self._config.dest_prefix + self._now_str)
+            snapshot = self._new_snapshot()
             snapshot.metadata.trigger = "S"
             if ttl_secs > 0:
                 snapshot.metadata.expiry = int(self._now.timestamp()) + ttl_secs
             snapshot.create_from(self._config.snap_type, self._config.source)
             self.snaps_created = True
+            self._scheduled_created = snapshot
+
+    # Part of scheduled().
+    def _save_schedule_state(self, snaps: list[snap_holder.Snapshot]) -> None:
+        """Records when scheduled() next has work, given the remaining snaps."""
+        to_delete = {x.target for x in self._scheduled_to_delete}
+        remaining = [x for x in snaps if x.target not in to_delete]
+        if self._scheduled_created is not None:
+            remaining.append(self._scheduled_created)
+        scheduled_snaps = [x for x in remaining if "S" in x.metadata.trigger]
+        wait_until = self._next_trigger_time(scheduled_snaps)
+        if wait_until is None:
+            # The next run decides whether to take a scheduled snapshot.
+            return
+        expiries = [x.metadata.expiry for x in remaining if x.metadata.expiry]
+        schedule_state.save(
+            self._config,
+            last_scheduled=scheduled_snaps[-1].epoch,
+            next_trigger=(wait_until - configs.DURATION_BUFFER).timestamp(),
+            earliest_expiry=min(expiries, default=None),
+        )
+
+    def _new_snapshot(self) -> snap_holder.Snapshot:
+        # With new metadata, not read from the file; since a name with milliseconds
+        # may be taken already, and is then moved forward by create_from().
+        return snap_holder.Snapshot(
+            self._config.dest_prefix + self._now_str,
+            metadata=snap_metadata.SnapMetadata(),
+            mechanism_options=self._config.mechanism_options,
+        )
 
     def _create_and_maintain_n_backups(
-        self, count: int, trigger: str, comment: str | None
+        self,
+        count: int,
+        trigger: str,
+        comment: str | None,
+        defer_cleanup: bool = False,
+        packages: list[str] | None = None,
     ):
         logging.info(f"Maintain {count} volumes of type {trigger}.")
         if not self._config.is_compatible_volume():
@@ -227,10 +363,12 @@ class SnapOperator:
             # will create one more).
             n_snaps_to_leave = count - 1
             # Create a new snap.
-            snapshot = snap_holder.Snapshot(self._config.dest_prefix + self._now_str)
+            snapshot = self._new_snapshot()
             snapshot.metadata.trigger = trigger
             if comment:
                 snapshot.metadata.comment = comment
+            if packages:
+                snapshot.metadata.packages = packages
             snapshot.create_from(self._config.snap_type, self._config.source)
             self.snaps_created = True
         else:
@@ -238,9 +376,10 @@ class SnapOperator:
             n_snaps_to_leave = 0
 
         # Clean up old snaps.
-        for expired in _all_but_last_k(previous_snaps, n_snaps_to_leave):
-            expired.delete()
-            self.snaps_deleted = True
+        self._delete_snaps(
+            list(_all_but_last_k(previous_snaps, n_snaps_to_leave)),
+            defer=defer_cleanup,
+        )
 
     def create(self, comment: str | None):
         try:
@@ -253,13 +392,20 @@ class SnapOperator:
             )
             raise
 
-    def on_pacman(self):
+    def on_pacman(self, packages: list[str] | None = None, defer_cleanup: bool = False):
+        """Takes a snapshot before a package transaction.
+
+        Args:
+          packages: Targets of the transaction, to record in the snapshot.
+          defer_cleanup: Queue old snaps for deletion instead of deleting them, to
+            return as soon as the new snap exists.
+        """
         last_snap: snap_holder.Snapshot | None = None
         for snap in get_existing_snaps(self._config):
             if snap.metadata.trigger == "I":
                 last_snap = snap
         if last_snap is not None:
-            time_since = (self._now - last_snap.snaptime).total_seconds()
+            time_since = self._now.timestamp() - last_snap.epoch
             if time_since < self._config.preinstall_interval:
                 logging.info(
                     f"Only {time_since:0.0f}s has passed since last install, "
@@ -270,6 +416,8 @@ class SnapOperator:
             count=self._config.keep_preinstall,
             trigger="I",
             comment=os_utils.last_pacman_command(),
+            defer_cleanup=defer_cleanup,
+            packages=packages,
         )
 
     def _next_trigger_time(
@@ -284,15 +432,37 @@ class SnapOperator:
         # so we just choose phase = 0 or UTC.
         phase = 0
         previous_mod = (
-            scheduled_snaps[-1].snaptime - datetime.timedelta(seconds=phase)
-        ).timestamp() // self._config.trigger_interval
+            scheduled_snaps[-1].epoch - phase
+        ) // self._config.trigger_interval
         wait_until = datetime.datetime.fromtimestamp(
             (previous_mod + 1) * self._config.trigger_interval + phase
         )
         return wait_until
 
+    def next_due(self) -> float | None:
+        """Returns the timestamp after which scheduled() has work; None if never."""
+        due = schedule_state.next_due(self._config)
+        if due is not None:
+            return due
+        if not os.path.isdir(os.path.dirname(self._config.dest_prefix)):
+            return None
+        snaps = list(get_existing_snaps(self._config))
+        candidates = [x.metadata.expiry for x in snaps if x.metadata.expiry]
+        wait_until = self._next_trigger_time(
+            [x for x in snaps if "S" in x.metadata.trigger]
+        )
+        if wait_until is not None:
+            candidates.append((wait_until - configs.DURATION_BUFFER).timestamp())
+        elif self._config.is_schedule_enabled():
+            # The first scheduled snapshot.
+            candidates.append(self._now.timestamp())
+        return min(candidates, default=None)
+
     def scheduled(self):
         """Triggers periodically by the system timer."""
+        if schedule_state.nothing_due(self._config, self._now.timestamp()):
+            logging.info(f"Nothing due for {self._config.config_file}")
+            return
         if not self._config.is_compatible_volume():
             # There is some kind of mismatch, for example the directory is not btrfs.
             # A warning should already be printed by the check implementation.
@@ -302,63 +472,122 @@ class SnapOperator:
 
         # Hold everything to be deleted, so that we delete at the end of scheduled().
         self._scheduled_to_delete = []
+        self._scheduled_due = None
+        self._scheduled_created = None
 
         # Delete expired snaps with TTL. Carry out irrespective of the waiting time.
-        snaps = list(get_existing_snaps(self._config))
-        snaps = self._delete_expired_ttl(snaps)
+        all_snaps = list(get_existing_snaps(self._config))
+        snaps = self._delete_expired_ttl(all_snaps)
 
         # All _scheduled_ snaps that will remain.
         scheduled_snaps = [x for x in snaps if "S" in x.metadata.trigger]
 
         self._manage_scheduled_lifecycle(scheduled_snaps)
 
-        for snap in self._scheduled_to_delete:
-            snap.delete()
-            self.snaps_deleted = True
+        if self._scheduled_to_delete:
+            # Deletions are due since the snapshots expired; or, when cleaned up
+            # without TTL, since the scheduled snapshot was due.
+            scheduled_due = (
+                self._now.timestamp()
+                if self._scheduled_due is None
+                else self._scheduled_due
+            )
+            due = min(
+                scheduled_due if x.metadata.expiry is None else x.metadata.expiry
+                for x in self._scheduled_to_delete
+            )
+            if self._defer_for_pressure(
+                f"deletion of {len(self._scheduled_to_delete)} snapshots", due
+            ):
+                self._scheduled_to_delete = []
+        self._delete_snaps(self._scheduled_to_delete)
 
-    def list_snaps(self):
-        """Print the backups for humans."""
-        print(f"Config: {self._config.config_file} (source={self._config.source})")
+        self._save_schedule_state(all_snaps)
+
+    def _snaps_to_list(self, package: str | None) -> Iterator[snap_holder.Snapshot]:
+        if package is None:
+            yield from get_existing_snaps(self._config, include_pending=True)
+            return
+        # Imported here, since it is only needed to list by package.
+        from . import package_index
+
+        _check_destdir(self._config)
+        destdir = os.path.dirname(self._config.dest_prefix)
+        index = snap_index.get(self._config.dest_prefix)
+        for name in package_index.snapshots_before(destdir, package):
+            yield from _to_snapshots(
+                self._config, index.find(os.path.join(destdir, name))
+            )
+
+    def _snaps_text_iter(self, package: str | None = None) -> Iterator[str]:
+        yield f"Config: {self._config.config_file} (source={self._config.source})"
         # Just display the log if it's not a btrfs volume.
         _ = self._config.is_compatible_volume()
-        print(f"Snaps at: {self._config.dest_prefix}...")
-        for snap in get_existing_snaps(self._config):
+        yield f"Snaps at: {self._config.dest_prefix}..."
+        now_ts = self._now.timestamp()
+        pending = deletion_queue.pending_targets()
+        for snap in self._snaps_to_list(package):
             columns: list[str] = []
             columns.append("  " + snap.target.removeprefix(self._config.dest_prefix))
             trigger_str = "".join(
                 c if snap.metadata.trigger == c else " " for c in "SIU"
             )
             columns.append(trigger_str)
-            # print(f'{snap.snaptime}  ', end='')
-            elapsed = (self._now - snap.snaptime).total_seconds()
+            elapsed = now_ts - snap.epoch
             elapsed_str = "(" + human_interval.humanize(elapsed) + " ago)"
             columns.append(f"{elapsed_str:<20}")
 
             ttl_str = ""
             if snap.metadata.expiry is not None:
-                ttl = snap.metadata.expiry - self._now.timestamp()
+                ttl = snap.metadata.expiry - now_ts
                 ttl_str = "TTL: " + human_interval.humanize(ttl)
             columns.append(f"{ttl_str:<18}")
 
+            if snap.target in pending:
+                columns.append("(pending deletion)")
             columns.append(snap.metadata.comment)
-            print("  ".join(columns))
-        print()
+            yield "  ".join(columns)
+        yield ""
 
-    def _snaps_json_iter(self) -> Iterator[str]:
-        result: dict[str, Any] = {
-            "config_file": self._config.config_file,
-            "source": self._config.source,
-        }
+    def _snaps_json_iter(self, package: str | None = None) -> Iterator[str]:
         # Just display the log if it's not a btrfs volume.
         _ = self._config.is_compatible_volume()
-        result["file"] = {"prefix": self._config.dest_prefix}
-        for snap in get_existing_snaps(self._config):
-            result["file"]["timestamp"] = snap.target.removeprefix(
-                self._config.dest_prefix
-            )
+        pending = deletion_queue.pending_targets()
+        for snap in self._snaps_to_list(package):
+            # A new dict for each snap, since as_json() omits empty fields.
+            result: dict[str, Any] = {
+                "config_file": self._config.config_file,
+                "source": self._config.source,
+                "file": {
+                    "prefix": self._config.dest_prefix,
+                    "timestamp": snap.target.removeprefix(self._config.dest_prefix),
+                },
+            }
             result.update(snap.as_json())
+            if snap.target in pending:
+                result["pending_deletion"] = True
             yield json.dumps(result, sort_keys=True, separators=(",", ":"))
 
+    def list_lines(self, as_json: bool, package: str | None = None) -> list[str]:
+        """Returns the lines printed by list_snaps() or list_snaps_json().
+
+        This allows the listing of configs to be prepared concurrently.
+
+        Args:
+          as_json: Whether to return JSON Lines.
+          package: If set, only list the snapshots taken before it changed.
+        """
+        return list(
+            self._snaps_json_iter(package)
+            if as_json
+            else self._snaps_text_iter(package)
+        )
+
+    def list_snaps(self):
+        """Print the backups for humans."""
+        for line in self._snaps_text_iter():
+            print(line)
+
     def list_snaps_json(self):
         """Print snaps for machine readable code."""
         for line in self._snaps_json_iter():
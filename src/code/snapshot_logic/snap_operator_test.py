@@ -14,6 +14,9 @@
 
 import contextlib
 import datetime
+import json
+import os
+import tempfile
 import time
 import unittest
 from collections.abc import Iterator
@@ -22,7 +25,10 @@ from unittest import mock
 from .. import configs
 from ..mechanisms import btrfs_mechanism
 from ..mechanisms import snap_type_enum
+from ..utils import pressure
 from . import auto_cleanup_without_ttl
+from . import deletion_queue
+from . import schedule_state
 from . import snap_holder
 from . import snap_operator
 
@@ -114,6 +120,72 @@ class SnapOperatorTest(unittest.TestCase):
             snap_type_enum.SnapType.BTRFS, "snap_source"
         )
 
+    def test_schedule_state(self):
+        self._old_snaps = [
+            snap_holder.Snapshot(
+                "/tmp/nodir/@home-" + _utc_to_local_str("20230213001000")
+            )
+        ]
+        self._old_snaps[-1].metadata.trigger = "S"
+        config = configs.Config(
+            config_file="config_file",
+            source="snap_source",
+            dest_prefix="/tmp/nodir/@home-",
+            trigger_interval=datetime.timedelta(hours=12).total_seconds(),
+            enable_scheduled_ttl=False,
+        )
+        with (
+            mock.patch.object(schedule_state, "nothing_due", return_value=False),
+            mock.patch.object(schedule_state, "save") as mock_save,
+        ):
+            snap_operator.SnapOperator(
+                config, _utc_to_local("20230213130000")
+            ).scheduled()
+        # The new snapshot is next due after 12 hours, less DURATION_BUFFER.
+        mock_save.assert_called_once_with(
+            config,
+            last_scheduled=_utc_to_local("20230213130000").timestamp(),
+            next_trigger=_utc_to_local("20230214000000").timestamp()
+            - configs.DURATION_BUFFER.total_seconds(),
+            earliest_expiry=None,
+        )
+
+        # Nothing is due; the volume is not even checked.
+        with (
+            mock.patch.object(schedule_state, "nothing_due", return_value=True),
+            mock.patch.object(configs.Config, "is_compatible_volume") as mock_check,
+        ):
+            snap_operator.SnapOperator(
+                config, _utc_to_local("20230213140000")
+            ).scheduled()
+        mock_check.assert_not_called()
+
+    def test_next_due(self):
+        self._old_snaps = [
+            snap_holder.Snapshot(
+                "/tmp/nodir/@home-" + _utc_to_local_str("20230213001000")
+            )
+        ]
+        self._old_snaps[-1].metadata.trigger = "S"
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="/tmp/nodir/@home-",
+                trigger_interval=datetime.timedelta(hours=12).total_seconds(),
+            ),
+            now=_utc_to_local("20230213110000"),
+        )
+        trigger = (
+            _utc_to_local("20230213120000") - configs.DURATION_BUFFER
+        ).timestamp()
+        with mock.patch.object(snap_operator.os.path, "isdir", return_value=True):
+            self.assertEqual(snapper.next_due(), trigger)
+
+            # A TTL expiring earlier.
+            self._old_snaps[-1].metadata.expiry = trigger - 100
+            self.assertEqual(snapper.next_due(), trigger - 100)
+
     def test_scheduled_ttl_expiry(self):
         self._old_snaps = [
             snap_holder.Snapshot(
@@ -164,6 +236,7 @@ class SnapOperatorTest(unittest.TestCase):
                 now=_utc_to_local("20230213130000"),
             )
             self._mock_delete.reset_mock()
+            self._mock_delete_many.reset_mock()
             self._mock_create_from.reset_mock()
             return snapper
 
@@ -204,6 +277,200 @@ class SnapOperatorTest(unittest.TestCase):
         setup_n_snaps(3)._create_and_maintain_n_backups(0, "I", None)
         self._mock_create_from.assert_not_called()
         self.assertEqual(self._mock_delete.call_count, 3)
+        # All are deleted with one call.
+        self._mock_delete_many.assert_called_once()
+
+    def test_defer_deletion(self):
+        self._old_snaps = [
+            snap_holder.Snapshot(f"/tmp/nodir/@home-202311150{k}0000") for k in range(3)
+        ]
+        for snap in self._old_snaps:
+            snap.metadata.trigger = "I"
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="dest_prefix",
+                defer_deletion=True,
+            ),
+            now=_utc_to_local("20230213130000"),
+        )
+        with mock.patch.object(deletion_queue, "enqueue") as mock_enqueue:
+            snapper._create_and_maintain_n_backups(2, "I", None)
+        mock_enqueue.assert_called_once_with(self._old_snaps[:2])
+        self._mock_delete_many.assert_not_called()
+        # Nothing is deleted yet, so there is nothing to sync.
+        self.assertFalse(snapper.snaps_deleted)
+
+    def test_pressure(self):
+        self._old_snaps = [
+            snap_holder.Snapshot(
+                # Added 10 minutes, to counteract DURATION_BUFFER.
+                "/tmp/nodir/@home-" + _utc_to_local_str("20230213001000")
+            )
+        ]
+        self._old_snaps[-1].metadata.trigger = "S"
+
+        def make_snapper(
+            now: str, io: float, grace: float = 6 * 60 * 60.0
+        ) -> snap_operator.SnapOperator:
+            return snap_operator.SnapOperator(
+                config=configs.Config(
+                    config_file="config_file",
+                    source="snap_source",
+                    dest_prefix="dest_prefix",
+                    snap_type=snap_type_enum.SnapType.RSYNC,
+                    trigger_interval=datetime.timedelta(hours=12).total_seconds(),
+                    max_io_pressure=10.0,
+                    pressure_grace_period=grace,
+                ),
+                now=_utc_to_local(now),
+                pressure_source=lambda: pressure.Pressure(io=io, cpu=0.0),
+            )
+
+        self._exit_stack.enter_context(
+            mock.patch.object(configs.Config, "is_compatible_volume", lambda self: True)
+        )
+        # Due since 12:10; high pressure postpones both creation and deletion.
+        make_snapper("20230213130000", io=50.0).scheduled()
+        self._mock_create_from.assert_not_called()
+        self._mock_delete.assert_not_called()
+
+        # Overdue by more than the grace period.
+        make_snapper("20230213130000", io=50.0, grace=30 * 60.0).scheduled()
+        self._mock_create_from.assert_called_once_with(
+            snap_type_enum.SnapType.RSYNC, "snap_source"
+        )
+        self._mock_delete.assert_called_once_with()
+
+        # Low pressure.
+        self._mock_create_from.reset_mock()
+        self._mock_delete.reset_mock()
+        make_snapper("20230213130000", io=5.0).scheduled()
+        self._mock_create_from.assert_called_once()
+        self._mock_delete.assert_called_once_with()
+
+        # PSI not available.
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="dest_prefix",
+                max_cpu_pressure=10.0,
+            ),
+            now=_FAKE_NOW,
+            pressure_source=lambda: None,
+        )
+        self.assertFalse(snapper._defer_for_pressure("work", _FAKE_NOW.timestamp()))
+
+    def test_on_pacman_defer_cleanup(self):
+        self._old_snaps = [
+            snap_holder.Snapshot(f"/tmp/nodir/@home-202311150{k}0000") for k in range(2)
+        ]
+        for snap in self._old_snaps:
+            snap.metadata.trigger = "I"
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="dest_prefix",
+            ),
+            now=_utc_to_local("20231116000000"),
+        )
+        with (
+            mock.patch.object(
+                snap_operator.os_utils, "last_pacman_command", return_value="pacman -S"
+            ),
+            mock.patch.object(deletion_queue, "enqueue") as mock_enqueue,
+        ):
+            snapper.on_pacman(defer_cleanup=True)
+        self._mock_create_from.assert_called_once()
+        mock_enqueue.assert_called_once_with(self._old_snaps)
+        self._mock_delete_many.assert_not_called()
+        self.assertTrue(snapper.snaps_queued)
+
+    def test_on_pacman_packages(self):
+        created: list[snap_holder.Snapshot] = []
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="dest_prefix",
+            ),
+            now=_utc_to_local("20231116000000"),
+        )
+        with (
+            mock.patch.object(
+                snap_operator.os_utils, "last_pacman_command", return_value="pacman -S"
+            ),
+            mock.patch.object(
+                snap_holder.Snapshot,
+                "create_from",
+                lambda snap, snap_type, source: created.append(snap),  # type: ignore
+            ),
+        ):
+            snapper.on_pacman(packages=["linux", "glibc"])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(created[0].metadata.trigger, "I")
+        self.assertEqual(created[0].metadata.comment, "pacman -S")
+        self.assertEqual(created[0].metadata.packages, ["linux", "glibc"])
+
+    def test_list_package(self):
+        with tempfile.TemporaryDirectory() as dir:
+            for timestr, packages in [
+                ("20230213001000", ["linux"]),
+                ("20230214001000", ["glibc"]),
+                ("20230215001000", ["linux", "glibc"]),
+            ]:
+                os.mkdir(os.path.join(dir, "@home-" + timestr))
+                with open(os.path.join(dir, f"@home-{timestr}-meta.json"), "w") as f:
+                    json.dump(
+                        {"source": "snap_source", "trigger": "I", "packages": packages},
+                        f,
+                    )
+            snapper = snap_operator.SnapOperator(
+                config=configs.Config(
+                    config_file="config_file",
+                    source="snap_source",
+                    dest_prefix=os.path.join(dir, "@home-"),
+                ),
+                now=_FAKE_NOW,
+            )
+            lines = snapper.list_lines(as_json=True, package="linux")
+        self.assertEqual(
+            [json.loads(line)["file"]["timestamp"] for line in lines],
+            ["20230213001000", "20230215001000"],
+        )
+        self.assertEqual(json.loads(lines[-1])["packages"], ["linux", "glibc"])
+
+    def test_list_json_fields_do_not_leak(self):
+        self._old_snaps = [
+            snap_holder.Snapshot("/tmp/nodir/@home-20230213001000"),
+            snap_holder.Snapshot("/tmp/nodir/@home-20230214001000"),
+        ]
+        self._old_snaps[0].metadata.trigger = "I"
+        self._old_snaps[0].metadata.packages = ["linux"]
+        self._old_snaps[0].metadata.expiry = 1234
+        self._old_snaps[1].metadata.trigger = "S"
+        snapper = snap_operator.SnapOperator(
+            config=configs.Config(
+                config_file="config_file",
+                source="snap_source",
+                dest_prefix="/tmp/nodir/@home-",
+            ),
+            now=_FAKE_NOW,
+        )
+        with mock.patch.object(
+            deletion_queue,
+            "pending_targets",
+            return_value={"/tmp/nodir/@home-20230213001000"},
+        ):
+            results = [json.loads(x) for x in snapper._snaps_json_iter()]
+        self.assertEqual(results[0]["packages"], ["linux"])
+        self.assertEqual(results[0]["expiry"], 1234)
+        self.assertTrue(results[0]["pending_deletion"])
+        for key in ["packages", "expiry", "pending_deletion"]:
+            self.assertNotIn(key, results[1])
 
     def test_delete_expired_ttl(self):
         self._old_snaps = [
@@ -281,9 +548,15 @@ class SnapOperatorTest(unittest.TestCase):
                 lambda self, _: True,
             )
         )
+        # Called once for each snapshot deleted.
         self._mock_delete = mock.MagicMock()
+        self._mock_delete_many = mock.MagicMock(
+            side_effect=lambda snaps: [self._mock_delete() for _ in snaps]
+        )
         self._exit_stack.enter_context(
-            mock.patch.object(snap_holder.Snapshot, "delete", self._mock_delete)
+            mock.patch.object(
+                snap_holder.Snapshot, "delete_many", self._mock_delete_many
+            )
         )
         self._mock_create_from = mock.MagicMock()
         self._exit_stack.enter_context(
@@ -306,7 +579,9 @@ class SnapOperatorTest(unittest.TestCase):
         )
         self._exit_stack.enter_context(
             mock.patch.object(
-                snap_operator, "get_existing_snaps", lambda configs: self._old_snaps
+                snap_operator,
+                "get_existing_snaps",
+                lambda config, include_pending=False: self._old_snaps,
             )
         )
 
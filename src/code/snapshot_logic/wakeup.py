@@ -0,0 +1,131 @@
+"""Wakes up yabsnap exactly when a config has scheduled work.
+
+The hourly yabsnap.timer wakes up regardless of need, and limits trigger_interval to
+multiples of an hour. Instead, the earliest time any config needs a scheduled run is
+found with a min-heap of the configs by next_due(), i.e. the next trigger or the
+earliest TTL expiry. Then either -
+- program_timer() sets a transient systemd timer to start yabsnap.service then. It is
+  called by yabsnap.service after every scheduled run; or
+- run_forever() sleeps until then, runs the configs which are due, and repeats.
+
+The hourly timer is kept as a fallback, e.g. if the transient timer is lost on reboot.
+With the schedule state, it is cheap when nothing is due.
+"""
+
+import datetime
+import heapq
+import logging
+import time
+from collections.abc import Callable, Iterable
+
+from .. import configs
+from .. import global_flags
+from ..utils import fs_probe
+from ..utils import mtab_parser
+from ..utils import os_utils
+from . import snap_operator
+
+# Name of the transient timer and its service.
+_WAKEUP_UNIT = "yabsnap-wakeup"
+# If work is still due after a run, e.g. because it was postponed due to pressure,
+# retry after this.
+_RETRY_SECS = 5 * 60.0
+# In run_forever(), the configs are re-read at least this often.
+_MAX_SLEEP_SECS = 60 * 60.0
+
+# Elements are (due timestamp, index, config). The index breaks ties, since configs
+# are not comparable.
+_DueHeap = list[tuple[float, int, configs.Config]]
+
+
+def _due_heap(configs_iter: Iterable[configs.Config], now: float) -> _DueHeap:
+    heap: _DueHeap = []
+    now_dt = datetime.datetime.fromtimestamp(now)
+    for index, config in enumerate(configs_iter):
+        due = snap_operator.SnapOperator(config, now_dt).next_due()
+        logging.info(f"Next due for {config.config_file}: {due}")
+        if due is not None:
+            heap.append((due, index, config))
+    heapq.heapify(heap)
+    return heap
+
+
+def _is_due(due: float, now: float) -> bool:
+    # A due of now is also treated as due, e.g. for the first scheduled snapshot of a
+    # config. Otherwise, if it stays due (e.g. postponed due to pressure, or in
+    # --dry-run), the wake up would be repeated every second.
+    return due <= now
+
+
+def _wakeup_time(due: float, now: float) -> float:
+    if _is_due(due, now):
+        return now + _RETRY_SECS
+    # Work is due once the time is past due.
+    return due + 1
+
+
+def next_wakeup(configs_iter: Iterable[configs.Config], now: float) -> float | None:
+    """Returns when the next scheduled run should be; None if no config needs one."""
+    heap = _due_heap(configs_iter, now)
+    if not heap:
+        return None
+    return _wakeup_time(heap[0][0], now)
+
+
+def program_timer(when: float | None) -> None:
+    """Replaces the transient timer, to start yabsnap.service at when."""
+    # Stopping an elapsed or absent timer fails harmlessly.
+    commands = [
+        f"systemctl stop {_WAKEUP_UNIT}.timer",
+        f"systemctl reset-failed {_WAKEUP_UNIT}.timer {_WAKEUP_UNIT}.service",
+    ]
+    if when is not None:
+        logging.info(f"Next scheduled run at {datetime.datetime.fromtimestamp(when)}")
+        commands.append(
+            f"systemd-run --quiet --unit={_WAKEUP_UNIT} --on-calendar=@{int(when)} "
+            "--timer-property=AccuracySec=1s "
+            "systemctl start --no-block yabsnap.service"
+        )
+    for command in commands:
+        if global_flags.FLAGS.dryrun:
+            os_utils.eprint(f"Would run {command}")
+            continue
+        try:
+            os_utils.runsh_or_error(command)
+        except (os_utils.CommandError, OSError) as exc:
+            logging.info(exc)
+
+
+def _clear_caches() -> None:
+    # Mounts and devices may change while running, e.g. a drive is plugged in. These
+    # are otherwise cached for the lifetime of the process.
+    mtab_parser.clear_cache()
+    os_utils.clear_filesystem_uuid_cache()
+    fs_probe.clear_cache()
+
+
+def run_forever(
+    configs_fn: Callable[[], Iterable[configs.Config]],
+    run: Callable[[list[configs.Config]], None],
+) -> None:
+    """Runs configs when they are due, until interrupted.
+
+    Args:
+      configs_fn: Returns the configs, re-read on each iteration.
+      run: Does the scheduled run for the configs passed.
+    """
+    while True:
+        _clear_caches()
+        now = time.time()
+        heap = _due_heap(configs_fn(), now)
+        due_configs: list[configs.Config] = []
+        while heap and _is_due(heap[0][0], now):
+            due_configs.append(heapq.heappop(heap)[2])
+        if due_configs:
+            run(due_configs)
+        # Configs which ran are evaluated again on the next iteration.
+        sleep_until = now + (_RETRY_SECS if due_configs else _MAX_SLEEP_SECS)
+        if heap:
+            sleep_until = min(sleep_until, _wakeup_time(heap[0][0], now))
+        logging.info(f"Sleeping until {datetime.datetime.fromtimestamp(sleep_until)}")
+        time.sleep(max(0.0, sleep_until - time.time()))
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import configs
+from ..utils import fs_probe
+from ..utils import mountinfo
+from ..utils import os_utils
+from . import snap_operator
+from . import wakeup
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+def _config(name: str) -> configs.Config:
+    return configs.Config(config_file=name, source="/", dest_prefix="/tmp/nodir/@-")
+
+
+class _Interrupt(Exception):
+    pass
+
+
+class WakeupTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        # Next due timestamps, by config file.
+        self._due: dict[str, float | None] = {}
+        patcher = mock.patch.object(
+            snap_operator.SnapOperator,
+            "next_due",
+            autospec=True,
+            side_effect=lambda op: self._due[op._config.config_file],
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_next_wakeup(self):
+        self._due = {"a": 3000.0, "b": None, "c": 2000.0}
+        all_configs = [_config(x) for x in self._due]
+        self.assertEqual(wakeup.next_wakeup(all_configs, now=1000.0), 2001.0)
+
+        # Overdue, e.g. postponed due to pressure.
+        self._due["c"] = 500.0
+        self.assertEqual(
+            wakeup.next_wakeup(all_configs, now=1000.0), 1000.0 + wakeup._RETRY_SECS
+        )
+
+        # Due now.
+        self._due["c"] = 1000.0
+        self.assertEqual(
+            wakeup.next_wakeup(all_configs, now=1000.0), 1000.0 + wakeup._RETRY_SECS
+        )
+
+        self._due = {"b": None}
+        self.assertIsNone(wakeup.next_wakeup([_config("b")], now=1000.0))
+
+    def test_program_timer(self):
+        with mock.patch.object(os_utils, "runsh_or_error") as mock_runsh:
+            wakeup.program_timer(2001.0)
+        self.assertEqual(
+            [x.args[0] for x in mock_runsh.call_args_list],
+            [
+                "systemctl stop yabsnap-wakeup.timer",
+                "systemctl reset-failed yabsnap-wakeup.timer yabsnap-wakeup.service",
+                "systemd-run --quiet --unit=yabsnap-wakeup --on-calendar=@2001 "
+                "--timer-property=AccuracySec=1s "
+                "systemctl start --no-block yabsnap.service",
+            ],
+        )
+
+    def test_run_forever(self):
+        self._due = {"a": 3000.0, "b": 900.0, "c": 800.0}
+        all_configs = [_config(x) for x in self._due]
+        run = mock.MagicMock()
+        with (
+            mock.patch.object(wakeup.time, "time", return_value=1000.0),
+            mock.patch.object(
+                wakeup.time, "sleep", side_effect=_Interrupt
+            ) as mock_sleep,
+            self.assertRaises(_Interrupt),
+        ):
+            wakeup.run_forever(lambda: all_configs, run)
+        # The due configs are run in order.
+        run.assert_called_once_with([all_configs[2], all_configs[1]])
+        mock_sleep.assert_called_once_with(wakeup._RETRY_SECS)
+
+    def test_run_forever_clears_caches(self):
+        run = mock.MagicMock()
+        with (
+            mock.patch.object(wakeup.time, "time", return_value=1000.0),
+            mock.patch.object(wakeup.time, "sleep", side_effect=[None, _Interrupt]),
+            mock.patch.object(mountinfo, "_MOUNTINFO", os.devnull),
+            self.assertRaises(_Interrupt),
+        ):
+            mountinfo.entries()
+            fs_probe._probed[(1, "/stale")] = None
+            os_utils._uuid_by_st_dev[1] = "stale"
+            self.addCleanup(os_utils._uuid_by_st_dev.pop, 1, None)
+            wakeup.run_forever(list, run)
+            self.assertEqual(mountinfo.entries.cache_info().currsize, 0)
+        self.assertNotIn((1, "/stale"), fs_probe._probed)
+        self.assertNotIn(1, os_utils._uuid_by_st_dev)
+        run.assert_not_called()
+
+
+class WakeupFirstSnapshotTest(unittest.TestCase):
+    def test_empty_destination(self):
+        # No scheduled snapshot yet; the first one is due now.
+        with tempfile.TemporaryDirectory() as dir:
+            config = configs.Config(
+                config_file=os.path.join(dir, "home.conf"),
+                source="/home",
+                dest_prefix=os.path.join(dir, "@home-"),
+            )
+            self.assertEqual(
+                wakeup.next_wakeup([config], now=1000.0), 1000.0 + wakeup._RETRY_SECS
+            )
+
+            run = mock.MagicMock()
+            with (
+                mock.patch.object(wakeup.time, "time", return_value=1000.0),
+                mock.patch.object(wakeup.time, "sleep", side_effect=_Interrupt),
+                self.assertRaises(_Interrupt),
+            ):
+                wakeup.run_forever(lambda: [config], run)
+            run.assert_called_once_with([config])
+
+
+if __name__ == "__main__":
+    unittest.main()
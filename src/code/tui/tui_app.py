@@ -1,3 +1,4 @@
+import contextlib
 import datetime
 import json
 import os
@@ -178,7 +179,7 @@ class _YabsnapApp(app.App[None]):
             )
 
             # Age
-            elapsed: float = (now - snap.snaptime).total_seconds()
+            elapsed: float = now.timestamp() - snap.epoch
             age_str: str = human_interval.humanize(elapsed)
 
             # TTL
@@ -210,8 +211,14 @@ class _YabsnapApp(app.App[None]):
                 return
 
             assert self._current_config is not None
+            cm: contextlib.AbstractContextManager[datetime.datetime]
+            if self._current_config.subsecond_names:
+                # Names with milliseconds are made unique when the snapshot is created.
+                cm = contextlib.nullcontext(datetime.datetime.now())
+            else:
+                cm = time_lock.locked_now()
             try:
-                with time_lock.locked_now() as now:
+                with cm as now:
                     snapper: snap_operator.SnapOperator = snap_operator.SnapOperator(
                         self._current_config, now
                     )
@@ -242,7 +249,10 @@ class _YabsnapApp(app.App[None]):
                 return
             try:
                 assert self._current_config is not None
-                snap: snap_holder.Snapshot = snap_holder.Snapshot(target_path)
+                snap: snap_holder.Snapshot = snap_holder.Snapshot(
+                    target_path,
+                    mechanism_options=self._current_config.mechanism_options,
+                )
                 snap.delete()
                 self._current_config.call_post_hooks()
                 self.notify(f"Deleted snapshot: {target_path}")
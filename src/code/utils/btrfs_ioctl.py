@@ -0,0 +1,102 @@
+"""Creates and deletes btrfs subvolumes with ioctl(2), instead of the btrfs command.
+
+See linux/btrfs.h for the requests and their structures. All ioctls are issued through
+_ioctl(), which tests can replace to run without a btrfs volume.
+"""
+
+import dataclasses
+import errno
+import fcntl
+import os
+import struct
+
+# _IOW(BTRFS_IOCTL_MAGIC, 23, struct btrfs_ioctl_vol_args_v2).
+_SNAP_CREATE_V2 = 0x50009417
+# _IOW(BTRFS_IOCTL_MAGIC, 63, struct btrfs_ioctl_vol_args_v2).
+_SNAP_DESTROY_V2 = 0x5000943F
+# _IOR(BTRFS_IOCTL_MAGIC, 60, struct btrfs_ioctl_get_subvol_info_args).
+_GET_SUBVOL_INFO = 0x81F8943C
+
+_SUBVOL_RDONLY = 1 << 1
+
+# struct btrfs_ioctl_vol_args_v2: fd, transid, flags, a 32 byte union unused here,
+# and name[BTRFS_SUBVOL_NAME_MAX + 1].
+_VOL_ARGS_V2 = struct.Struct("=qQQ32x4040s")
+_SUBVOL_NAME_MAX = 4039
+
+# struct btrfs_ioctl_get_subvol_info_args.
+_SUBVOL_INFO_SIZE = 504
+_SUBVOL_INFO_TREEID_OFFSET = 0
+_SUBVOL_INFO_GENERATION_OFFSET = 280
+
+# Errors indicating that the ioctls are not supported here, e.g. on an older kernel or
+# on a filesystem other than btrfs.
+UNSUPPORTED_ERRNOS = frozenset(
+    {errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class SubvolInfo:
+    subvol_id: int
+    generation: int
+
+
+def _ioctl(fd: int, request: int, buf: bytearray) -> None:
+    fcntl.ioctl(fd, request, buf, True)
+
+
+def _open_dir(path: str) -> int:
+    return os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+
+
+def _vol_args(fd: int, flags: int, name: str) -> bytearray:
+    encoded = os.fsencode(name)
+    if len(encoded) > _SUBVOL_NAME_MAX:
+        raise OSError(errno.ENAMETOOLONG, os.strerror(errno.ENAMETOOLONG), name)
+    return bytearray(_VOL_ARGS_V2.pack(fd, 0, flags, encoded))
+
+
+def create_snapshot(source: str, destination: str) -> None:
+    """Creates a read-only snapshot of the subvolume source at destination.
+
+    Raises:
+      OSError: If the snapshot could not be created. The errno is one of
+        UNSUPPORTED_ERRNOS if the ioctl is not available.
+    """
+    source_fd = _open_dir(source)
+    try:
+        parent_fd = _open_dir(os.path.dirname(destination))
+        try:
+            args = _vol_args(source_fd, _SUBVOL_RDONLY, os.path.basename(destination))
+            _ioctl(parent_fd, _SNAP_CREATE_V2, args)
+        finally:
+            os.close(parent_fd)
+    finally:
+        os.close(source_fd)
+
+
+def delete_subvolume(path: str) -> None:
+    """Deletes the subvolume at path.
+
+    Raises:
+      OSError: As for create_snapshot().
+    """
+    parent_fd = _open_dir(os.path.dirname(path))
+    try:
+        _ioctl(parent_fd, _SNAP_DESTROY_V2, _vol_args(0, 0, os.path.basename(path)))
+    finally:
+        os.close(parent_fd)
+
+
+def subvol_info(path: str) -> SubvolInfo:
+    """Returns the ID and generation of the subvolume at path."""
+    fd = _open_dir(path)
+    try:
+        buf = bytearray(_SUBVOL_INFO_SIZE)
+        _ioctl(fd, _GET_SUBVOL_INFO, buf)
+    finally:
+        os.close(fd)
+    (subvol_id,) = struct.unpack_from("=Q", buf, _SUBVOL_INFO_TREEID_OFFSET)
+    (generation,) = struct.unpack_from("=Q", buf, _SUBVOL_INFO_GENERATION_OFFSET)
+    return SubvolInfo(subvol_id=subvol_id, generation=generation)
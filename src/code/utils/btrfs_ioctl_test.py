@@ -0,0 +1,77 @@
+import errno
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from . import btrfs_ioctl
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class _FakeIoctl:
+    """Records ioctls, and answers GET_SUBVOL_INFO."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, int, bytes]] = []
+
+    def __call__(self, fd: int, request: int, buf: bytearray) -> None:
+        self.calls.append((os.readlink(f"/proc/self/fd/{fd}"), request, bytes(buf)))
+        if request == btrfs_ioctl._GET_SUBVOL_INFO:
+            struct.pack_into("=Q", buf, 0, 260)
+            struct.pack_into("=Q", buf, 280, 12345)
+
+
+class BtrfsIoctlTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self._dir = os.path.realpath(tmp.name)
+        self._source = os.path.join(self._dir, "source")
+        os.mkdir(self._source)
+        self._ioctl = _FakeIoctl()
+        patcher = mock.patch.object(btrfs_ioctl, "_ioctl", self._ioctl)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_struct_sizes(self):
+        self.assertEqual(btrfs_ioctl._VOL_ARGS_V2.size, 4096)
+        # The size is encoded in the request.
+        self.assertEqual((btrfs_ioctl._SNAP_CREATE_V2 >> 16) & 0x3FFF, 4096)
+        self.assertEqual((btrfs_ioctl._GET_SUBVOL_INFO >> 16) & 0x3FFF, 504)
+
+    def test_create_snapshot(self):
+        btrfs_ioctl.create_snapshot(self._source, os.path.join(self._dir, "@snap"))
+        [(path, request, args)] = self._ioctl.calls
+        self.assertEqual(path, self._dir)
+        self.assertEqual(request, btrfs_ioctl._SNAP_CREATE_V2)
+        _, transid, flags, name = btrfs_ioctl._VOL_ARGS_V2.unpack(args)
+        self.assertEqual(transid, 0)
+        self.assertEqual(flags, btrfs_ioctl._SUBVOL_RDONLY)
+        self.assertEqual(name.rstrip(b"\0"), b"@snap")
+
+    def test_delete_subvolume(self):
+        btrfs_ioctl.delete_subvolume(self._source)
+        [(path, request, args)] = self._ioctl.calls
+        self.assertEqual(path, self._dir)
+        self.assertEqual(request, btrfs_ioctl._SNAP_DESTROY_V2)
+        self.assertEqual(args.rstrip(b"\0")[56:], b"source")
+
+    def test_subvol_info(self):
+        self.assertEqual(
+            btrfs_ioctl.subvol_info(self._source),
+            btrfs_ioctl.SubvolInfo(subvol_id=260, generation=12345),
+        )
+
+    def test_name_too_long(self):
+        with self.assertRaises(OSError) as cm:
+            btrfs_ioctl.delete_subvolume(os.path.join(self._dir, "x" * 4040))
+        self.assertEqual(cm.exception.errno, errno.ENAMETOOLONG)
+        self.assertEqual(self._ioctl.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Probes the filesystem of a path in-process.
+
+Checking whether a path is e.g. a btrfs subvolume needs its filesystem type and inode.
+These are read here with statfs(2) and stat(2), instead of spawning `stat`.
+
+Results are memoized per (device, path) for the lifetime of the process, so repeated
+checks of the same source are free. Mounting another filesystem on the path changes its
+device, and causes a new probe.
+"""
+
+import ctypes
+import dataclasses
+import functools
+import logging
+import os
+
+from . import os_utils
+
+# Magic numbers from linux/magic.h, and their names as reported by `stat -f`.
+_FS_MAGIC_NAMES = {
+    0x9123683E: "btrfs",
+    0xCA451A4E: "bcachefs",
+    0xEF53: "ext2/ext3",
+    0x58465342: "xfs",
+    0x01021994: "tmpfs",
+    0x794C7630: "overlayfs",
+}
+
+# Large enough for struct statfs on all architectures.
+_STATFS_BUFSIZE = 256
+
+
+@dataclasses.dataclass(frozen=True)
+class FsInfo:
+    # Name of the filesystem type, e.g. "btrfs"; or its magic in hex if not known.
+    fstype: str
+    inode: int
+
+
+# Memoized results, by (st_dev, path).
+_probed: dict[tuple[int, str], FsInfo | None] = {}
+
+
+@functools.cache
+def _libc() -> ctypes.CDLL:
+    # The symbols of the running process, which include libc.
+    return ctypes.CDLL(None, use_errno=True)
+
+
+def _statfs_magic(path: str) -> int:
+    """Returns the f_type of statfs(2) on path."""
+    buf = ctypes.create_string_buffer(_STATFS_BUFSIZE)
+    if _libc().statfs(os.fsencode(path), buf) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), path)
+    # f_type is the first field of struct statfs, a machine word.
+    return ctypes.c_ulong.from_buffer(buf).value & 0xFFFFFFFF
+
+
+def _fstype(path: str) -> str | None:
+    try:
+        magic = _statfs_magic(path)
+    except (AttributeError, OSError) as exc:
+        # Unusual libc; fall back to the stat command.
+        logging.info(f"statfs failed for {path}: {exc!r}")
+        fstype = os_utils.runsh("stat -f --format=%T " + path)
+        return fstype.strip() if fstype else None
+    return _FS_MAGIC_NAMES.get(magic, f"0x{magic:x}")
+
+
+def clear_cache() -> None:
+    """Forgets the filesystems probed, e.g. if mounts may have changed since."""
+    _probed.clear()
+
+
+def probe(path: str) -> FsInfo | None:
+    """Returns the filesystem type and inode of path; None if it cannot be accessed."""
+    try:
+        st = os.stat(path)
+    except OSError as exc:
+        logging.info(f"Cannot stat {path}: {exc}")
+        return None
+    key = (st.st_dev, path)
+    if key not in _probed:
+        fstype = _fstype(path)
+        _probed[key] = None if fstype is None else FsInfo(fstype, st.st_ino)
+    return _probed[key]
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import fs_probe
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+
+class FsProbeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        fs_probe._probed.clear()
+        self.addCleanup(fs_probe._probed.clear)
+
+    def test_probe(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with mock.patch.object(
+                fs_probe, "_statfs_magic", return_value=0x9123683E
+            ) as mock_statfs:
+                self.assertEqual(
+                    fs_probe.probe(dir),
+                    fs_probe.FsInfo(fstype="btrfs", inode=os.stat(dir).st_ino),
+                )
+                # Memoized.
+                fs_probe.probe(dir)
+            mock_statfs.assert_called_once_with(dir)
+
+            self.assertIsNone(fs_probe.probe(os.path.join(dir, "nonexistent")))
+
+    def test_statfs(self):
+        with tempfile.TemporaryDirectory() as dir:
+            fsinfo = fs_probe.probe(dir)
+        assert fsinfo is not None
+        self.assertNotEqual(fsinfo.fstype, "")
+
+        with self.assertRaises(FileNotFoundError):
+            fs_probe._statfs_magic("/nonexistent/path")
+
+    def test_unknown_magic(self):
+        with (
+            tempfile.TemporaryDirectory() as dir,
+            mock.patch.object(fs_probe, "_statfs_magic", return_value=0x1234),
+        ):
+            fsinfo = fs_probe.probe(dir)
+        assert fsinfo is not None
+        self.assertEqual(fsinfo.fstype, "0x1234")
+
+
+if __name__ == "__main__":
+    unittest.main()
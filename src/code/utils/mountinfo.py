@@ -0,0 +1,81 @@
+"""Parses /proc/self/mountinfo, to find mounts without subprocesses.
+
+The mount of a path is found with mtab_parser.find_mount().
+
+See proc_pid_mountinfo(5) for the format. Example line -
+36 35 98:0 /@home /home rw,noatime master:1 - btrfs /dev/sda2 rw,subvolid=257,subvol=/@home
+"""
+
+import dataclasses
+import functools
+import logging
+import re
+
+_MOUNTINFO = "/proc/self/mountinfo"
+
+
+@dataclasses.dataclass(frozen=True)
+class MountInfo:
+    mount_id: int
+    parent_id: int
+    # The st_dev of files in this mount.
+    major: int
+    minor: int
+    # Root of the mount within the filesystem, e.g. "/@home" for a btrfs subvolume.
+    root: str
+    mount_point: str
+    mount_options: str
+    fstype: str
+    # E.g. "/dev/sda2".
+    source: str
+    super_options: str
+
+
+def _unescape(field: str) -> str:
+    # Space, tab, newline and backslash are escaped as octal, e.g. "\040".
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def parse(content: str) -> list[MountInfo]:
+    result: list[MountInfo] = []
+    for line in content.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            # Optional fields end with "-".
+            separator = fields.index("-", 6)
+            major, minor = fields[2].split(":")
+            result.append(
+                MountInfo(
+                    mount_id=int(fields[0]),
+                    parent_id=int(fields[1]),
+                    major=int(major),
+                    minor=int(minor),
+                    root=_unescape(fields[3]),
+                    mount_point=_unescape(fields[4]),
+                    mount_options=_unescape(fields[5]),
+                    fstype=fields[separator + 1],
+                    source=_unescape(fields[separator + 2]),
+                    super_options=(
+                        _unescape(fields[separator + 3])
+                        if len(fields) > separator + 3
+                        else ""
+                    ),
+                )
+            )
+        except (ValueError, IndexError):
+            logging.warning(f"Could not parse mountinfo line: {line!r}")
+    return result
+
+
+@functools.cache
+def entries() -> list[MountInfo]:
+    """Returns the mounts of this process, in the order they were mounted."""
+    with open(_MOUNTINFO) as f:
+        return parse(f.read())
+
+
+def clear_cache() -> None:
+    """Forgets the mounts read, e.g. if mounts may have changed since."""
+    entries.cache_clear()
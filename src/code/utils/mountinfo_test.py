@@ -0,0 +1,41 @@
+import unittest
+
+from . import mountinfo
+
+_MOUNTINFO = r"""
+22 1 0:21 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+35 22 0:31 /@home /home rw,noatime shared:2 master:1 - btrfs /dev/mapper/luks rw,subvolid=257,subvol=/@home
+36 22 0:31 /@snaps /.snapshots rw,noatime - btrfs /dev/mapper/luks rw,subvolid=258,subvol=/@snaps
+37 35 0:40 / /home/my\040files rw - tmpfs tmpfs rw
+38 22 0:41 / /.snapshots rw - tmpfs none rw
+""".lstrip()
+
+
+class MountInfoTest(unittest.TestCase):
+    def test_parse(self):
+        entries = mountinfo.parse(_MOUNTINFO)
+        self.assertEqual(len(entries), 5)
+        self.assertEqual(
+            entries[1],
+            mountinfo.MountInfo(
+                mount_id=35,
+                parent_id=22,
+                major=0,
+                minor=31,
+                root="/@home",
+                mount_point="/home",
+                mount_options="rw,noatime",
+                fstype="btrfs",
+                source="/dev/mapper/luks",
+                super_options="rw,subvolid=257,subvol=/@home",
+            ),
+        )
+        self.assertEqual(entries[3].mount_point, "/home/my files")
+
+    def test_parse_invalid(self):
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(mountinfo.parse("1 2 garbage\n"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
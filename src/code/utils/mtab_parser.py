@@ -1,10 +1,15 @@
+"""Finds the btrfs subvolume mounted at a path.
+
+The mounts are read from /proc/self/mountinfo, and indexed by path components, so that
+the mount containing a path is found in O(depth).
+"""
+
 import dataclasses
 import functools
-import json
 import logging
 import os
 
-from ..utils import os_utils
+from . import mountinfo
 
 
 @dataclasses.dataclass
@@ -29,81 +34,86 @@ def _get_mtab_param(*, key: str, all_params: str) -> str:
     return param_value
 
 
-@dataclasses.dataclass
-class _MountEntry:
-    device: str
-    mtab_mount_pt: str
-    fs: str
-    params: str
+class _TrieNode:
+    """A node of the mount table, for one path component."""
 
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        # The mount at this path, if any.
+        self.mount: mountinfo.MountInfo | None = None
 
-@functools.cache
-def _findmnt() -> dict[str, list[dict[str, str]]]:
-    output = os_utils.runsh_or_error("findmnt --mtab -J")
-    return json.loads(output)
 
+def _components(path: str) -> list[str]:
+    return [x for x in os.path.normpath(path).split("/") if x]
 
-@functools.cache
-def _mount_entries() -> list[_MountEntry]:
-    mounts_json = _findmnt()
-
-    def remove_square_brackets(s: str) -> str:
-        # Some sources look like "/dev/mapper/luksdev[/@]".
-        if s.endswith("]"):
-            # Find the first "[" from end and take string before that.
-            return s[: s.rfind("[")]
-        return s
-
-    result: list[_MountEntry] = []
-    for json_entry in mounts_json["filesystems"]:
-        result.append(
-            _MountEntry(
-                device=remove_square_brackets(json_entry["source"]),
-                mtab_mount_pt=json_entry["target"],
-                fs=json_entry["fstype"],
-                params=json_entry["options"],
-            )
-        )
-        logging.info(result[-1])
 
+@functools.cache
+def _mount_table() -> _TrieNode:
+    """Returns the mounts, indexed by mount point components."""
+    root = _TrieNode()
+    for entry in mountinfo.entries():
+        if entry.fstype == "autofs":
+            # For autofs, another entry should exist which as "btrfs".
+            # See also #54.
+            continue
+        logging.info(entry)
+        node = root
+        for component in _components(entry.mount_point):
+            node = node.children.setdefault(component, _TrieNode())
+        # A later mount on the same point hides the earlier.
+        node.mount = entry
+    return root
+
+
+def find_mount(path: str) -> mountinfo.MountInfo | None:
+    """Returns the mount with the longest mount point containing path.
+
+    Symlinks in path are not resolved.
+    """
+    node = _mount_table()
+    result = node.mount
+    for component in _components(path):
+        child = node.children.get(component)
+        if child is None:
+            break
+        node = child
+        if node.mount is not None:
+            result = node.mount
     return result
 
 
+def clear_cache() -> None:
+    """Forgets the mounts read, e.g. if mounts may have changed since."""
+    mountinfo.clear_cache()
+    _mount_table.cache_clear()
+    mount_attributes.cache_clear()
+
+
 @functools.cache
 def mount_attributes(mount_point: str) -> _MountAttributes:
-    logging.info(f"Searching {mount_point=} in /etc/mtab.")
-    # For a mount point, this denotes the longest path that was seen in /etc/mtab.
-    # This is therefore the point where that directory is mounted.
-    longest_match_to_mount_point = ""
+    logging.info(f"Searching {mount_point=} in /proc/self/mountinfo.")
     # Find the longest match for the mount point.
     # I.e. consider line for "/parent/nested" over line for "/parent" alone.
-    matched_line: _MountEntry | None = None
-    for this_tokens in _mount_entries():
-        if this_tokens.fs == "autofs":
-            # For autofs, another entry should exist which as "btrfs".
-            # See also #54.
-            continue
-        if mount_point.startswith(this_tokens.mtab_mount_pt):
-            if len(this_tokens.mtab_mount_pt) > len(longest_match_to_mount_point):
-                longest_match_to_mount_point = this_tokens.mtab_mount_pt
-                matched_line = this_tokens
+    matched_line = find_mount(mount_point)
 
     if matched_line is None:
         raise ValueError(f"Mount point not found: {mount_point}")
     logging.info(f"Found matching mount line: {matched_line!r}")
 
-    if matched_line.fs != "btrfs":
+    if matched_line.fstype != "btrfs":
         raise ValueError(
-            f"Mount point is not btrfs: {mount_point} ({matched_line.fs})."
+            f"Mount point is not btrfs: {mount_point} ({matched_line.fstype})."
             "\nNOTE: If you are using recovery environment such as grub-btrfs, mount points are not auto detected."
             " You can use --subvol-map arg to pass the mount point to subvolume name mapping."
         )
 
-    subvol_name = _get_mtab_param(key="subvol", all_params=matched_line.params)
-    subvol_id = int(_get_mtab_param(key="subvolid", all_params=matched_line.params))
+    subvol_name = _get_mtab_param(key="subvol", all_params=matched_line.super_options)
+    subvol_id = int(
+        _get_mtab_param(key="subvolid", all_params=matched_line.super_options)
+    )
     logging.info(f"{subvol_name=}, {subvol_id=}")
 
-    if matched_line.mtab_mount_pt != mount_point:
+    if matched_line.mount_point != mount_point:
         # The mount point was mounted automatically as a nested volume.
         #
         # Example 1: For mtab line -
@@ -120,8 +130,8 @@ def mount_attributes(mount_point: str) -> _MountAttributes:
         # tokens.mtab_mount_pt="/"
         # REVISED subvol_name="/@/testnested"
         #
-        nested_part = mount_point.removeprefix(matched_line.mtab_mount_pt)
+        nested_part = mount_point.removeprefix(matched_line.mount_point)
         subvol_name = os.path.join(subvol_name, nested_part)
     return _MountAttributes(
-        device=matched_line.device, subvol_name=subvol_name, subvol_id=subvol_id
+        device=matched_line.source, subvol_name=subvol_name, subvol_id=subvol_id
     )
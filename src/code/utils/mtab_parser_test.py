@@ -1,88 +1,134 @@
 import unittest
 from unittest import mock
 
+from . import mountinfo
 from . import mtab_parser
 
 # For testing, we can access private methods.
 # pyright: reportPrivateUsage=false
 
-# '/dev/vda2 on / type btrfs (rw,relatime,discard=async,space_cache=v2,subvolid=258,subvol=/@)'
-# subvol_name="/@"
-# mount_point="/testnested"
-# tokens.mtab_mount_pt="/"
-# REVISED subvol_name="/@/testnested"
+# Test corpus: /proc/self/mountinfo contents, and the expected attributes of queried
+# mount points. An expected value of None denotes a ValueError.
+_FIXTURES: list[tuple[str, dict[str, mtab_parser._MountAttributes | None]]] = [
+    (
+        # Encrypted btrfs root, with autofs for /home.
+        r"""
+22 1 0:31 /@ / rw,relatime shared:1 - btrfs /dev/vda2 rw,discard=async,space_cache=v2,subvolid=258,subvol=/@
+61 22 0:32 / /home rw,relatime shared:30 - autofs systemd-1 rw,fd=77,pgrp=1,timeout=0,minproto=5,maxproto=5,direct,pipe_ino=2684
+62 61 0:33 /@home /home rw,noatime shared:31 - btrfs /dev/mapper/luksdev rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=2505,subvol=/@home
+63 62 0:34 /@special_home /home/myhome rw,noatime shared:32 - btrfs /dev/mapper/myhome rw,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=2506,subvol=/@special_home
+64 62 0:33 /home-rafael/VirtualBox\040VMs /home/rafael/VirtualBox\040VMs rw,noatime shared:33 - btrfs /dev/mapper/root rw,lazytime,compress=zstd:1,ssd,discard=async,space_cache=v2,subvolid=613,subvol=/home-rafael/VirtualBox\040VMs
+65 22 0:35 / /mnt/rootbtrfs rw,noatime shared:34 - btrfs /dev/mapper/opened_rootbtrfs rw,ssd,discard=async,space_cache=v2,subvolid=5,subvol=/
+66 22 0:36 / /mnt/data rw,relatime shared:35 - ext4 /dev/sdb1 rw
+""",
+        {
+            "/home": mtab_parser._MountAttributes(
+                "/dev/mapper/luksdev", "/@home", 2505
+            ),
+            "/home/myhome": mtab_parser._MountAttributes(
+                "/dev/mapper/myhome", "/@special_home", 2506
+            ),
+            # See https://github.com/hirak99/yabsnap/issues/77.
+            "/home/rafael/VirtualBox VMs": mtab_parser._MountAttributes(
+                "/dev/mapper/root", "/home-rafael/VirtualBox VMs", 613
+            ),
+            # Not under "/mnt/rootbtrfs", since the path components differ.
+            "/mnt/rootbtrfsx": mtab_parser._MountAttributes(
+                "/dev/vda2", "/@/mnt/rootbtrfsx", 258
+            ),
+            # Nested subvolume @nestedvol.
+            "/mnt/rootbtrfs/@nestedvol": mtab_parser._MountAttributes(
+                "/dev/mapper/opened_rootbtrfs", "/@nestedvol", 5
+            ),
+            # Assume "/@/testnested" is mounted at "/testnested".
+            "/testnested": mtab_parser._MountAttributes(
+                "/dev/vda2", "/@/testnested", 258
+            ),
+            "/mnt/data": None,
+        },
+    ),
+    (
+        # A later mount hides an earlier one on the same mount point.
+        """
+22 1 0:21 / / rw - ext4 /dev/sda1 rw
+30 22 0:31 /@old /.snapshots rw - btrfs /dev/sda2 rw,subvolid=300,subvol=/@old
+31 22 0:31 /@snapshots /.snapshots rw - btrfs /dev/sda2 rw,subvolid=301,subvol=/@snapshots
+""",
+        {
+            "/.snapshots": mtab_parser._MountAttributes(
+                "/dev/sda2", "/@snapshots", 301
+            ),
+            "/": None,
+        },
+    ),
+    (
+        # No root mount, e.g. a chroot.
+        """
+30 29 0:31 /@ /mnt rw - btrfs /dev/sda2 rw,subvolid=256,subvol=/@
+""",
+        {
+            "/mnt": mtab_parser._MountAttributes("/dev/sda2", "/@", 256),
+            "/home": None,
+        },
+    ),
+]
+
+
+_FIND_MOUNT_FIXTURE = r"""
+22 1 0:21 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+35 22 0:31 /@home /home rw,noatime shared:2 master:1 - btrfs /dev/mapper/luks rw,subvolid=257,subvol=/@home
+36 22 0:31 /@snaps /.snapshots rw,noatime - btrfs /dev/mapper/luks rw,subvolid=258,subvol=/@snaps
+37 35 0:40 / /home/my\040files rw - tmpfs tmpfs rw
+38 22 0:41 / /.snapshots rw - tmpfs none rw
+""".lstrip()
 
 
 class TestCommonFsUtils(unittest.TestCase):
     def setUp(self):
-        mtab_parser._mount_entries.cache_clear()
+        mtab_parser._mount_table.cache_clear()
+        mtab_parser.mount_attributes.cache_clear()
+        self.addCleanup(mtab_parser._mount_table.cache_clear)
+        self.addCleanup(mtab_parser.mount_attributes.cache_clear)
+
+    def test_find_mount(self):
+        entries = mountinfo.parse(_FIND_MOUNT_FIXTURE)
+        with mock.patch.object(mountinfo, "entries", return_value=entries):
+            mount = mtab_parser.find_mount("/home/user/file")
+            assert mount is not None
+            self.assertEqual(mount.mount_point, "/home")
+            # Path prefix is not a path component.
+            mount = mtab_parser.find_mount("/homework")
+            assert mount is not None
+            self.assertEqual(mount.mount_point, "/")
+            mount = mtab_parser.find_mount("/home/my files/x")
+            assert mount is not None
+            self.assertEqual(mount.fstype, "tmpfs")
+            # The later mount on the same mount point is visible.
+            mount = mtab_parser.find_mount("/.snapshots")
+            assert mount is not None
+            self.assertEqual(mount.mount_id, 38)
+
+    def test_find_mount_real_mountinfo(self):
+        mount = mtab_parser.find_mount("/")
+        assert mount is not None
+        self.assertEqual(mount.mount_point, "/")
 
     def test_get_mount_attributes(self):
-        # Fake `findmnt --mtab -J`.
-        findmnt_json = {
-            "filesystems": [
-                # See https://github.com/hirak99/yabsnap/issues/77.
-                {
-                    "target": "/home/rafael/VirtualBox VMs",
-                    "source": "/dev/mapper/root",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,lazytime,compress=zstd:1,ssd,discard=async,space_cache=v2,subvolid=613,subvol=/home-rafael/VirtualBox VMs",
-                },
-                {
-                    "target": "/home",
-                    "source": "systemd-1",
-                    "fstype": "autofs",
-                    "options": "rw,relatime,fd=77,pgrp=1,timeout=0,minproto=5,maxproto=5,direct,pipe_ino=2684",
-                },
-                {
-                    "target": "/home",
-                    "source": "/dev/mapper/luksdev[/@home]",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=2505,subvol=/@home",
-                },
-                # A specific volume mapped under /home.
-                {
-                    "target": "/home/myhome",
-                    "source": "/dev/mapper/myhome",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,compress=zstd:3,ssd,discard=async,space_cache=v2,subvolid=2506,subvol=/@special_home",
-                },
-                # Nested subvolume @nestedvol.
-                {
-                    "target": "/mnt/rootbtrfs",
-                    "source": "/dev/mapper/opened_rootbtrfs",
-                    "fstype": "btrfs",
-                    "options": "rw,noatime,ssd,discard=async,space_cache=v2,subvolid=5,subvol=/",
-                },
-                # Assume "/@/testnested" is mounted at "/testnested".
-                {
-                    "target": "/",
-                    "source": "/dev/vda2[/@]",
-                    "fstype": "btrfs",
-                    "options": "rw,relatime,discard=async,space_cache=v2,subvolid=258,subvol=/@",
-                },
-            ]
-        }
+        for content, expectations in _FIXTURES:
+            mtab_parser._mount_table.cache_clear()
+            mtab_parser.mount_attributes.cache_clear()
+            entries = mountinfo.parse(content)
+            with mock.patch.object(mountinfo, "entries", return_value=entries):
+                for mount_point, expected in expectations.items():
+                    with self.subTest(mount_point=mount_point):
+                        if expected is None:
+                            with self.assertRaises(ValueError):
+                                mtab_parser.mount_attributes(mount_point)
+                        else:
+                            self.assertEqual(
+                                mtab_parser.mount_attributes(mount_point), expected
+                            )
+
 
-        with mock.patch.object(mtab_parser, "_findmnt", return_value=findmnt_json):
-            # Assertiions.
-            self.assertEqual(
-                mtab_parser.mount_attributes("/home"),
-                mtab_parser._MountAttributes("/dev/mapper/luksdev", "/@home", 2505),
-            )
-            self.assertEqual(
-                mtab_parser.mount_attributes("/home/myhome"),
-                mtab_parser._MountAttributes(
-                    "/dev/mapper/myhome", "/@special_home", 2506
-                ),
-            )
-            self.assertEqual(
-                mtab_parser.mount_attributes("/mnt/rootbtrfs/@nestedvol"),
-                mtab_parser._MountAttributes(
-                    "/dev/mapper/opened_rootbtrfs", "/@nestedvol", 5
-                ),
-            )
-            self.assertEqual(
-                mtab_parser.mount_attributes("/testnested"),
-                mtab_parser._MountAttributes("/dev/vda2", "/@/testnested", 258),
-            )
+if __name__ == "__main__":
+    unittest.main()
@@ -12,19 +12,259 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import dataclasses
 import logging
 import os
 import re
+import shutil
+import signal
 import subprocess
 import sys
+import time
+from collections.abc import Generator, Iterator
 
-from typing import Any, NoReturn
+from .. import global_flags
+from . import mtab_parser
+
+from typing import Any, BinaryIO, NoReturn
+
+# Directory for runtime caches. It is on tmpfs, and cleared on reboot.
+RUNTIME_DIR = "/run/yabsnap"
+
+# Symlinks to block devices, named by their filesystem UUID.
+_BY_UUID_DIR = "/dev/disk/by-uuid"
+_SYS_BTRFS_DIR = "/sys/fs/btrfs"
+
+# Caches for get_filesystem_uuid().
+_device_uuids: dict[str, str] | None = None
+_uuid_by_st_dev: dict[int, str | None] = {}
+
+_PACMAN_CONF = "/etc/pacman.conf"
+_DEFAULT_PACMAN_LOG = "/var/log/pacman.log"
+# The pacman log is read backwards in chunks of this size.
+_LOG_CHUNK_SIZE = 64 * 1024
+
+# A positive result of timer_enabled() is cached for this long.
+_TIMER_CACHE_FILE = "timer-active"
+_TIMER_CACHE_SECS = 24 * 60 * 60
+
+
+# Values of ProcessLimits.ionice_class, and their number for `ionice -c`.
+IONICE_CLASSES = {"": 0, "realtime": 1, "best-effort": 2, "idle": 3}
+
+# Keys in ProcessLimits.io_max, and the corresponding systemd properties.
+_IO_MAX_PROPERTIES = {
+    "rbps": "IOReadBandwidthMax",
+    "wbps": "IOWriteBandwidthMax",
+    "riops": "IOReadIOPSMax",
+    "wiops": "IOWriteIOPSMax",
+}
+
+
+# After a command times out, it is sent SIGTERM; then SIGKILL after this many seconds.
+_KILL_GRACE_SECS = 5.0
+# Stderr kept in CommandResult.
+_MAX_STDERR_CHARS = 4096
+
+# If set, time.monotonic() after which no command may run; see run_deadline().
+_run_deadline: float | None = None
 
 
 class CommandError(Exception):
     """Raised when a command is unsuccesful."""
 
 
+class CommandTimeout(CommandError):
+    """Raised when a command is killed since it did not finish in time."""
+
+
+@dataclasses.dataclass(frozen=True)
+class CommandResult:
+    args: list[str]
+    # Exit code; negative if killed by a signal, as in subprocess.
+    returncode: int
+    # Seconds taken.
+    duration: float
+    # Empty if the output was not captured.
+    stdout: str
+    # Truncated to the last _MAX_STDERR_CHARS.
+    stderr: str
+    timed_out: bool = False
+
+
+@contextlib.contextmanager
+def run_deadline(secs: float | None) -> Generator[None]:
+    """Limits all commands run within, to finish in secs from now.
+
+    A command still running at the deadline is killed, and raises CommandTimeout.
+    Commands started after the deadline raise CommandTimeout without running.
+    """
+    global _run_deadline
+    previous = _run_deadline
+    if secs:
+        _run_deadline = time.monotonic() + secs
+    try:
+        yield
+    finally:
+        _run_deadline = previous
+
+
+def _kill_group(process: subprocess.Popen[bytes]) -> None:
+    """Kills the process and its descendants, e.g. those started by nice or a scope."""
+    for sig, grace in [(signal.SIGTERM, _KILL_GRACE_SECS), (signal.SIGKILL, None)]:
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def _timeout_for(kind: str, timeout: float | None) -> float | None:
+    """Returns the seconds a command may run; the least of all applicable limits."""
+    limits = [timeout, global_flags.FLAGS.command_timeouts.get(kind) or None]
+    if _run_deadline is not None:
+        limits.append(_run_deadline - time.monotonic())
+    return min((x for x in limits if x is not None), default=None)
+
+
+def run_command(
+    args: list[str],
+    *,
+    kind: str,
+    timeout: float | None = None,
+    capture_output: bool = True,
+) -> CommandResult:
+    """Runs a command, killing it if it takes too long.
+
+    The command runs in its own process group, so that everything it starts is killed
+    with it.
+
+    Args:
+      args: Command and arguments.
+      kind: One of "probe", "create", "delete" or "hook", which selects the timeout
+        from global_flags.FLAGS.command_timeouts; or "sync", which has no timeout
+        there, and is limited by the caller with timeout, see FLAGS.sync_timeout.
+      timeout: If set, an additional limit in seconds.
+      capture_output: If False, the output goes to the output of this process.
+
+    Raises:
+      CommandTimeout: If the command did not finish in time.
+      CommandError: If the command failed. The result is not returned in this case.
+    """
+    effective_timeout = _timeout_for(kind, timeout)
+    if effective_timeout is not None and effective_timeout <= 0:
+        raise CommandTimeout(f"Deadline exceeded, not running {args}")
+    logging.info(f"Running {' '.join(args)}")
+    pipe = subprocess.PIPE if capture_output else None
+    start = time.monotonic()
+    with subprocess.Popen(
+        args, stdout=pipe, stderr=pipe, start_new_session=True
+    ) as process:
+        timed_out = False
+        try:
+            stdout, stderr = process.communicate(timeout=effective_timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _kill_group(process)
+            stdout, stderr = process.communicate()
+        except BaseException:
+            # E.g. KeyboardInterrupt; do not leave the command running.
+            _kill_group(process)
+            raise
+    result = CommandResult(
+        args=args,
+        returncode=process.returncode,
+        duration=time.monotonic() - start,
+        stdout=stdout.decode() if stdout else "",
+        stderr=stderr.decode(errors="replace")[-_MAX_STDERR_CHARS:] if stderr else "",
+        timed_out=timed_out,
+    )
+    logging.info(
+        f"Finished {args[0]} in {result.duration:0.2f}s with code {result.returncode}"
+    )
+    if timed_out:
+        raise CommandTimeout(
+            f"Killed '{' '.join(args)}' after {result.duration:0.0f}s"
+            f"\nstderr: {result.stderr}"
+        )
+    if result.returncode != 0:
+        raise CommandError(
+            f"Error running shell command: '{' '.join(args)}'"
+            f" (code {result.returncode})"
+            f"\nstdout: {result.stdout}"
+            f"\nstderr: {result.stderr}"
+        )
+    return result
+
+
+@dataclasses.dataclass(frozen=True)
+class ProcessLimits:
+    """Priority and resource limits for commands, so they yield to other work.
+
+    The cgroup v2 limits are applied by running the command in a transient systemd
+    scope; see systemd.resource-control(5). Zero or empty values are not applied.
+    """
+
+    # Added to the niceness, as with `nice -n`.
+    nice: int = 0
+    # One of IONICE_CLASSES.
+    ionice_class: str = ""
+    # IOWeight, between 1 and 10000. The default weight is 100.
+    io_weight: int = 0
+    # Device and limits as in cgroup io.max, e.g. "/dev/sda rbps=50M wbps=20M".
+    io_max: str = ""
+    # MemoryHigh, e.g. "1G".
+    memory_high: str = ""
+
+    def __post_init__(self) -> None:
+        if self.ionice_class not in IONICE_CLASSES:
+            raise ValueError(f"Invalid ionice_class {self.ionice_class!r}")
+        # Raises ValueError if io_max is invalid.
+        self._scope_properties()
+
+    def _scope_properties(self) -> list[str]:
+        properties: list[str] = []
+        if self.io_weight:
+            properties.append(f"IOWeight={self.io_weight}")
+        if self.io_max:
+            device, *limits = self.io_max.split()
+            for limit in limits:
+                key, _, value = limit.partition("=")
+                if key not in _IO_MAX_PROPERTIES or not value:
+                    raise ValueError(f"Invalid io_max {self.io_max!r}")
+                properties.append(f"{_IO_MAX_PROPERTIES[key]}={device} {value}")
+        if self.memory_high:
+            properties.append(f"MemoryHigh={self.memory_high}")
+        return properties
+
+    def wrap(self, args: list[str]) -> list[str]:
+        """Returns the command line to run args with these limits."""
+        if self.ionice_class:
+            args = ["ionice", "-c", str(IONICE_CLASSES[self.ionice_class]), *args]
+        if self.nice:
+            args = ["nice", "-n", str(self.nice), *args]
+        properties = self._scope_properties()
+        if properties:
+            if shutil.which("systemd-run") is None:
+                logging.warning("systemd-run not found, not applying cgroup limits")
+            else:
+                args = [
+                    "systemd-run",
+                    "--scope",
+                    "--quiet",
+                    "--collect",
+                    *(f"--property={x}" for x in properties),
+                    "--",
+                    *args,
+                ]
+        return args
+
+
 def fatal_error(msg: str) -> NoReturn:
     """Shows a fatal error and exits.
 
@@ -37,28 +277,31 @@ def fatal_error(msg: str) -> NoReturn:
     sys.exit(-1)
 
 
-def runsh_or_error(command: str) -> str:
+def runsh_or_error(
+    command: str,
+    timeout: float | None = None,
+    limits: ProcessLimits | None = None,
+    kind: str = "probe",
+) -> str:
     """Runs a shell command.
 
     Args:
       command: Command to run, e.g. "pacman-conf LogFile".
+      timeout: If set, seconds after which the command is killed.
+      limits: If set, priority and resource limits to run the command with.
+      kind: Kind of command, to select the timeout; see run_command().
 
     Returns:
       Output of command.
+
+    Raises:
+      CommandTimeout: If the command was killed since it took too long.
+      CommandError: If the command failed.
     """
-    logging.info(f"Running {command}")
-    try:
-        return subprocess.check_output(
-            command.split(" "), stderr=subprocess.PIPE
-        ).decode()
-    except subprocess.CalledProcessError as exc:
-        # If we are here, the command could not be run.
-        error_msg = (
-            f"Error running shell command: '{command}'"
-            f"\nstdout: {exc.stdout.decode()}"
-            f"\nstderr: {exc.stderr.decode()}"
-        )
-        raise CommandError(error_msg) from exc
+    args = command.split(" ")
+    if limits is not None:
+        args = limits.wrap(args)
+    return run_command(args, kind=kind, timeout=timeout).stdout
 
 
 def runsh(command: str) -> str | None:
@@ -69,33 +312,65 @@ def runsh(command: str) -> str | None:
         return None
 
 
-def get_filesystem_uuid(path: str) -> str | None:
-    while True:
-        df_lines = runsh_or_error(f"df {path} --output=source").splitlines()
-        # Note: We cannot assume the first line to be Filesystem.
-        # The output of df _depends on the locale_.
-        # See https://github.com/hirak99/yabsnap/issues/70
-        device = df_lines[1]
-        # Nested subvolumes don't seem to return a proper device.
-        if device != "-":
-            break
-        parent = os.path.dirname(path)
-        if len(parent) >= len(path):
-            logging.error(f"{parent=} is longer than {path=}.")
-            return None
-        path = parent
-
+def _uuids_by_device() -> dict[str, str]:
+    """Maps real paths of block devices to their filesystem UUIDs."""
+    global _device_uuids
+    if _device_uuids is None:
+        _device_uuids = {}
+        try:
+            names = os.listdir(_BY_UUID_DIR)
+        except OSError as exc:
+            logging.info(f"Cannot list {_BY_UUID_DIR}: {exc}")
+            names = []
+        for name in names:
+            _device_uuids[os.path.realpath(os.path.join(_BY_UUID_DIR, name))] = name
+    return _device_uuids
+
+
+def _btrfs_uuid(device: str) -> str | None:
+    # Each mounted btrfs has /sys/fs/btrfs/<uuid>/devices/<device name>.
+    device_name = os.path.basename(device)
     try:
-        lsblk_lines = runsh_or_error(f"lsblk -o UUID -n {device}").splitlines()
-    except CommandError as exc:
-        # Dev Note: If we see this error for no apparent reason, we can consider
-        # allowing None to be returned.
-        logging.error(f"Error querying {device=} from {df_lines=} for {path=}, {exc=}")
+        names = os.listdir(_SYS_BTRFS_DIR)
+    except OSError:
         return None
-    if len(lsblk_lines) != 1:
-        logging.error(f"Expected 1 line but found: {lsblk_lines}")
+    for name in names:
+        if os.path.exists(os.path.join(_SYS_BTRFS_DIR, name, "devices", device_name)):
+            return name
+    return None
+
+
+def _resolve_filesystem_uuid(path: str) -> str | None:
+    mount = mtab_parser.find_mount(os.path.realpath(path))
+    if mount is None:
+        logging.error(f"Could not find the mount of {path=}")
         return None
-    return lsblk_lines[0]
+    device = os.path.realpath(mount.source)
+    uuid = _uuids_by_device().get(device)
+    if uuid is None and mount.fstype == "btrfs":
+        # Fallback, e.g. if udev is not running.
+        uuid = _btrfs_uuid(device)
+    if uuid is None:
+        logging.error(f"Could not find UUID of {device=} from {mount=} for {path=}")
+    return uuid
+
+
+def clear_filesystem_uuid_cache() -> None:
+    """Forgets the filesystem UUIDs found, e.g. if devices may have changed since."""
+    global _device_uuids
+    _device_uuids = None
+    _uuid_by_st_dev.clear()
+
+
+def get_filesystem_uuid(path: str) -> str | None:
+    try:
+        st_dev = os.stat(path).st_dev
+    except OSError as exc:
+        logging.error(f"Cannot find filesystem of {path=}: {exc}")
+        return None
+    if st_dev not in _uuid_by_st_dev:
+        _uuid_by_st_dev[st_dev] = _resolve_filesystem_uuid(path)
+    return _uuid_by_st_dev[st_dev]
 
 
 def command_exists(command: str) -> bool:
@@ -108,42 +383,87 @@ def command_exists(command: str) -> bool:
 
 def run_user_script(script_name: str, args: list[str]) -> bool:
     try:
-        subprocess.check_call([script_name, *args])
+        run_command([script_name, *args], kind="hook", capture_output=False)
     except FileNotFoundError:
         logging.warning(f"User script {script_name=} does not exist.")
         return False
-    except subprocess.CalledProcessError:
+    except CommandTimeout as exc:
+        logging.warning(f"User script {script_name=} with {args=} timed out: {exc}")
+        return False
+    except CommandError:
         logging.warning(f"User script {script_name=} with {args=} resulted in error.")
         return False
     return True
 
 
 def _get_pacman_log_path() -> str:
-    logfile = runsh("pacman-conf LogFile")
-    if logfile is None:
-        logging.warning("Unable to determine pacman log path. Using default.")
-        return "/var/log/pacman.log"
-    return logfile.strip()
+    """Returns LogFile from the [options] of pacman.conf(5), or its default."""
+    section = ""
+    try:
+        with open(_PACMAN_CONF) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line.startswith("[") and line.endswith("]"):
+                    section = line[1:-1]
+                    continue
+                key, sep, value = line.partition("=")
+                if section == "options" and sep and key.strip() == "LogFile":
+                    return value.strip()
+    except OSError as exc:
+        logging.warning(f"Unable to read {_PACMAN_CONF}: {exc}")
+    return _DEFAULT_PACMAN_LOG
+
+
+def _reverse_lines(f: BinaryIO) -> Iterator[bytes]:
+    """Yields the lines of a file from the last, reading chunks from the end."""
+    position = f.seek(0, os.SEEK_END)
+    # Incomplete first line of the chunks read so far.
+    partial = b""
+    while position > 0:
+        size = min(_LOG_CHUNK_SIZE, position)
+        position -= size
+        f.seek(position)
+        lines = (f.read(size) + partial).split(b"\n")
+        partial = lines.pop(0)
+        yield from reversed(lines)
+    yield partial
 
 
 def last_pacman_command() -> str:
     logfile = _get_pacman_log_path()
     matcher = re.compile(r"\[[\d\-:T+]*\] \[PACMAN\] Running \'(?P<cmd>.*)\'")
-    with open(logfile) as f:
-        for line in reversed(f.readlines()):
-            match = matcher.match(line)
+    with open(logfile, "rb") as f:
+        for line in _reverse_lines(f):
+            match = matcher.match(line.decode(errors="replace"))
             if match:
                 return match.group("cmd")
     raise ValueError("Last pacman command not found")
 
 
 def timer_enabled() -> bool:
+    # Only a positive result is cached. A negative result makes the caller print a
+    # note, which should disappear as soon as the user enables the timer.
+    cache_fname = os.path.join(RUNTIME_DIR, _TIMER_CACHE_FILE)
+    try:
+        if time.time() - os.stat(cache_fname).st_mtime < _TIMER_CACHE_SECS:
+            return True
+    except OSError:
+        pass
     result = subprocess.run(
         ["systemctl", "is-active", "yabsnap.timer"],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
-    return result.returncode == 0
+    if result.returncode != 0:
+        return False
+    try:
+        os.makedirs(RUNTIME_DIR, exist_ok=True)
+        # Creates the file, or updates its mtime.
+        with open(cache_fname, "w"):
+            pass
+    except OSError as exc:
+        logging.info(f"Could not cache timer status: {exc}")
+    return True
 
 
 def eprint(*args: Any, **kwargs: Any) -> None:
@@ -13,9 +13,15 @@
 # limitations under the License.
 
 import os
+import subprocess
 import tempfile
+import time
 import unittest
+from unittest import mock
 
+from .. import global_flags
+from . import mountinfo
+from . import mtab_parser
 from . import os_utils
 
 # For testing, we can access private methods.
@@ -31,6 +37,191 @@ class OsUtilsTest(unittest.TestCase):
             # Script does not exist.
             self.assertFalse(os_utils.run_user_script(os.path.join(dir, "test.sh"), []))
 
+    def test_run_command(self):
+        result = os_utils.run_command(
+            ["sh", "-c", "echo out; echo err >&2"], kind="probe"
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "out\n")
+        self.assertEqual(result.stderr, "err\n")
+        self.assertGreaterEqual(result.duration, 0)
+
+        with self.assertRaisesRegex(os_utils.CommandError, "code 3"):
+            os_utils.run_command(["sh", "-c", "exit 3"], kind="probe")
+
+    def test_run_command_timeout(self):
+        # The child of the shell is killed with it; else communicate() would wait for
+        # it to close the output.
+        with self.assertRaises(os_utils.CommandTimeout):
+            os_utils.run_command(
+                ["sh", "-c", "sleep 30 & wait"], kind="probe", timeout=0.2
+            )
+
+        # Timeout of the kind.
+        with (
+            mock.patch.dict(global_flags.FLAGS.command_timeouts, {"hook": 0.2}),
+            self.assertRaises(os_utils.CommandTimeout),
+        ):
+            os_utils.run_command(["sleep", "30"], kind="hook")
+
+        # Deadline of the run.
+        with os_utils.run_deadline(0.2), self.assertRaises(os_utils.CommandTimeout):
+            os_utils.run_command(["sleep", "30"], kind="create")
+        with (
+            os_utils.run_deadline(0.01),
+            mock.patch.object(subprocess, "Popen") as mock_popen,
+        ):
+            time.sleep(0.02)
+            with self.assertRaises(os_utils.CommandTimeout):
+                os_utils.run_command(["true"], kind="create")
+        mock_popen.assert_not_called()
+
+    def test_process_limits(self):
+        self.assertEqual(os_utils.ProcessLimits().wrap(["rm", "x"]), ["rm", "x"])
+        limits = os_utils.ProcessLimits(
+            nice=10,
+            ionice_class="idle",
+            io_weight=10,
+            io_max="/dev/sda rbps=50M wbps=20M",
+            memory_high="1G",
+        )
+        with mock.patch.object(
+            os_utils.shutil, "which", return_value="/usr/bin/systemd-run"
+        ):
+            self.assertEqual(
+                limits.wrap(["rm", "x"]),
+                [
+                    "systemd-run",
+                    "--scope",
+                    "--quiet",
+                    "--collect",
+                    "--property=IOWeight=10",
+                    "--property=IOReadBandwidthMax=/dev/sda 50M",
+                    "--property=IOWriteBandwidthMax=/dev/sda 20M",
+                    "--property=MemoryHigh=1G",
+                    "--",
+                    *["nice", "-n", "10", "ionice", "-c", "3", "rm", "x"],
+                ],
+            )
+        with (
+            mock.patch.object(os_utils.shutil, "which", return_value=None),
+            self.assertLogs(level="WARNING"),
+        ):
+            self.assertEqual(limits.wrap(["rm", "x"])[0], "nice")
+
+        with self.assertRaises(ValueError):
+            os_utils.ProcessLimits(ionice_class="lowest")
+        with self.assertRaises(ValueError):
+            os_utils.ProcessLimits(io_max="/dev/sda bps=1M")
+
+    def test_get_pacman_log_path(self):
+        with tempfile.TemporaryDirectory() as dir:
+            conf = os.path.join(dir, "pacman.conf")
+            with mock.patch.object(os_utils, "_PACMAN_CONF", conf):
+                # Not readable.
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(
+                        os_utils._get_pacman_log_path(), "/var/log/pacman.log"
+                    )
+
+                with open(conf, "w") as f:
+                    f.write(
+                        "[options]\n"
+                        "#LogFile = /commented.log\n"
+                        "LogFile   = /var/log/my pacman.log  # Comment\n"
+                        "[core]\n"
+                        "LogFile = /other.log\n"
+                    )
+                self.assertEqual(
+                    os_utils._get_pacman_log_path(), "/var/log/my pacman.log"
+                )
+
+    def test_last_pacman_command(self):
+        lines = [
+            "[2025-01-01T10:00:00+0100] [PACMAN] Running 'pacman -S vim'",
+            "[2025-01-01T10:00:01+0100] [ALPM] installed vim (9.1-1)",
+            "[2025-01-02T10:00:00+0100] [PACMAN] Running 'pacman -Syu'",
+            *(f"[2025-01-02T10:00:01+0100] [ALPM] upgraded pkg{k}" for k in range(50)),
+            "",
+        ]
+        with tempfile.TemporaryDirectory() as dir:
+            log = os.path.join(dir, "pacman.log")
+            with open(log, "w") as f:
+                f.write("\n".join(lines))
+            with (
+                mock.patch.object(os_utils, "_get_pacman_log_path", return_value=log),
+                # Lines span chunks.
+                mock.patch.object(os_utils, "_LOG_CHUNK_SIZE", 7),
+            ):
+                self.assertEqual(os_utils.last_pacman_command(), "pacman -Syu")
+                with open(log, "rb") as f:
+                    self.assertEqual(
+                        list(os_utils._reverse_lines(f)),
+                        [x.encode() for x in reversed(lines)],
+                    )
+
+    def test_timer_enabled_cached(self):
+        with (
+            tempfile.TemporaryDirectory() as dir,
+            mock.patch.object(os_utils, "RUNTIME_DIR", dir),
+            mock.patch.object(subprocess, "run") as mock_run,
+        ):
+            # A negative result is not cached.
+            mock_run.return_value.returncode = 3
+            self.assertFalse(os_utils.timer_enabled())
+            self.assertFalse(os_utils.timer_enabled())
+            self.assertEqual(mock_run.call_count, 2)
+
+            mock_run.return_value.returncode = 0
+            self.assertTrue(os_utils.timer_enabled())
+            self.assertTrue(os_utils.timer_enabled())
+            self.assertEqual(mock_run.call_count, 3)
+
+    def _clear_mount_table(self):
+        mtab_parser.clear_cache()
+        self.addCleanup(mtab_parser.clear_cache)
+
+    def test_get_filesystem_uuid(self):
+        self._clear_mount_table()
+        with tempfile.TemporaryDirectory() as dir:
+            # A fake device, and its /dev/disk/by-uuid.
+            device = os.path.join(dir, "sda2")
+            with open(device, "w"):
+                pass
+            by_uuid_dir = os.path.join(dir, "by-uuid")
+            os.mkdir(by_uuid_dir)
+            os.symlink("../sda2", os.path.join(by_uuid_dir, "1234-abcd"))
+            entries = mountinfo.parse(f"22 1 0:21 / / rw - ext4 {device} rw")
+            with (
+                mock.patch.object(mountinfo, "entries", return_value=entries),
+                mock.patch.object(os_utils, "_BY_UUID_DIR", by_uuid_dir),
+                mock.patch.object(os_utils, "_device_uuids", None),
+                mock.patch.object(os_utils, "_uuid_by_st_dev", {}),
+            ):
+                self.assertEqual(os_utils.get_filesystem_uuid(dir), "1234-abcd")
+                # Cached by device.
+                with mock.patch.object(mtab_parser, "find_mount") as mock_find_mount:
+                    self.assertEqual(os_utils.get_filesystem_uuid(dir), "1234-abcd")
+                mock_find_mount.assert_not_called()
+
+    def test_get_filesystem_uuid_btrfs_sysfs(self):
+        self._clear_mount_table()
+        with tempfile.TemporaryDirectory() as dir:
+            os.makedirs(os.path.join(dir, "btrfs", "5678-ef", "devices", "dm-0"))
+            entries = mountinfo.parse(
+                "22 1 0:21 /@ / rw - btrfs /dev/dm-0 rw,subvol=/@"
+            )
+            with (
+                mock.patch.object(mountinfo, "entries", return_value=entries),
+                mock.patch.object(os_utils, "_BY_UUID_DIR", "/nonexistent"),
+                mock.patch.object(
+                    os_utils, "_SYS_BTRFS_DIR", os.path.join(dir, "btrfs")
+                ),
+                mock.patch.object(os_utils, "_device_uuids", None),
+                mock.patch.object(os_utils, "_uuid_by_st_dev", {}),
+            ):
+                self.assertEqual(os_utils.get_filesystem_uuid(dir), "5678-ef")
+
 
 if __name__ == "__main__":
     unittest.main()
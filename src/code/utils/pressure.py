@@ -0,0 +1,52 @@
+"""Reads pressure stall information (PSI) from /proc/pressure.
+
+See https://docs.kernel.org/accounting/psi.html for the format. Example content of
+/proc/pressure/io -
+some avg10=0.00 avg60=0.12 avg300=0.05 total=2704035
+full avg10=0.00 avg60=0.08 avg300=0.03 total=2333800
+"""
+
+import dataclasses
+import logging
+import os
+
+_PRESSURE_DIR = "/proc/pressure"
+
+
+@dataclasses.dataclass(frozen=True)
+class Pressure:
+    # Percentage of time in the last minute that some tasks stalled on the resource,
+    # i.e. the "some" avg60.
+    io: float
+    cpu: float
+
+    def __str__(self) -> str:
+        return f"io={self.io:.1f}% cpu={self.cpu:.1f}%"
+
+
+def parse_some_avg60(content: str) -> float:
+    """Returns avg60 of the "some" line in a /proc/pressure file."""
+    for line in content.splitlines():
+        fields = line.split()
+        if not fields or fields[0] != "some":
+            continue
+        for field in fields[1:]:
+            key, _, value = field.partition("=")
+            if key == "avg60":
+                return float(value)
+    raise ValueError(f"No 'some avg60' found in {content!r}")
+
+
+def _read_resource(resource: str) -> float:
+    with open(os.path.join(_PRESSURE_DIR, resource)) as f:
+        return parse_some_avg60(f.read())
+
+
+def read() -> Pressure | None:
+    """Returns the current IO and CPU pressure; None if PSI is not available."""
+    try:
+        return Pressure(io=_read_resource("io"), cpu=_read_resource("cpu"))
+    except (OSError, ValueError) as exc:
+        # E.g. a kernel without CONFIG_PSI, or booted with psi=0.
+        logging.info(f"Pressure information not available: {exc}")
+        return None
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import pressure
+
+# For testing, we can access private methods.
+# pyright: reportPrivateUsage=false
+
+_IO = """some avg10=1.50 avg60=12.25 avg300=3.00 total=2704035
+full avg10=0.50 avg60=8.00 avg300=1.00 total=2333800
+"""
+
+_CPU = """some avg10=0.00 avg60=2.00 avg300=0.50 total=113355
+full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+"""
+
+
+class PressureTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(pressure.parse_some_avg60(_IO), 12.25)
+        with self.assertRaises(ValueError):
+            pressure.parse_some_avg60("full avg10=0.00 avg60=1.00")
+
+    def test_read(self):
+        with (
+            tempfile.TemporaryDirectory() as dir,
+            mock.patch.object(pressure, "_PRESSURE_DIR", dir),
+        ):
+            # Not available.
+            self.assertIsNone(pressure.read())
+
+            for resource, content in [("io", _IO), ("cpu", _CPU)]:
+                with open(os.path.join(dir, resource), "w") as f:
+                    f.write(content)
+            result = pressure.read()
+        self.assertEqual(result, pressure.Pressure(io=12.25, cpu=2.0))
+        self.assertEqual(str(result), "io=12.2% cpu=2.0%")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Timestamps in snapshot names.
+
+A snapshot is named by appending a timestamp to the dest_prefix of its config. The
+timestamp is either -
+- YYYYMMDDhhmmss, e.g. "20230315120000"; or
+- with subsecond_names, YYYYMMDDhhmmss_mmm, e.g. "20230315120000_123".
+
+Both formats sort lexicographically in chronological order, also when mixed, since a
+name in the first format is a prefix of names in the same second in the second format.
+"""
+
+import datetime
+
+from .. import global_flags
+
+
+def format_time(when: datetime.datetime, subsecond: bool) -> str:
+    """Returns the timestamp to name a snapshot taken at when."""
+    timestr = when.strftime(global_flags.TIME_FORMAT)
+    if not subsecond:
+        return timestr
+    millis = when.microsecond // 1000
+    return (
+        f"{timestr}{global_flags.SUBSECOND_SEPARATOR}"
+        f"{millis:0{global_flags.SUBSECOND_DIGITS}d}"
+    )
+
+
+def _is_subsecond_timestr(timestr: str) -> bool:
+    seconds, separator, millis = timestr.rpartition(global_flags.SUBSECOND_SEPARATOR)
+    return (
+        bool(separator)
+        and len(seconds) == global_flags.TIME_FORMAT_LEN
+        and seconds.isdigit()
+        and len(millis) == global_flags.SUBSECOND_DIGITS
+        and millis.isdigit()
+    )
+
+
+def timestr_of(name: str) -> str | None:
+    """Returns the timestamp at the end of a snapshot name; None if there is none."""
+    timestr = name[-global_flags.TIME_FORMAT_SUBSECOND_LEN :]
+    if len(timestr) == global_flags.TIME_FORMAT_SUBSECOND_LEN and _is_subsecond_timestr(
+        timestr
+    ):
+        return timestr
+    timestr = name[-global_flags.TIME_FORMAT_LEN :]
+    if len(timestr) == global_flags.TIME_FORMAT_LEN and timestr.isdigit():
+        return timestr
+    return None
+
+
+def seconds_part(timestr: str) -> str:
+    """Returns the YYYYMMDDhhmmss part of a timestamp in either format."""
+    return timestr[: global_flags.TIME_FORMAT_LEN]
+
+
+def parse(timestr: str) -> datetime.datetime:
+    """Parses a timestamp in either format.
+
+    Raises:
+      ValueError: If timestr is not a valid timestamp.
+    """
+    if len(timestr) == global_flags.TIME_FORMAT_SUBSECOND_LEN:
+        if not _is_subsecond_timestr(timestr):
+            raise ValueError(f"Invalid timestamp: {timestr!r}")
+        millis = int(timestr[-global_flags.SUBSECOND_DIGITS :])
+        return datetime.datetime.strptime(
+            seconds_part(timestr), global_flags.TIME_FORMAT
+        ) + datetime.timedelta(milliseconds=millis)
+    if len(timestr) != global_flags.TIME_FORMAT_LEN:
+        raise ValueError(f"Invalid timestamp: {timestr!r}")
+    return datetime.datetime.strptime(timestr, global_flags.TIME_FORMAT)
+
+
+def next_name(name: str) -> str:
+    """Returns the name one millisecond later, for a name with milliseconds."""
+    timestr = timestr_of(name)
+    if timestr is None or len(timestr) != global_flags.TIME_FORMAT_SUBSECOND_LEN:
+        raise ValueError(f"Not a name with milliseconds: {name!r}")
+    later = parse(timestr) + datetime.timedelta(milliseconds=1)
+    return name[: -len(timestr)] + format_time(later, subsecond=True)
@@ -0,0 +1,71 @@
+import datetime
+import unittest
+
+from . import snap_names
+
+
+class SnapNamesTest(unittest.TestCase):
+    def test_format_time(self):
+        when = datetime.datetime(2023, 3, 15, 12, 0, 0, microsecond=12_999)
+        self.assertEqual(
+            snap_names.format_time(when, subsecond=False), "20230315120000"
+        )
+        self.assertEqual(
+            snap_names.format_time(when, subsecond=True), "20230315120000_012"
+        )
+
+    def test_timestr_of(self):
+        self.assertEqual(
+            snap_names.timestr_of("/snaps/@root-20230315120000"), "20230315120000"
+        )
+        self.assertEqual(
+            snap_names.timestr_of("/snaps/@root-20230315120000_123"),
+            "20230315120000_123",
+        )
+        for invalid in [
+            "/snaps/@root-",
+            "/snaps/@root-2023031512000",
+            "/snaps/@root-20230315120000_12",
+            "/snaps/@root-20230315120000-meta.json",
+        ]:
+            self.assertIsNone(snap_names.timestr_of(invalid), invalid)
+
+    def test_sort_order(self):
+        names = [
+            "20230315120001",
+            "20230315120000_500",
+            "20230315120000",
+            "20230315120000_020",
+        ]
+        self.assertEqual(
+            sorted(names),
+            sorted(names, key=snap_names.parse),
+        )
+
+    def test_parse(self):
+        self.assertEqual(
+            snap_names.parse("20230315120000_123"),
+            datetime.datetime(2023, 3, 15, 12, 0, 0, microsecond=123_000),
+        )
+        self.assertEqual(
+            snap_names.parse("20230315120000"), datetime.datetime(2023, 3, 15, 12)
+        )
+        for invalid in ["2023031512000_123", "20230315120000-123", "2023-03-15"]:
+            with self.assertRaises(ValueError):
+                snap_names.parse(invalid)
+
+    def test_next_name(self):
+        self.assertEqual(
+            snap_names.next_name("/snaps/@root-20230315120000_123"),
+            "/snaps/@root-20230315120000_124",
+        )
+        self.assertEqual(
+            snap_names.next_name("/snaps/@root-20230315125959_999"),
+            "/snaps/@root-20230315130000_000",
+        )
+        with self.assertRaises(ValueError):
+            snap_names.next_name("/snaps/@root-20230315120000")
+
+
+if __name__ == "__main__":
+    unittest.main()
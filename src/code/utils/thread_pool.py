@@ -0,0 +1,33 @@
+"""Bounded thread pool for I/O bound work.
+
+Used where many small independent reads dominate, e.g. parsing snapshot metadata on a
+slow or network-backed disk. The concurrency is set by global_flags.FLAGS.io_threads;
+a value of 1 (or less) runs everything serially in the calling thread.
+"""
+
+import concurrent.futures
+from collections.abc import Callable, Iterable
+
+from .. import global_flags
+
+
+def map_ordered[T, R](
+    fn: Callable[[T], R], items: Iterable[T], *, threads: int | None = None
+) -> list[R]:
+    """Returns [fn(x) for x in items], computed concurrently.
+
+    The results are in the order of items. An exception raised by fn is re-raised.
+
+    Args:
+        fn: Function to apply. Must be thread safe.
+        items: Inputs.
+        threads: Maximum number of threads; defaults to global_flags.FLAGS.io_threads.
+    """
+    items = list(items)
+    if threads is None:
+        threads = global_flags.FLAGS.io_threads
+    threads = min(threads, len(items))
+    if threads <= 1:
+        return [fn(x) for x in items]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,46 @@
+import threading
+import time
+import unittest
+
+from .. import global_flags
+from . import thread_pool
+
+
+class ThreadPoolTest(unittest.TestCase):
+    def test_ordered(self):
+        def slow_square(x: int) -> int:
+            # Later items finish first.
+            time.sleep((5 - x) * 0.01)
+            return x * x
+
+        self.assertEqual(
+            thread_pool.map_ordered(slow_square, range(5), threads=5), [0, 1, 4, 9, 16]
+        )
+
+    def test_serial(self):
+        threads: set[int] = set()
+
+        def record_thread(x: int) -> int:
+            threads.add(threading.get_ident())
+            return x
+
+        self.assertEqual(
+            thread_pool.map_ordered(record_thread, range(10), threads=1),
+            list(range(10)),
+        )
+        self.assertEqual(threads, {threading.get_ident()})
+
+    def test_default_from_flags(self):
+        self.assertGreater(global_flags.FLAGS.io_threads, 1)
+        self.assertEqual(thread_pool.map_ordered(str, []), [])
+
+    def test_raises(self):
+        def fail(x: int) -> int:
+            raise ValueError(x)
+
+        with self.assertRaises(ValueError):
+            thread_pool.map_ordered(fail, range(3), threads=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,6 +17,9 @@ unavailable, and results in a RuntimeError.
 The lockfile is deleted after the second boundary or when the process exits (unless
 it ends abruptly, e.g. a SIGKILL - but leaving the file is harmless).
 
+Configs with subsecond_names do not need this lock: their names have milliseconds,
+and Snapshot.create_from() moves a name that is taken to the next free millisecond.
+
 Caveats:
   * Best-effort by design: a second that cannot be locked at all (e.g. due to
     file permissions) is rolled over rather than aborting creation, which